@@ -0,0 +1,111 @@
+#!/usr/bin/env python2.7
+"""
+This script is a micro-benchmark for `get_keywords()` in make-search-index.py.
+
+The bodies of all of the Markdown content are glued together into a large
+"post", which is then run through both the current keyword extractor and the
+original (reference) implementation.  The throughput of each is reported in
+MB/s, and the script exits with an error if the two ever disagree.
+"""
+
+# Imports ######################################################################
+import os
+import re
+import imp
+import sys
+import time
+import argparse
+
+
+# Metadata #####################################################################
+__author__ = "Timothy McFadden"
+__creationDate__ = "10/18/2026"
+__license__ = "MIT"
+
+
+# Globals ######################################################################
+THIS_DIR = os.path.abspath(os.path.dirname(__file__))
+msi = imp.load_source("make_search_index", os.path.join(THIS_DIR, "make-search-index.py"))
+
+
+def get_args():
+    """Parse the command-line arguments."""
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--contentdir', help="Path to search for your Markdown files", type=str, default=msi.CONTENT_DIR)
+    parser.add_argument('--size', help="Size of the generated post, in KB", type=int, default=1024)
+    parser.add_argument('--repeat', help="Number of times to time each implementation (the best time is used)", type=int, default=5)
+    return parser.parse_args()
+
+
+def reference_keywords(text, min_word_length=msi.MIN_WORD_LENGTH, ignored_words=msi.IGNORED_WORDS):
+    """The original implementation of `get_keywords()`, kept as the reference
+    for both speed and correctness.
+    """
+    text = re.sub("(</?.*?>)", "", text)
+    text = re.sub("\[(.+)\]\(.+?\)", r"\1", text)
+    text = re.sub("[\W_]", " ", text)
+
+    words = text.split()
+    return sorted(
+        set([
+            x.lower() for x in words if
+            re.match("^[A-Z][a-z]{3}", x)
+            or (x in msi.INCLUDE_WORDS)
+            or ((len(x) > min_word_length) and (x not in ignored_words))
+        ]),
+        cmp=lambda x, y: cmp(x.lower(), y.lower())
+    )
+
+
+def get_bodies(basedir):
+    """Returns the body (everything after the front matter) of each Markdown
+    file found under `basedir`.
+    """
+    bodies = []
+    for path in msi.find_markdown(basedir):
+        with open(path, "rb") as fh:
+            text = fh.read().strip()
+
+        match = re.search("^\+\+\+(?P<header>.*)^\+\+\+(?P<content>.*)", text, re.DOTALL | re.MULTILINE)
+        if match:
+            bodies.append(match.group("content"))
+
+    return bodies
+
+
+def make_post(bodies, size):
+    """Returns a single post of at least `size` bytes made from `bodies`."""
+    chunk = "\n".join(bodies)
+    return chunk * (1 + (size // max(1, len(chunk))))
+
+
+def best_time(function, text, repeat):
+    """Returns the fastest time (in seconds) of `repeat` calls to `function`."""
+    times = []
+    for _ in range(repeat):
+        tstart = time.time()
+        function(text)
+        times.append(time.time() - tstart)
+
+    return min(times)
+
+
+if __name__ == '__main__':
+    args = get_args()
+    bodies = get_bodies(args.contentdir)
+    if not bodies:
+        sys.exit("No Markdown content found in %s" % args.contentdir)
+
+    post = make_post(bodies, args.size * 1024)
+    megabytes = len(post) / (1024.0 * 1024.0)
+
+    for text in bodies + [post]:
+        if msi.get_keywords(text) != reference_keywords(text):
+            sys.exit("get_keywords() disagrees with the reference implementation!")
+
+    print "Checked [%i] posts; keywords match the reference implementation" % (len(bodies) + 1)
+    print "Post size is %.02fMB" % megabytes
+
+    for name, function in [("reference", reference_keywords), ("get_keywords", msi.get_keywords)]:
+        elapsed = best_time(function, post, args.repeat)
+        print "    %20s: %8.02f MB/s (%0.4fs)" % (name, megabytes / elapsed, elapsed)
@@ -0,0 +1,364 @@
+#!/usr/bin/env python2.7
+"""
+This script benchmarks the publish pipeline against synthetic Hugo trees.
+
+For each requested size, a tree of TOML front matter posts is generated (with
+a share of drafts, tags, links, and inline HTML), along with a static output
+tree of HTML pages that reference a set of CSS and JS files, the way Hugo
+leaves `public/`.  The following stages are then timed separately:
+
+    get_index       make-search-index.py: walk and parse every post
+    get_keywords    make-search-index.py: keyword extraction over every body
+    process_css     minify.py: minify and fingerprint the CSS files
+    process_js      minify.py: minify and fingerprint the JS files
+    process_html    minify.py: remap/inline the assets and minify the HTML
+
+The results are printed, and written as JSON to --output so runs can be
+compared over time.
+
+Example:
+    python bench-pipeline.py --posts 1000 10000 100000 --output bench.json
+"""
+
+# Imports ######################################################################
+import os
+import imp
+import sys
+import time
+import random
+import shutil
+import platform
+import argparse
+import tempfile
+
+
+# Metadata #####################################################################
+__author__ = "Timothy McFadden"
+__creationDate__ = "10/18/2026"
+__license__ = "MIT"
+
+
+# Globals ######################################################################
+THIS_DIR = os.path.abspath(os.path.dirname(__file__))
+msi = imp.load_source("make_search_index", os.path.join(THIS_DIR, "make-search-index.py"))
+minify = imp.load_source("minify", os.path.join(THIS_DIR, "minify.py"))
+
+# Bump this if the layout of the results file changes
+RESULTS_VERSION = 1
+
+# The share of generated posts that are drafts
+DRAFT_RATIO = 0.1
+
+# The number of CSS and JS files in the generated static tree.  Half of each
+# are small enough to be inlined by minify.py.
+NUMBER_OF_ASSETS = 8
+
+SYLLABLES = [
+    "ka", "lo", "mi", "ne", "ru", "sa", "ti", "vo", "ber", "con", "dex", "fal",
+    "gen", "hub", "ion", "jar", "kin", "lum", "mor", "nix", "pol", "quo", "ras",
+    "sim", "tor", "ult", "ver", "wex", "yam", "zel"
+]
+
+TAGS = ["python", "hugo", "git", "windows", "linux", "aws", "javascript", "css", "nginx", "search"]
+
+
+def get_args():
+    """Parse the command-line arguments."""
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--posts', help="Sizes of the trees to generate (number of posts)", type=int, nargs="+", default=[1000])
+    parser.add_argument('--output', help="Path to write the JSON results to", type=str, default="bench-results.json")
+    parser.add_argument('--workdir', help="Where to generate the trees (defaults to a temporary folder)", type=str, default=None)
+    parser.add_argument("--keep", help="Don't remove the generated trees", action="store_true")
+    parser.add_argument('--seed', help="Seed for the generated content", type=int, default=0)
+    parser.add_argument('--jobs', help="Number of worker processes used by get_index (0 uses every CPU)", type=int, default=1)
+    parser.add_argument("--no-htmlmin", help="Don't minimize the HTML in process_html", dest="do_htmlmin", action="store_false")
+    parser.set_defaults(do_htmlmin=True)
+    return parser.parse_args()
+
+
+def make_vocabulary(rng, size=5000):
+    """Returns a list of made-up words.  Words near the front of the list are
+    used far more often than the rest (see `words()`).
+    """
+    vocabulary = set()
+    while len(vocabulary) < size:
+        vocabulary.add("".join(rng.choice(SYLLABLES) for _ in range(rng.randint(1, 4))))
+
+    return sorted(vocabulary, key=lambda x: (len(x), x))
+
+
+def words(rng, vocabulary, count):
+    """Returns `count` words, skewed towards the front of the vocabulary."""
+    size = len(vocabulary)
+    return [vocabulary[int(size * (rng.random() ** 3))] for _ in range(count)]
+
+
+def make_body(rng, vocabulary):
+    """Returns the Markdown body of a post."""
+    paragraphs = []
+
+    for _ in range(rng.randint(3, 15)):
+        sentence = words(rng, vocabulary, rng.randint(30, 120))
+        sentence[0] = sentence[0].capitalize()
+
+        # Sprinkle in the things get_keywords() has to strip out
+        position = rng.randrange(len(sentence))
+        choice = rng.random()
+        if choice < 0.3:
+            sentence[position] = "[%s](http://example.com/%s/)" % (sentence[position], sentence[position])
+        elif choice < 0.5:
+            sentence[position] = "<code>%s</code>" % sentence[position]
+        elif choice < 0.6:
+            sentence[position] = sentence[position].capitalize()
+
+        paragraphs.append(" ".join(sentence) + ".")
+
+    return "\n\n".join(paragraphs) + "\n"
+
+
+def make_posts(path, count, rng, vocabulary):
+    """Writes `count` posts with TOML front matter under `path`.  Returns the
+    number of bytes written.
+    """
+    total = 0
+
+    for i in range(count):
+        year = 2010 + (i % 8)
+        folder = os.path.join(path, "posts", str(year))
+        if not os.path.isdir(folder):
+            os.makedirs(folder)
+
+        title = " ".join(words(rng, vocabulary, rng.randint(2, 6))).title()
+        header = [
+            'title = "%s"' % title,
+            'date = "%04i-%02i-%02iT%02i:%02i:00-07:00"' % (year, 1 + (i % 12), 1 + (i % 28), i % 24, i % 60),
+            'slug = "post-%i"' % i,
+            'tags = [%s]' % ", ".join('"%s"' % x for x in rng.sample(TAGS, rng.randint(0, 3))),
+        ]
+        if rng.random() < DRAFT_RATIO:
+            header.append("draft = true")
+
+        text = "+++\n%s\n+++\n\n%s" % ("\n".join(header), make_body(rng, vocabulary))
+        with open(os.path.join(folder, "post-%i.md" % i), "wb") as fh:
+            fh.write(text)
+
+        total += len(text)
+
+    return total
+
+
+def make_css(rng, vocabulary, rules):
+    """Returns a stylesheet with `rules` rules."""
+    lines = ["/* Generated stylesheet */"]
+    for i in range(rules):
+        lines.append("/* %s */" % " ".join(words(rng, vocabulary, 5)))
+        lines.append(".%s-%i {\n    margin: %ipx %ipx;\n    color: #%06x;\n    font-size: %.1fem;\n}\n" % (
+            words(rng, vocabulary, 1)[0], i, rng.randint(0, 20), rng.randint(0, 20), rng.randint(0, 0xffffff), rng.uniform(0.5, 2)
+        ))
+
+    return "\n".join(lines)
+
+
+def make_js(rng, vocabulary, functions):
+    """Returns a script with `functions` functions."""
+    lines = ["// Generated script"]
+    for i in range(functions):
+        name = "%s%i" % (words(rng, vocabulary, 1)[0], i)
+        lines.append("""function %s(first, second) {
+    // %s
+    var total = first + second;
+    if (total > %i) {
+        return total * %i;
+    }
+    return "%s";
+}
+""" % (name, " ".join(words(rng, vocabulary, 5)), rng.randint(0, 1000), rng.randint(2, 9), words(rng, vocabulary, 1)[0]))
+
+    return "\n".join(lines)
+
+
+def make_static(path, count, rng, vocabulary):
+    """Writes a Hugo-like output tree of `count` HTML pages under `path`, with
+    CSS and JS files referenced by every page.  Returns the number of bytes
+    written.
+    """
+    total = 0
+    assets = {"css": [], "js": []}
+
+    for folder in ["css", "js"]:
+        os.makedirs(os.path.join(path, folder))
+
+    for i in range(NUMBER_OF_ASSETS):
+        # Every other asset is small enough to be inlined
+        size = 5 if (i % 2) else 150
+        for ext, text in [("css", make_css(rng, vocabulary, size)), ("js", make_js(rng, vocabulary, size))]:
+            url = "/%s/asset-%i.%s" % (ext, i, ext)
+            with open(os.path.join(path, ext, "asset-%i.%s" % (i, ext)), "wb") as fh:
+                fh.write(text)
+            assets[ext].append(url)
+            total += len(text)
+
+    head = "\n".join(
+        ['<link rel="stylesheet" href="%s">' % x for x in assets["css"]] +
+        ['<script type="text/javascript" src="%s"></script>' % x for x in assets["js"]]
+    )
+
+    for i in range(count):
+        folder = os.path.join(path, "posts", "post-%i" % i)
+        os.makedirs(folder)
+
+        body = make_body(rng, vocabulary).replace("\n\n", "</p>\n\n    <p>")
+        text = """<!DOCTYPE html>
+<html>
+<head>
+    <meta charset="utf-8">
+    <!-- Generated page %i -->
+    <title>Post %i</title>
+    %s
+</head>
+<body>
+    <div class="content">
+        <p>%s</p>
+    </div>
+</body>
+</html>
+""" % (i, i, head, body)
+
+        with open(os.path.join(folder, "index.html"), "wb") as fh:
+            fh.write(text)
+        total += len(text)
+
+    return total
+
+
+def tree_size(path, ext):
+    """Returns the number of files ending with `ext` under `path`, and their
+    total size."""
+    count = size = 0
+    for root, dirs, files in os.walk(path):
+        for fname in files:
+            if fname.endswith(ext):
+                count += 1
+                size += os.stat(os.path.join(root, fname)).st_size
+
+    return count, size
+
+
+def timed(function, *args, **kwargs):
+    """Calls the function with stdout and stderr silenced (slimit is very
+    chatty).  Returns the result and the number of seconds it took.
+    """
+    stdout, stderr = sys.stdout, sys.stderr
+    with open(os.devnull, "w") as devnull:
+        sys.stdout = sys.stderr = devnull
+        try:
+            tstart = time.time()
+            result = function(*args, **kwargs)
+            elapsed = time.time() - tstart
+        finally:
+            sys.stdout, sys.stderr = stdout, stderr
+
+    return result, elapsed
+
+
+def bench_index(content_dir, jobs):
+    """Times `get_index()` and `get_keywords()` over the generated posts."""
+    results = {}
+
+    count, size = tree_size(content_dir, ".md")
+    docs, elapsed = timed(lambda: sum(1 for _ in msi.get_index(content_dir, jobs=jobs)))
+    results["get_index"] = {"seconds": elapsed, "files": count, "bytes_in": size, "documents": docs}
+
+    bodies = []
+    for path in msi.find_markdown(content_dir):
+        with open(path, "rb") as fh:
+            front_matter = msi.read_front_matter(fh)
+            bodies.append(front_matter[1] + fh.read())
+
+    _, elapsed = timed(lambda: [msi.get_keywords(x) for x in bodies])
+    results["get_keywords"] = {"seconds": elapsed, "files": len(bodies), "bytes_in": sum(len(x) for x in bodies)}
+
+    return results
+
+
+def bench_minify(static_dir, do_htmlmin):
+    """Times the stages of minify.py over the generated static tree.  The
+    stages change the tree, so they're run in the same order as minify.py.
+    """
+    results = {}
+    minify.MAX_INLINE_BYTES = 4096
+
+    for name, function, ext in [("process_css", minify.process_css, ".css"), ("process_js", minify.process_js, ".js")]:
+        count, size = tree_size(static_dir, ext)
+        asset_map, elapsed = timed(function, static_dir)
+        results[name] = {
+            "seconds": elapsed, "files": count, "bytes_in": size,
+            "bytes_out": sum(x["size"] for x in asset_map.values())
+        }
+        results[name]["map"] = asset_map
+
+    count, size = tree_size(static_dir, ".html")
+    _, elapsed = timed(minify.process_html, static_dir, results["process_css"].pop("map"), results["process_js"].pop("map"), do_htmlmin)
+    results["process_html"] = {"seconds": elapsed, "files": count, "bytes_in": size, "bytes_out": tree_size(static_dir, ".html")[1]}
+
+    return results
+
+
+def print_results(posts, stages):
+    """Display the results of one tree size."""
+    print "===== %i posts ======================================" % posts
+    print "    %15s  %10s %8s %12s %10s" % ("", "seconds", "files", "files/s", "MB/s")
+    for name in ["get_index", "get_keywords", "process_css", "process_js", "process_html"]:
+        stage = stages[name]
+        seconds = max(stage["seconds"], 1e-9)
+        print "    %15s: %10.04f %8i %12.01f %10.02f" % (
+            name, stage["seconds"], stage["files"], stage["files"] / seconds, stage["bytes_in"] / seconds / (1024.0 * 1024.0)
+        )
+
+
+if __name__ == '__main__':
+    args = get_args()
+    workdir = args.workdir or tempfile.mkdtemp(prefix="bench-pipeline-")
+
+    results = {
+        "version": RESULTS_VERSION,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "seed": args.seed,
+        "jobs": args.jobs,
+        "runs": []
+    }
+
+    try:
+        for posts in args.posts:
+            rng = random.Random(args.seed)
+            vocabulary = make_vocabulary(rng)
+            content_dir = os.path.join(workdir, "%i" % posts, "content")
+            static_dir = os.path.join(workdir, "%i" % posts, "public")
+            for path in [content_dir, static_dir]:
+                if os.path.exists(path):
+                    shutil.rmtree(path)
+
+            tstart = time.time()
+            content_bytes = make_posts(content_dir, posts, rng, vocabulary)
+            static_bytes = make_static(static_dir, posts, rng, vocabulary)
+            print "Generated [%i] posts (%.02fMB) and pages (%.02fMB) in [%s]" % (
+                posts, content_bytes / (1024.0 * 1024.0), static_bytes / (1024.0 * 1024.0), msi.format_timespan(time.time() - tstart)
+            )
+
+            stages = bench_index(content_dir, args.jobs)
+            stages.update(bench_minify(static_dir, args.do_htmlmin))
+            results["runs"].append({"posts": posts, "stages": stages})
+            print_results(posts, stages)
+    finally:
+        if args.keep:
+            pass
+        elif args.workdir:
+            for posts in args.posts:
+                shutil.rmtree(os.path.join(workdir, "%i" % posts), ignore_errors=True)
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    msi.write_json_file(results, args.output, prettyprint=True)
+    print "Results written to", os.path.abspath(args.output)
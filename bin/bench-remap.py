@@ -0,0 +1,199 @@
+#!/usr/bin/env python2.7
+"""
+This script benchmarks the remapping/inlining of fingerprinted CSS and JS files
+in minify.py as the number of files grows.
+
+For each requested number of files, a set of CSS and JS files is generated
+along with pages that reference a few of them (several tags per line, URLs
+that contain other URLs, scripts without a type, and so on).  Every page is
+then rewritten by `minify.AssetRewriter` and by the previous implementation,
+which searched every page once for every file.  The pages, the messages, and
+the files to remove must be the same; the time taken by each is reported.
+
+Example:
+    python bench-remap.py --assets 10 100 1000 --pages 200
+"""
+
+# Imports ######################################################################
+import os
+import re
+import imp
+import sys
+import time
+import random
+import shutil
+import argparse
+import tempfile
+from StringIO import StringIO
+
+
+# Metadata #####################################################################
+__author__ = "Timothy McFadden"
+__creationDate__ = "10/18/2026"
+__license__ = "MIT"
+
+
+# Globals ######################################################################
+THIS_DIR = os.path.abspath(os.path.dirname(__file__))
+minify = imp.load_source("minify", os.path.join(THIS_DIR, "minify.py"))
+
+# The number of CSS and JS files referenced by each page
+REFERENCES_PER_PAGE = 6
+
+
+def get_args():
+    """Parse the command-line arguments."""
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--assets', help="Numbers of CSS (and JS) files to benchmark", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument('--pages', help="Number of pages to rewrite", type=int, default=200)
+    parser.add_argument('--seed', help="Seed for the generated pages", type=int, default=0)
+    return parser.parse_args()
+
+
+def legacy_remap_css(text, css_map, html_file, unlink_files):
+    """Remaps or inlines new CSS files (the previous implementation)."""
+    for old, new in sorted(css_map.items()):
+        match = re.search("""(<link rel=.?stylesheet.? href=.+%s.*?>)""" % old, text)
+        if not match:
+            continue
+        elif minify.do_inline(new):
+            print "inlining [%s] in [%s]" % (old, minify.shortend_path(html_file))
+            fname = os.path.splitext(os.path.split(old)[1])[0]
+            new_css = """<style type="text/css" title="%s">%s</style>""" % (fname, minify.slurp(new["path"]))
+            text = text.replace(match.group(1), new_css)
+            unlink_files.add(new["path"])
+        else:
+            print "subbing [%s] in [%s]" % (old, minify.shortend_path(html_file))
+            text = text.replace(old, new["url"])
+
+    return text
+
+
+def legacy_remap_js(text, js_map, html_file, unlink_files):
+    """Remaps or inlines new JS files (the previous implementation)."""
+    for old, new in sorted(js_map.items()):
+        match = re.search("""(<script type=.?text/javascript.*?%s.*?</script>)""" % old, text)
+        if not match:
+            continue
+        elif minify.do_inline(new):
+            print "inlining [%s] in [%s]" % (old, minify.shortend_path(html_file))
+            fname = os.path.splitext(os.path.split(old)[1])[0]
+            new_js = """<script type="text/javascript" title="%s">%s</script>""" % (fname, minify.slurp(new["path"]))
+            text = text.replace(match.group(1), new_js)
+            unlink_files.add(new["path"])
+        else:
+            print "subbing [%s] in [%s]" % (old, minify.shortend_path(html_file))
+            text = text.replace(old, new["url"])
+
+    return text
+
+
+def make_assets(path, count, rng):
+    """Writes `count` CSS and JS files under `path`.  Returns
+    the CSS and JS maps, like `process_css()` and `process_js()` would.
+    """
+    css_map, js_map = {}, {}
+    urls = []
+    for i in range(count):
+        urls.append(("css", "/css/s%i.css" % i))
+        urls.append(("js", "/js/s%i.js" % i))
+
+    # URLs that contain (or are contained in) other URLs
+    urls.extend([("css", "/print/css/s1.css"), ("css", "/css/print/s1.css"), ("js", "/vendor/js/s2.js")])
+
+    for kind, url in urls:
+        asset_map = css_map if (kind == "css") else js_map
+        small = rng.random() < 0.5
+        text = ("/* %s */\n" % url) * (2 if small else 400)
+        fpath = os.path.join(path, "fp-%i%s" % (len(asset_map), os.path.splitext(url)[1]))
+        with open(fpath, "wb") as fh:
+            fh.write(text)
+
+        asset_map[url] = {"path": fpath, "url": url.replace("/s", "/fp-s"), "size": len(text)}
+
+    return css_map, js_map
+
+
+def make_page(rng, count):
+    """Returns the HTML of a page that references some of the first `count`
+    CSS and JS files.
+    """
+    css = ["/css/s%i.css" % rng.randrange(count) for _ in range(REFERENCES_PER_PAGE)]
+    js = ["/js/s%i.js" % rng.randrange(count) for _ in range(REFERENCES_PER_PAGE)]
+
+    lines = ["<!DOCTYPE html>", "<html>", "<head>"]
+    lines.extend('<link rel="stylesheet" href="%s?v=3">' % x for x in css[:-2])
+
+    # Several tags on one line, a URL that contains another, and a reference
+    # where "." is not a "."
+    lines.append(''.join('<link rel="stylesheet" type="text/css" href="%s">' % x for x in css[-2:]))
+    lines.append('<link rel="stylesheet" href="/print/css/s1.css"><link rel="stylesheet" href="/css/s2Xcss">')
+    lines.append("</head>")
+    lines.append("<body>")
+    lines.extend("<p>%s</p>" % ("lorem ipsum /css/ and /js/ " * 20) for _ in range(20))
+    lines.extend('<script type="text/javascript" src="%s"></script>' % x for x in js[:-2])
+    lines.append('<script src="%s"></script><script type="text/javascript" src="%s"></script>' % tuple(js[-2:]))
+    lines.append('<script type="text/javascript" src="/vendor/js/s2.js"></script>')
+    lines.extend(["</body>", "</html>"])
+    return "\n".join(lines)
+
+
+def run(pages, rewrite):
+    """Runs `rewrite(text, html_file, unlink_files)` over every page.  Returns
+    the results (pages, messages, and files to remove) and the time taken.
+    """
+    stdout = sys.stdout
+    sys.stdout = StringIO()
+    unlink_files = set()
+    results = []
+    tstart = time.time()
+    try:
+        for i, text in enumerate(pages):
+            html_file = "/posts/post-%i/index.html" % i
+            results.append(rewrite(text, html_file, unlink_files))
+        elapsed = time.time() - tstart
+        output = sys.stdout.getvalue()
+    finally:
+        sys.stdout = stdout
+
+    return (results, output, unlink_files), elapsed
+
+
+def bench(count, number_of_pages, seed, workdir):
+    """Benchmarks both implementations with `count` CSS and JS files."""
+    rng = random.Random(seed)
+    css_map, js_map = make_assets(workdir, count, rng)
+    pages = [make_page(rng, count) for _ in range(number_of_pages)]
+
+    def legacy(text, html_file, unlink_files):
+        text = legacy_remap_css(text, css_map, html_file, unlink_files)
+        return legacy_remap_js(text, js_map, html_file, unlink_files)
+
+    # Built once per run of `process_html()` (per worker)
+    tstart = time.time()
+    rewriter = minify.AssetRewriter(css_map, js_map)
+    setup = time.time() - tstart
+
+    expected, legacy_time = run(pages, legacy)
+    actual, rewriter_time = run(pages, rewriter.rewrite)
+    rewriter_time += setup
+
+    if actual != expected:
+        sys.exit("The results differ with [%i] files!" % count)
+
+    return legacy_time, rewriter_time
+
+
+if __name__ == '__main__':
+    args = get_args()
+    workdir = tempfile.mkdtemp(prefix="bench-remap-")
+    minify.MAX_INLINE_BYTES = 4096
+
+    print "Rewriting [%i] pages" % args.pages
+    print "    %8s %12s %12s %9s" % ("files", "legacy (s)", "single (s)", "speedup")
+    try:
+        for count in args.assets:
+            legacy_time, rewriter_time = bench(count, args.pages, args.seed, workdir)
+            print "    %8i %12.03f %12.03f %8.01fx" % (count, legacy_time, rewriter_time, legacy_time / rewriter_time)
+    finally:
+        shutil.rmtree(workdir)
@@ -0,0 +1,166 @@
+#!/usr/bin/env python2.7
+"""
+This module keeps a manifest of the files in a build: the content hash, size
+and modification time of each one.  Comparing the manifests of two builds tells
+us which files were added, changed, or removed, without asking git to look at
+the whole tree.
+
+Files are hashed in chunks, so large files aren't read into memory.  A file
+with the same size and modification time as in the previous manifest keeps its
+hash instead of being read again.
+
+`sync()` uses the manifests to make one folder the same as another, only
+copying the files whose hash differs (each to a temporary file that's then
+renamed over the old one) and removing the files that are gone.
+
+Usage:
+    previous = buildmanifest.load(path)
+    manifest = buildmanifest.build("mtik00.github.io", previous)
+    added, changed, removed = buildmanifest.diff(previous, manifest)
+    buildmanifest.save(path, manifest)
+    added, changed, removed = buildmanifest.sync(".staging", "mtik00.github.io")
+"""
+
+# Imports ######################################################################
+import os
+import json
+import shutil
+import tempfile
+from hashlib import md5
+
+
+# Metadata #####################################################################
+__author__ = "Timothy McFadden"
+__creationDate__ = "10/18/2026"
+__license__ = "MIT"
+
+
+# Globals ######################################################################
+# Bump this if the layout of the manifest changes
+MANIFEST_VERSION = 1
+
+# Files are hashed this many bytes at a time
+CHUNK_SIZE = 64 * 1024
+
+# Folders that are never in the manifest
+EXCLUDE_DIRS = [".git"]
+
+
+def hash_file(path, chunk_size=CHUNK_SIZE):
+    """Returns the hex MD5 of the file, reading `chunk_size` bytes at a time."""
+    m = md5()
+    with open(path, "rb") as fh:
+        for chunk in iter(lambda: fh.read(chunk_size), ""):
+            m.update(chunk)
+
+    return m.hexdigest()
+
+
+def build(base_dir, previous=None, exclude_dirs=EXCLUDE_DIRS):
+    """Returns the manifest of the files under `base_dir`: a dictionary of the
+    path (relative, with "/") to its hash, size, and modification time.
+
+    :param dict previous: An earlier manifest of the same folder; files with the
+        same size and modification time keep their hash
+    """
+    previous = previous or {}
+    manifest = {}
+    for root, dirs, files in os.walk(base_dir):
+        dirs[:] = sorted(x for x in dirs if x not in exclude_dirs)
+        for fname in sorted(files):
+            path = os.path.join(root, fname)
+            name = os.path.relpath(path, base_dir).replace(os.sep, "/")
+            stat = os.stat(path)
+
+            entry = previous.get(name)
+            if entry and (entry["size"] == stat.st_size) and (entry["mtime"] == stat.st_mtime):
+                manifest[name] = entry
+            else:
+                manifest[name] = {"hash": hash_file(path), "size": stat.st_size, "mtime": stat.st_mtime}
+
+    return manifest
+
+
+def diff(previous, manifest):
+    """Returns the sorted lists of the files added, changed, and removed since
+    the `previous` manifest.
+    """
+    previous = previous or {}
+    added = sorted(x for x in manifest if x not in previous)
+    removed = sorted(x for x in previous if x not in manifest)
+    changed = sorted(x for x in manifest if (x in previous) and (previous[x]["hash"] != manifest[x]["hash"]))
+    return added, changed, removed
+
+
+def copy_atomic(source, dest):
+    """Copies the file (and its times and mode) to a temporary file next to
+    `dest`, then renames it over `dest`.
+    """
+    dirname = os.path.dirname(dest)
+    if not os.path.isdir(dirname):
+        os.makedirs(dirname)
+
+    fd, temp_path = tempfile.mkstemp(dir=dirname, prefix=".sync-")
+    with os.fdopen(fd, "wb") as out, open(source, "rb") as fh:
+        shutil.copyfileobj(fh, out, CHUNK_SIZE)
+    shutil.copystat(source, temp_path)
+
+    try:
+        os.rename(temp_path, dest)
+    except OSError:
+        # Windows won't rename over an existing file
+        os.remove(dest)
+        os.rename(temp_path, dest)
+
+
+def remove_empty_dirs(base_dir, exclude_dirs=EXCLUDE_DIRS):
+    """Removes the empty folders under `base_dir`."""
+    for root, dirs, files in os.walk(base_dir, topdown=False):
+        for name in dirs:
+            path = os.path.join(root, name)
+            if (name not in exclude_dirs) and (not os.listdir(path)):
+                os.rmdir(path)
+
+
+def sync(source_dir, dest_dir, source=None, dest=None):
+    """Makes the files in `dest_dir` the same as those in `source_dir` (other
+    than the EXCLUDE_DIRS).  Files that are the same aren't touched.  Returns
+    the sorted lists of the files added, changed, and removed in `dest_dir`.
+
+    :param dict source: The manifest of `source_dir`, if it's already known
+    :param dict dest: An earlier manifest of `dest_dir` (see `build()`)
+    """
+    source = build(source_dir) if (source is None) else source
+    dest = build(dest_dir, dest)
+    added, changed, removed = diff(dest, source)
+
+    for name in added + changed:
+        copy_atomic(os.path.join(source_dir, name), os.path.join(dest_dir, name))
+
+    for name in removed:
+        os.remove(os.path.join(dest_dir, name))
+
+    if removed:
+        remove_empty_dirs(dest_dir)
+
+    return added, changed, removed
+
+
+def load(path):
+    """Returns the manifest saved at `path`, or None."""
+    if (not path) or (not os.path.isfile(path)):
+        return None
+
+    try:
+        with open(path, "rb") as fh:
+            data = json.load(fh)
+    except ValueError:
+        return None
+
+    return data["files"] if (data.get("version") == MANIFEST_VERSION) else None
+
+
+def save(path, manifest):
+    """Writes the manifest to `path`."""
+    with open(path, "wb") as fh:
+        json.dump({"version": MANIFEST_VERSION, "files": manifest}, fh, indent=0, sort_keys=True)
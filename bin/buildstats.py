@@ -0,0 +1,281 @@
+#!/usr/bin/env python2.7
+"""
+This module records how long each stage of the build takes, and how much work
+it did, so we can see where the publish time goes.
+
+Each stage records its wall time, CPU time (including any child processes that
+finished during the stage), the number of files processed, bytes in and out,
+and the peak RSS of the process so far.  Stages can be nested; nested stages are
+named like "make/build".
+
+Usage:
+    report = buildstats.Report("minify")
+    with report.stage("css") as stage:
+        stage.files += 1
+        stage.bytes_in += 1024
+    report.finish()
+
+`finish()` writes the report as JSON to the given path, or, if the
+BUILDSTATS_DIR environment variable is set, to "<BUILDSTATS_DIR>/<name>.json".
+This is how the fabfile collects the reports of the scripts it runs.
+
+`append_history()` and `find_regressions()` keep a history of reports (one JSON
+object per line) and compare new reports against it.
+"""
+
+# Imports ######################################################################
+import os
+import sys
+import json
+import time
+import contextlib
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+
+# Metadata #####################################################################
+__author__ = "Timothy McFadden"
+__creationDate__ = "10/18/2026"
+__license__ = "MIT"
+
+
+# Globals ######################################################################
+# If this environment variable is set, reports are written into the folder it
+# names (see `Report.finish()`).
+REPORT_DIR_ENV = "BUILDSTATS_DIR"
+
+# Bump this if the layout of the report changes
+REPORT_VERSION = 1
+
+# The number of previous runs used as the baseline by `find_regressions()`
+BASELINE_RUNS = 5
+
+# Stages are flagged if they got this much slower (in percent) than the baseline
+REGRESSION_THRESHOLD = 25.0
+
+# Stages with a baseline faster than this (in seconds) are too noisy to flag
+MIN_REGRESSION_SECONDS = 0.5
+
+
+def cpu_time():
+    """Returns the user + system CPU time of this process and its children."""
+    times = os.times()
+    return times[0] + times[1] + times[2] + times[3]
+
+
+def peak_rss_kb():
+    """Returns the peak resident set size (in KB) of this process or any of its
+    waited-for children, whichever is larger.  Returns None if it can't be
+    measured (e.g. on Windows without psutil).
+    """
+    if resource is not None:
+        peak = max(
+            resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+            resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+        )
+
+        # macOS reports bytes; everything else reports KB
+        return (peak // 1024) if (sys.platform == "darwin") else peak
+
+    if psutil is not None:
+        info = psutil.Process().memory_info()
+        return getattr(info, "peak_wset", info.rss) // 1024
+
+    return None
+
+
+def tree_size(path, extensions):
+    """Returns the number of files under `path` ending with one of
+    `extensions`, and their total size in bytes.
+    """
+    count = size = 0
+    for root, dirs, files in os.walk(path):
+        for fname in files:
+            if fname.endswith(tuple(extensions)):
+                count += 1
+                size += os.stat(os.path.join(root, fname)).st_size
+
+    return count, size
+
+
+class Stage(object):
+    """The measurements of one stage.  The code being measured adds to `files`,
+    `bytes_in` and `bytes_out` as it goes.
+    """
+    def __init__(self, name):
+        self.name = name
+        self.files = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.wall = 0.0
+        self.cpu = 0.0
+        self.peak_rss_kb = None
+
+    def to_dict(self):
+        """Returns the stage as a dictionary, for JSON."""
+        return {
+            "name": self.name,
+            "wall": round(self.wall, 6),
+            "cpu": round(self.cpu, 6),
+            "files": self.files,
+            "bytes_in": self.bytes_in,
+            "bytes_out": self.bytes_out,
+            "peak_rss_kb": self.peak_rss_kb
+        }
+
+
+class Report(object):
+    """The stages of one script (or fab run), in the order they started."""
+    def __init__(self, name):
+        self.name = name
+        self.stages = []
+        self.stack = []
+        self.started = time.time()
+        self.cpu_started = cpu_time()
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        """Measures the code run in the `with` block as a stage."""
+        stage = Stage("/".join(self.stack + [name]))
+        self.stages.append(stage)
+        self.stack.append(name)
+
+        wall, cpu = time.time(), cpu_time()
+        try:
+            yield stage
+        finally:
+            stage.wall = time.time() - wall
+            stage.cpu = cpu_time() - cpu
+            stage.peak_rss_kb = peak_rss_kb()
+            self.stack.pop()
+
+    def include(self, path):
+        """Adds the stages from a report written by another script (e.g. one
+        run by the fabfile) under the current stage.  Missing reports are
+        ignored.
+        """
+        if not os.path.isfile(path):
+            return
+
+        with open(path, "rb") as fh:
+            other = json.load(fh)
+
+        prefix = "/".join(self.stack + [other["name"]])
+        for data in other["stages"]:
+            stage = Stage("%s/%s" % (prefix, data["name"]))
+            for key in ["wall", "cpu", "files", "bytes_in", "bytes_out", "peak_rss_kb"]:
+                setattr(stage, key, data[key])
+            self.stages.append(stage)
+
+    def to_dict(self):
+        """Returns the report as a dictionary, for JSON."""
+        return {
+            "version": REPORT_VERSION,
+            "name": self.name,
+            "started": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self.started)),
+            "wall": round(time.time() - self.started, 6),
+            "cpu": round(cpu_time() - self.cpu_started, 6),
+            "peak_rss_kb": peak_rss_kb(),
+            "stages": [x.to_dict() for x in self.stages]
+        }
+
+    def write(self, path):
+        """Writes the report to `path` as JSON."""
+        dirname = os.path.dirname(os.path.abspath(path))
+        if not os.path.isdir(dirname):
+            os.makedirs(dirname)
+
+        with open(path, "wb") as fh:
+            json.dump(self.to_dict(), fh, indent=4, sort_keys=True, separators=(',', ': '))
+
+    def finish(self, path=None):
+        """Writes the report to `path`, or into the folder named by the
+        BUILDSTATS_DIR environment variable.  Does nothing if neither is set.
+        Returns the path written to.
+        """
+        if (not path) and os.environ.get(REPORT_DIR_ENV):
+            path = os.path.join(os.environ[REPORT_DIR_ENV], "%s.json" % self.name)
+
+        if path:
+            self.write(path)
+
+        return path
+
+    def print_summary(self):
+        """Display the stages."""
+        print "===== Build Stages =================================="
+        print "    %-40s %9s %9s %7s %10s %10s" % ("", "wall", "cpu", "files", "in (kb)", "out (kb)")
+        for stage in self.stages:
+            print "    %-40s %9.03f %9.03f %7i %10.01f %10.01f" % (
+                stage.name, stage.wall, stage.cpu, stage.files, stage.bytes_in / 1024.0, stage.bytes_out / 1024.0
+            )
+
+
+def append_history(path, report):
+    """Appends the report to the history file at `path`."""
+    with open(path, "ab") as fh:
+        fh.write(json.dumps(report.to_dict(), sort_keys=True) + "\n")
+
+
+def load_history(path, runs=BASELINE_RUNS):
+    """Returns the last `runs` reports from the history file at `path`.
+    Lines that can't be read are skipped.
+    """
+    if not os.path.isfile(path):
+        return []
+
+    history = []
+    with open(path, "rb") as fh:
+        for line in fh:
+            try:
+                history.append(json.loads(line))
+            except ValueError:
+                continue
+
+    return history[-runs:] if runs else history
+
+
+def median(values):
+    """Returns the median of a non-empty list of numbers."""
+    values = sorted(values)
+    middle = len(values) // 2
+    if len(values) % 2:
+        return values[middle]
+
+    return (values[middle - 1] + values[middle]) / 2.0
+
+
+def find_regressions(report, history, threshold=REGRESSION_THRESHOLD, min_seconds=MIN_REGRESSION_SECONDS):
+    """Compares the wall time of each stage in `report` against its median in
+    the `history` reports.
+
+    Returns a list of (stage name, wall time, baseline, percent slower) for
+    the stages that got more than `threshold` percent slower.
+    """
+    baselines = {}
+    for previous in history:
+        for stage in previous["stages"]:
+            baselines.setdefault(stage["name"], []).append(stage["wall"])
+
+    regressions = []
+    for stage in report.stages:
+        if stage.name not in baselines:
+            continue
+
+        baseline = median(baselines[stage.name])
+        if baseline < min_seconds:
+            continue
+
+        percent = 100.0 * (stage.wall - baseline) / baseline
+        if percent > threshold:
+            regressions.append((stage.name, stage.wall, baseline, percent))
+
+    return regressions
@@ -0,0 +1,165 @@
+#!/usr/bin/env python2.7
+"""
+This module holds the helpers shared by the build scripts (make-search-index,
+minify and precompress): compressing data the same way every time, writing
+files atomically, keeping a cache folder under a size limit, and spreading
+work over a pool of processes.
+
+Usage:
+    buildutils.write_atomic(path, [buildutils.gzip_data(data)])
+    for result in buildutils.imap_jobs(function, items, jobs=0):
+        ...
+    buildutils.prune_cache(cache_dir, 64 * 1024 * 1024)
+"""
+
+# Imports ######################################################################
+import os
+import gzip
+import tempfile
+import itertools
+import collections
+import multiprocessing
+from StringIO import StringIO
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+# Metadata #####################################################################
+__author__ = "Timothy McFadden"
+__creationDate__ = "10/18/2026"
+__license__ = "MIT"
+
+
+# Globals ######################################################################
+# The number of items `imap_jobs()` hands to the pool per worker process before
+# waiting for the oldest result
+JOB_WINDOW = 4
+
+
+def gzip_data(data, level=9):
+    """Returns the data gzipped.  The header has no filename or timestamp, so
+    the result only depends on the data.
+    """
+    buf = StringIO()
+    with gzip.GzipFile("", "wb", level, buf, mtime=0) as fh:
+        fh.write(data)
+
+    return buf.getvalue()
+
+
+def brotli_data(data, quality=11):
+    """Returns the data compressed by brotli, or None if the brotli module isn't
+    installed.
+    """
+    if brotli is None:
+        return None
+
+    return brotli.compress(data, quality=quality)
+
+
+def rename_temp(temp_path, path, replace=True):
+    """Gives the temporary file the usual permissions and renames it to `path`.
+
+    :param bool replace: Whether or not to replace `path` on Windows, which
+        won't rename over an existing file.  If False, the existing file is
+        assumed to be the same (e.g. another worker wrote it) and kept.
+    """
+    # mkstemp() only gives the owner access
+    umask = os.umask(0)
+    os.umask(umask)
+    os.chmod(temp_path, 0666 & ~umask)
+
+    try:
+        os.rename(temp_path, path)
+    except OSError:
+        if os.name != "nt":
+            raise
+        elif not replace:
+            os.remove(temp_path)
+            return
+        os.remove(path)
+        os.rename(temp_path, path)
+
+
+def write_atomic(path, chunks, replace=True):
+    """Writes the chunks of data to a temporary file in the same folder as
+    `path`, then renames it to `path` (see `rename_temp()`).
+    """
+    dirname, fname = os.path.split(os.path.abspath(path))
+    fd, temp_path = tempfile.mkstemp(prefix=".%s." % fname, suffix=".tmp", dir=dirname)
+
+    try:
+        with os.fdopen(fd, "wb") as fh:
+            for chunk in chunks:
+                fh.write(chunk)
+
+        rename_temp(temp_path, path, replace)
+    except:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def prune_cache(cache_dir, max_bytes):
+    """Removes the least recently used entries until the cache is no larger than
+    `max_bytes`.  Returns the number of entries removed.
+    """
+    entries = []
+    for root, dirs, files in os.walk(cache_dir):
+        for fname in files:
+            path = os.path.join(root, fname)
+            stat = os.stat(path)
+            entries.append((stat.st_mtime, path, stat.st_size))
+
+    total = sum(x[2] for x in entries)
+    evicted = 0
+    for _, path, size in sorted(entries):
+        if total <= max_bytes:
+            break
+
+        os.unlink(path)
+        total -= size
+        evicted += 1
+
+    return evicted
+
+
+def imap_jobs(function, items, jobs=0, initializer=None, initargs=()):
+    """Yields `function(item)` for each item, in order.  If `jobs` is more than
+    one (0 uses every CPU), the work is spread over a pool of processes.
+
+    Only `jobs * JOB_WINDOW` items are handed to the pool at a time; the next
+    one is handed over as each result is taken.  So however slowly the results
+    are used, no more than that many are ever waiting in memory, and `items`
+    can be a generator.
+
+    :param function initializer: Called with `initargs` in each worker process
+        (or once, here, if there's no pool) before any items are processed
+    """
+    items = iter(items)
+    jobs = jobs or multiprocessing.cpu_count()
+    first = list(itertools.islice(items, jobs * JOB_WINDOW)) if (jobs > 1) else []
+    if len(first) < 2:
+        if initializer:
+            initializer(*initargs)
+        for item in itertools.chain(first, items):
+            yield function(item)
+        return
+
+    pool = multiprocessing.Pool(min(jobs, len(first)), initializer, initargs)
+    try:
+        pending = collections.deque(pool.apply_async(function, (x,)) for x in first)
+        while pending:
+            result = pending.popleft().get()
+
+            # Keep the workers busy while the result is used
+            for item in itertools.islice(items, 1):
+                pending.append(pool.apply_async(function, (item,)))
+
+            yield result
+    finally:
+        pool.close()
+        pool.join()
@@ -0,0 +1,163 @@
+/*
+ * This node script checks a prebuilt index written by make-search-index.py.
+ *
+ * The raw documents are indexed by lunr.js itself, the same way the browser
+ * used to do it, and the result is compared against the prebuilt index.  Every
+ * token in the corpus (and its first three characters) and every title is then
+ * searched for in both indexes, and the results must be the same.
+ *
+ * Compact indexes are loaded with lunr-compact.js.  Sharded indexes are searched
+ * with lunr-sharded.js.  Since the document
+ * magnitudes were calculated by Python, scores are allowed to differ by a
+ * rounding error.
+ *
+ * Usage: node check-lunr-index.js <raw documents JSON> <prebuilt index JSON>
+ */
+var fs = require("fs");
+var vm = require("vm");
+var path = require("path");
+var JS_DIR = path.join(__dirname, "..", "site", "static", "js");
+var lunr = require(path.join(JS_DIR, "lunr.min.js"));
+
+var docs = JSON.parse(fs.readFileSync(process.argv[2], "utf8"));
+var prebuilt = JSON.parse(fs.readFileSync(process.argv[3], "utf8"));
+var errors = 0;
+
+function error(message) {
+    console.error("ERROR:", message);
+    errors++;
+}
+
+// Compares two JSON values, ignoring the order of object keys
+function compare(a, b, where) {
+    if ((typeof a !== typeof b) || (Array.isArray(a) !== Array.isArray(b)) || ((a === null) !== (b === null))) {
+        return error(where + ": types differ");
+    }
+
+    if (Array.isArray(a)) {
+        if (a.length !== b.length) {
+            return error(where + ": lengths differ (" + a.length + " != " + b.length + ")");
+        }
+        a.forEach(function(value, i) {
+            compare(value, b[i], where + "[" + i + "]");
+        });
+    } else if (a && (typeof a === "object")) {
+        var akeys = Object.keys(a).sort(), bkeys = Object.keys(b).sort();
+        if (akeys.join("\u0000") !== bkeys.join("\u0000")) {
+            return error(where + ": keys differ");
+        }
+        akeys.forEach(function(key) {
+            compare(a[key], b[key], where + "." + key);
+        });
+    } else if (a !== b) {
+        error(where + ": " + JSON.stringify(a) + " != " + JSON.stringify(b));
+    }
+}
+
+// Sharded manifests hold the index settings themselves
+var settings = prebuilt.index || prebuilt;
+
+var runtime = lunr(function() {
+    settings.fields.forEach(function(field) {
+        this.field(field.name, {boost: field.boost});
+    }, this);
+    this.ref(settings.ref);
+});
+
+docs.forEach(function(doc) {
+    runtime.add(doc);
+});
+
+// Compares search results, allowing the scores to differ by a rounding error
+function compareResults(a, b, where) {
+    var scores = {};
+    b.forEach(function(result) {
+        scores[result.ref] = result.score;
+    });
+
+    if (a.length !== b.length) {
+        return error(where + ": " + a.length + " results != " + b.length);
+    }
+
+    a.forEach(function(result) {
+        var expected = scores[result.ref];
+        if ((expected === undefined) || (Math.abs(result.score - expected) > 1e-9 * Math.max(1, Math.abs(expected)))) {
+            error(where + ": " + result.ref + " scored " + result.score + " != " + expected);
+        }
+    });
+}
+
+// Returns a context with lunr and one of our scripts loaded into it
+function loadScript(fname) {
+    var context = vm.createContext({lunr: lunr});
+    vm.runInContext(fs.readFileSync(path.join(JS_DIR, fname), "utf8"), context);
+    return context;
+}
+
+// Returns a ShardedIndex for the manifest, reading the shards from disk
+function loadSharded(manifestPath, manifest) {
+    var context = loadScript("lunr-sharded.js");
+
+    return new context.ShardedIndex(manifest, path.dirname(manifestPath) + "/", function(url, callback) {
+        callback(JSON.parse(fs.readFileSync(url, "utf8")));
+    });
+}
+
+var queries = {};
+runtime.corpusTokens.toArray().forEach(function(token) {
+    queries[token] = true;
+    queries[token.substr(0, 3)] = true;
+});
+docs.forEach(function(doc) {
+    queries[doc.title] = true;
+});
+
+if (prebuilt.format === "sharded") {
+    var sharded = loadSharded(process.argv[3], prebuilt);
+
+    // Load every shard, and check the tokens and magnitudes
+    var tokens = {};
+    runtime.corpusTokens.toArray().forEach(function(token) {
+        var docs = runtime.tokenStore.get(token);
+        tokens[token] = {};
+        Object.keys(docs).forEach(function(ref) {
+            tokens[token][ref] = docs[ref].tf;
+        });
+    });
+
+    sharded.load(Object.keys(prebuilt.shards), function() {});
+    compare(sharded.tokens, tokens, "shards");
+
+    prebuilt.docs.forEach(function(doc) {
+        var expected = runtime.documentVector(doc.href).magnitude();
+        if (Math.abs(doc.magnitude - expected) > 1e-9 * expected) {
+            error("magnitude of " + doc.href + ": " + doc.magnitude + " != " + expected);
+        }
+    });
+
+    Object.keys(queries).forEach(function(query) {
+        sharded.search(query, function(results) {
+            compareResults(results, runtime.search(query), "search(" + JSON.stringify(query) + ")");
+        });
+    });
+} else {
+    var loaded;
+    if (prebuilt.format === "compact") {
+        loaded = loadScript("lunr-compact.js").loadCompactIndex(prebuilt);
+        compare(JSON.parse(JSON.stringify(loaded.toJSON())), JSON.parse(JSON.stringify(runtime.toJSON())), "index");
+    } else {
+        compare(JSON.parse(JSON.stringify(runtime.toJSON())), prebuilt.index, "index");
+        loaded = lunr.Index.load(prebuilt.index);
+    }
+
+    Object.keys(queries).forEach(function(query) {
+        compare(loaded.search(query), runtime.search(query), "search(" + JSON.stringify(query) + ")");
+    });
+}
+
+if (errors) {
+    console.error(errors + " difference(s) found");
+    process.exit(1);
+}
+
+console.log("Prebuilt index matches lunr.js (" + docs.length + " documents, " + Object.keys(queries).length + " queries)");
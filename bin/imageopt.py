@@ -0,0 +1,289 @@
+#!/usr/bin/env python2.7
+"""
+This module recompresses PNG, GIF and JPEG images without changing a single
+pixel, and makes smaller copies of them for `srcset`.
+
+The lossless part is pure Python:
+    * PNG: the text and timestamp chunks are dropped, and the image data is
+      compressed again with the best zlib settings we can find
+    * GIF: comments, and application blocks other than the animation loop
+      count, are dropped
+    * JPEG: comments and editor metadata (XMP, Photoshop, Ducky) are dropped
+
+Nothing that changes how the image looks (e.g. gamma, color profiles, or EXIF
+orientation) is removed.  If the result isn't smaller, the original is kept.
+
+The scaled copies need Pillow; `scale_image()` returns None without it.
+
+Usage:
+    data = imageopt.optimize_image(data, ".png")
+    width = imageopt.image_width(data)
+    smaller = imageopt.scale_image(data, ".png", 480)
+"""
+
+# Imports ######################################################################
+import zlib
+import struct
+from StringIO import StringIO
+
+try:
+    import PIL
+    from PIL import Image
+except ImportError:
+    Image = None
+
+
+# Metadata #####################################################################
+__author__ = "Timothy McFadden"
+__creationDate__ = "10/18/2026"
+__license__ = "MIT"
+
+
+# Globals ######################################################################
+# Bump this if the output changes, so cached results are made again
+OPTIMIZER_VERSION = 1
+
+PNG_SIGNATURE = "\x89PNG\r\n\x1a\n"
+
+# PNG chunks that don't change how the image looks
+PNG_DROP_CHUNKS = ["tEXt", "zTXt", "iTXt", "tIME"]
+
+# The zlib (level, memory level, strategy) tried on the PNG image data
+PNG_ZLIB_SETTINGS = [
+    (9, 9, zlib.Z_DEFAULT_STRATEGY),
+    (9, 9, zlib.Z_FILTERED),
+    (9, 8, zlib.Z_DEFAULT_STRATEGY)
+]
+
+# GIF application blocks that are kept (the animation loop count)
+GIF_KEEP_APPLICATIONS = ["NETSCAPE2.0", "ANIMEXTS1.0"]
+
+# JPEG markers (and the start of their data) that are dropped.  Anything else,
+# including EXIF (orientation), ICC profiles and Adobe (color transform), stays.
+JPEG_DROP_SEGMENTS = [
+    (0xFE, ""),
+    (0xE1, "http://ns.adobe.com/xap/1.0/\x00"),
+    (0xEC, "Ducky"),
+    (0xED, "Photoshop 3.0\x00")
+]
+
+# Part of the cache key of scaled copies
+PILLOW_VERSION = getattr(PIL, "__version__", "unknown") if Image else None
+
+# The Pillow format of the scaled copies of each type of image
+SCALE_FORMATS = {".png": "PNG", ".jpg": "JPEG", ".jpeg": "JPEG"}
+
+# The quality of scaled JPEG copies
+JPEG_QUALITY = 85
+
+
+def optimize_png(data):
+    """Returns the PNG with the text chunks dropped and the image data
+    recompressed, or None if it can't be read.
+    """
+    if not data.startswith(PNG_SIGNATURE):
+        return None
+
+    chunks = []
+    idat = []
+    position = len(PNG_SIGNATURE)
+    while position + 8 <= len(data):
+        length, kind = struct.unpack(">I4s", data[position:position + 8])
+        body = data[position + 8:position + 8 + length]
+        if len(body) != length:
+            return None
+
+        position += 12 + length
+        if kind == "IDAT":
+            if not idat:
+                chunks.append(("IDAT", None))
+            idat.append(body)
+        elif kind not in PNG_DROP_CHUNKS:
+            chunks.append((kind, body))
+
+        if kind == "IEND":
+            break
+
+    try:
+        raw = zlib.decompress("".join(idat))
+    except zlib.error:
+        return None
+
+    best = "".join(idat)
+    for level, memlevel, strategy in PNG_ZLIB_SETTINGS:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, 15, memlevel, strategy)
+        compressed = compressor.compress(raw) + compressor.flush()
+        if len(compressed) < len(best):
+            best = compressed
+
+    pieces = [PNG_SIGNATURE]
+    for kind, body in chunks:
+        body = best if (body is None) else body
+        crc = zlib.crc32(kind + body) & 0xFFFFFFFF
+        pieces.append(struct.pack(">I4s", len(body), kind) + body + struct.pack(">I", crc))
+
+    return "".join(pieces)
+
+
+def gif_sub_blocks(data, position):
+    """Returns the end of the data sub-blocks starting at `position`."""
+    while position < len(data):
+        size = ord(data[position])
+        position += 1 + size
+        if not size:
+            return position
+
+    raise ValueError("truncated GIF")
+
+
+def optimize_gif(data):
+    """Returns the GIF without comments and unknown application blocks, or
+    None if it can't be read.
+    """
+    if data[:6] not in ["GIF87a", "GIF89a"] or len(data) < 13:
+        return None
+
+    try:
+        flags = ord(data[10])
+        position = 13 + ((3 << ((flags & 7) + 1)) if (flags & 0x80) else 0)
+        pieces = [data[:position]]
+
+        while position < len(data):
+            block = data[position]
+            if block == "\x3B":
+                pieces.append(block)
+                break
+            elif block == "\x2C":
+                # An image: the descriptor, its color table, and its data
+                flags = ord(data[position + 9])
+                start = position
+                position += 10 + ((3 << ((flags & 7) + 1)) if (flags & 0x80) else 0)
+                position = gif_sub_blocks(data, position + 1)
+                pieces.append(data[start:position])
+            elif block == "\x21":
+                label = data[position + 1]
+                start = position
+                position = gif_sub_blocks(data, position + 2)
+                if label == "\xFE":
+                    continue
+                elif (label == "\xFF") and (data[start + 3:start + 14] not in GIF_KEEP_APPLICATIONS):
+                    continue
+                pieces.append(data[start:position])
+            else:
+                return None
+    except (IndexError, ValueError):
+        return None
+
+    return "".join(pieces)
+
+
+def optimize_jpeg(data):
+    """Returns the JPEG without comments and editor metadata, or None if it
+    can't be read.
+    """
+    if not data.startswith("\xFF\xD8"):
+        return None
+
+    pieces = [data[:2]]
+    position = 2
+    while position + 4 <= len(data):
+        if data[position] != "\xFF":
+            return None
+
+        marker = ord(data[position + 1])
+        if marker == 0xFF:
+            # Fill byte
+            position += 1
+            continue
+        elif marker == 0xDA:
+            # The compressed image data (and everything after it) is kept
+            pieces.append(data[position:])
+            return "".join(pieces)
+
+        length = struct.unpack(">H", data[position + 2:position + 4])[0]
+        body = data[position + 4:position + 2 + length]
+        segment = data[position:position + 2 + length]
+        position += 2 + length
+
+        if not any((marker == x) and body.startswith(prefix) for x, prefix in JPEG_DROP_SEGMENTS):
+            pieces.append(segment)
+
+    return None
+
+
+# The optimizer for each type of image
+OPTIMIZERS = {
+    ".png": optimize_png,
+    ".gif": optimize_gif,
+    ".jpg": optimize_jpeg,
+    ".jpeg": optimize_jpeg
+}
+
+
+def optimize_image(data, extension):
+    """Returns the image recompressed without losing anything, or the original
+    if that's not smaller (or it's not an image we know).
+    """
+    optimizer = OPTIMIZERS.get(extension.lower())
+    optimized = optimizer(data) if optimizer else None
+    if (optimized is None) or (len(optimized) >= len(data)):
+        return data
+
+    return optimized
+
+
+def open_image(data, load=True):
+    """Returns the Pillow image, or None if Pillow isn't installed or can't
+    read it.  Unless `load` is set, only the header is read.
+    """
+    if Image is None:
+        return None
+
+    try:
+        image = Image.open(StringIO(data))
+        if load:
+            image.load()
+    except Exception:
+        return None
+
+    return image
+
+
+def image_width(data):
+    """Returns the width of the image, or None if it can't be read (or Pillow
+    isn't installed).
+    """
+    image = open_image(data, load=False)
+    return image.size[0] if image else None
+
+
+def scale_image(data, extension, width):
+    """Returns a copy of the image scaled down to `width`, or None if it's not
+    wider than that, can't be scaled (animations, and images with an EXIF
+    orientation), or Pillow isn't installed.
+    """
+    image_format = SCALE_FORMATS.get(extension.lower())
+    image = open_image(data) if image_format else None
+    if (not image) or (image.size[0] <= width) or getattr(image, "is_animated", False):
+        return None
+
+    exif = image.getexif() if hasattr(image, "getexif") else {}
+    if exif.get(0x0112, 1) != 1:
+        return None
+
+    height = max(1, int(round(image.size[1] * float(width) / image.size[0])))
+    options = {"optimize": True}
+    if image.info.get("icc_profile"):
+        options["icc_profile"] = image.info["icc_profile"]
+
+    if image_format == "JPEG":
+        options.update(quality=JPEG_QUALITY, progressive=True)
+        if image.mode not in ["RGB", "L", "CMYK"]:
+            image = image.convert("RGB")
+    elif image.mode not in ["RGB", "RGBA", "L", "LA"]:
+        # Scaling needs the real colors (not a palette)
+        image = image.convert("RGBA")
+
+    fh = StringIO()
+    image.resize((width, height), Image.LANCZOS).save(fh, image_format, **options)
+    return optimize_image(fh.getvalue(), extension)
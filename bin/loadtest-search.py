@@ -0,0 +1,170 @@
+#!/usr/bin/env python2.7
+"""
+This script load tests the search service in lunrsearch.py.
+
+Queries are made from the index itself (every token, the first few characters
+of each token, and every title), shuffled, and sent by a number of concurrent
+clients.  The latency percentiles and the number of queries per second are
+reported.
+
+By default, a server is started in this process on a free port.  Use --url to
+test one that's already running (e.g. `lunrsearch.py serve`), or --library to
+call `SearchIndex.search()` directly and leave HTTP out of it.
+"""
+
+# Imports ######################################################################
+import os
+import sys
+import json
+import time
+import random
+import urllib
+import urllib2
+import argparse
+import threading
+
+import lunrsearch
+
+
+# Metadata #####################################################################
+__author__ = "Timothy McFadden"
+__creationDate__ = "10/18/2026"
+__license__ = "MIT"
+
+
+# Globals ######################################################################
+PERCENTILES = [50, 90, 99]
+
+
+def get_args():
+    """Parse the command-line arguments."""
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--index', help="Path to the index written by make-search-index.py", type=str, default=lunrsearch.INDEX_FILE)
+    parser.add_argument('--url', help="Base URL of a running search service (e.g. http://127.0.0.1:8080)", type=str, default=None)
+    parser.add_argument("--library", help="Call the library directly instead of going through HTTP", action="store_true")
+    parser.add_argument('--requests', help="Total number of queries to send", type=int, default=2000)
+    parser.add_argument('--concurrency', help="Number of concurrent clients", type=int, default=8)
+    parser.add_argument('--cache-size', help="Size of the query cache, for the in-process index (0 disables it)", type=int, default=lunrsearch.CACHE_SIZE)
+    parser.add_argument('--seed', help="Seed used to shuffle the queries", type=int, default=0)
+    parser.add_argument('--output', help="Also write the results to this JSON file", type=str, default=None)
+    return parser.parse_args()
+
+
+def make_queries(index, count, seed=0):
+    """Returns `count` queries made from the tokens and titles in the index."""
+    queries = []
+    for token in index.corpus_tokens:
+        queries.append(token)
+        queries.append(token[:3])
+    queries.extend(x for x in index.titles.values() if x)
+
+    rng = random.Random(seed)
+    return [rng.choice(queries) for _ in range(count)]
+
+
+def percentile(values, percent):
+    """Returns the `percent` percentile of a sorted, non-empty list."""
+    position = int(round(percent / 100.0 * (len(values) - 1)))
+    return values[position]
+
+
+def run(queries, concurrency, search):
+    """Runs `search(query)` for each query from `concurrency` threads.  Returns
+    the sorted latencies (in seconds), the total time taken, and the number of
+    errors.
+    """
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    remaining = list(reversed(queries))
+
+    def client():
+        while True:
+            with lock:
+                if not remaining:
+                    return
+                query = remaining.pop()
+
+            tstart = time.time()
+            try:
+                search(query)
+            except Exception:
+                with lock:
+                    errors[0] += 1
+                continue
+
+            elapsed = time.time() - tstart
+            with lock:
+                latencies.append(elapsed)
+
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    tstart = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    return sorted(latencies), time.time() - tstart, errors[0]
+
+
+def http_search(base_url):
+    """Returns a function that sends a query to the service at `base_url`."""
+    def search(query):
+        url = "%s/search?%s" % (base_url.rstrip("/"), urllib.urlencode({"q": query.encode("utf-8")}))
+        return json.load(urllib2.urlopen(url))
+
+    return search
+
+
+if __name__ == '__main__':
+    args = get_args()
+    index = lunrsearch.SearchIndex.load(args.index, args.cache_size)
+    queries = make_queries(index, args.requests, args.seed)
+    server = None
+
+    if args.library:
+        mode = "library"
+        search = index.search
+    elif args.url:
+        mode = args.url
+        search = http_search(args.url)
+    else:
+        server = lunrsearch.SearchServer(("127.0.0.1", 0), index, quiet=True)
+        threading.Thread(target=server.serve_forever).start()
+        mode = "http://127.0.0.1:%i" % server.server_port
+        search = http_search(mode)
+
+    try:
+        latencies, elapsed, errors = run(queries, args.concurrency, search)
+    finally:
+        if server:
+            server.shutdown()
+
+    if not latencies:
+        sys.exit("Every query failed!")
+
+    results = {
+        "target": mode,
+        "requests": len(queries),
+        "concurrency": args.concurrency,
+        "errors": errors,
+        "seconds": elapsed,
+        "qps": len(latencies) / elapsed,
+        "mean_ms": 1000.0 * sum(latencies) / len(latencies)
+    }
+    for percent in PERCENTILES:
+        results["p%i_ms" % percent] = 1000.0 * percentile(latencies, percent)
+
+    print "Sent [%i] queries to [%s] with [%i] clients in [%0.2fs]" % (len(queries), mode, args.concurrency, elapsed)
+    print "    %10s: %10.01f" % ("qps", results["qps"])
+    print "    %10s: %10.03fms" % ("mean", results["mean_ms"])
+    for percent in PERCENTILES:
+        print "    %10s: %10.03fms" % ("p%i" % percent, results["p%i_ms" % percent])
+    if errors:
+        print "    %10s: %10i" % ("errors", errors)
+    if server or args.library:
+        print "    %10s: %s" % ("cache", index.cache.stats())
+
+    if args.output:
+        with open(args.output, "wb") as fh:
+            json.dump(results, fh, indent=4, sort_keys=True)
@@ -0,0 +1,361 @@
+#!/usr/bin/env python2.7
+"""
+This module builds a Lunr.js (0.5.x) search index in Python, so the browser can
+load a ready-made index with `lunr.Index.load()` instead of indexing every
+document itself.
+
+The text processing pipeline (tokenizer, trimmer, stop word filter, and Porter
+stemmer) is a straight port of the one shipped in `lunr.min.js`.  The term
+frequencies are calculated the same way `lunr.Index.prototype.add()` does it,
+so a prebuilt index is the same as one built in the browser.
+"""
+
+# Imports ######################################################################
+import re
+import math
+
+
+# Metadata #####################################################################
+__author__ = "Timothy McFadden"
+__creationDate__ = "10/18/2026"
+__license__ = "MIT"
+
+
+# Globals ######################################################################
+# The version of lunr.js that the serialized index is meant for.
+LUNR_VERSION = "0.5.11"
+
+# The fields (and their boosts) used for the search, and the field used as the
+# reference for each document.  These must match `lunr-search.js`.
+FIELDS = [("title", 10), ("tags", 5), ("content", 1)]
+REF = "href"
+
+# The labels of the functions in `lunr.Pipeline`, in order.
+PIPELINE = ["trimmer", "stopWordFilter", "stemmer"]
+
+# The lunr.js stopWordFilter.stopWords array.
+STOP_WORDS = frozenset(["", "a", "able", "about", "across", "after", "all", "almost", "also", "am", "among", "an", "and", "any", "are", "as", "at", "be", "because", "been", "but", "by", "can", "cannot", "could", "dear", "did", "do", "does", "either", "else", "ever", "every", "for", "from", "get", "got", "had", "has", "have", "he", "her", "hers", "him", "his", "how", "however", "i", "if", "in", "into", "is", "it", "its", "just", "least", "let", "like", "likely", "may", "me", "might", "most", "must", "my", "neither", "no", "nor", "not", "of", "off", "often", "on", "only", "or", "other", "our", "own", "rather", "said", "say", "says", "she", "should", "since", "so", "some", "than", "that", "the", "their", "them", "then", "there", "these", "they", "this", "tis", "to", "too", "twas", "us", "wants", "was", "we", "were", "what", "when", "where", "which", "while", "who", "whom", "why", "will", "with", "would", "yet", "you", "your"])
+
+# JavaScript's `\s`, which is what `String.prototype.trim()` and the tokenizer use.
+JS_WHITESPACE = u"\t\n\x0b\x0c\r \xa0\u1680" + u"".join(unichr(x) for x in range(0x2000, 0x200b)) + u"\u2028\u2029\u202f\u205f\u3000\ufeff"
+TOKEN_SEPARATOR_RE = re.compile(u"[%s\\-]+" % JS_WHITESPACE)
+LEADING_NON_WORD_RE = re.compile(r"^\W+")
+TRAILING_NON_WORD_RE = re.compile(r"\W+$")
+
+# Porter stemmer tables and patterns (see `lunr.stemmer`)
+STEP2_LIST = {
+    "ational": "ate", "tional": "tion", "enci": "ence", "anci": "ance",
+    "izer": "ize", "bli": "ble", "alli": "al", "entli": "ent", "eli": "e",
+    "ousli": "ous", "ization": "ize", "ation": "ate", "ator": "ate",
+    "alism": "al", "iveness": "ive", "fulness": "ful", "ousness": "ous",
+    "aliti": "al", "iviti": "ive", "biliti": "ble", "logi": "log"
+}
+STEP3_LIST = {
+    "icate": "ic", "ative": "", "alize": "al", "iciti": "ic", "ical": "ic",
+    "ful": "", "ness": ""
+}
+
+_C = "[^aeiou]"            # consonant
+_V = "[aeiouy]"            # vowel
+_CS = _C + "[^aeiouy]*"    # consonant sequence
+_VS = _V + "[aeiou]*"      # vowel sequence
+
+MGR0_RE = re.compile("^(" + _CS + ")?" + _VS + _CS)                            # [C]VC... is m>0
+MEQ1_RE = re.compile("^(" + _CS + ")?" + _VS + _CS + "(" + _VS + ")?$")        # [C]VC[V] is m=1
+MGR1_RE = re.compile("^(" + _CS + ")?" + _VS + _CS + _VS + _CS)                # [C]VCVC... is m>1
+S_V_RE = re.compile("^(" + _CS + ")?" + _V)                                    # vowel in stem
+
+STEP1A_RE = re.compile("^(.+?)(ss|i)es$")
+STEP1A_2_RE = re.compile("^(.+?)([^s])s$")
+STEP1B_RE = re.compile("^(.+?)eed$")
+STEP1B_2_RE = re.compile("^(.+?)(ed|ing)$")
+STEP1B_3_RE = re.compile("(at|bl|iz)$")
+STEP1B_4_RE = re.compile(r"([^aeiouylsz])\1$")
+STEP1B_5_RE = re.compile("^" + _CS + _V + "[^aeiouwxy]$")
+STEP1C_RE = re.compile("^(.+?[^aeiou])y$")
+STEP2_RE = re.compile("^(.+?)(ational|tional|enci|anci|izer|bli|alli|entli|eli|ousli|ization|ation|ator|alism|iveness|fulness|ousness|aliti|iviti|biliti|logi)$")
+STEP3_RE = re.compile("^(.+?)(icate|ative|alize|iciti|ical|ful|ness)$")
+STEP4_RE = re.compile("^(.+?)(al|ance|ence|er|ic|able|ible|ant|ement|ment|ent|ou|ism|ate|iti|ous|ive|ize)$")
+STEP4_2_RE = re.compile("^(.+?)(s|t)(ion)$")
+STEP5_RE = re.compile("^(.+?)e$")
+STEP5_2_RE = re.compile("ll$")
+STEP5_3_RE = re.compile("^" + _CS + _V + "[^aeiouwxy]$")
+
+
+def to_unicode(text):
+    """Returns `text` as a unicode string (byte strings are assumed to be UTF-8)."""
+    if isinstance(text, str):
+        return text.decode("utf-8")
+
+    return text
+
+
+def tokenizer(obj):
+    """Splits a field into tokens the same way `lunr.tokenizer` does.  Lists
+    (e.g. tags) are only lower-cased.
+    """
+    if obj is None:
+        return []
+    elif isinstance(obj, (list, tuple)):
+        return [to_unicode(x).lower() for x in obj]
+
+    return TOKEN_SEPARATOR_RE.split(to_unicode(obj).strip(JS_WHITESPACE).lower())
+
+
+def trimmer(token):
+    """Removes leading and trailing non-word characters."""
+    return TRAILING_NON_WORD_RE.sub("", LEADING_NON_WORD_RE.sub("", token))
+
+
+def stop_word_filter(token):
+    """Returns None if the token is a stop word; the token otherwise."""
+    if token in STOP_WORDS:
+        return None
+
+    return token
+
+
+def stemmer(w):
+    """Reduces a word to its stem using the Porter stemming algorithm, exactly
+    as `lunr.stemmer` does.
+    """
+    if len(w) < 3:
+        return w
+
+    firstch = w[0]
+    if firstch == "y":
+        w = firstch.upper() + w[1:]
+
+    # Step 1a
+    if STEP1A_RE.search(w):
+        w = STEP1A_RE.sub(r"\1\2", w, 1)
+    elif STEP1A_2_RE.search(w):
+        w = STEP1A_2_RE.sub(r"\1\2", w, 1)
+
+    # Step 1b
+    match = STEP1B_RE.search(w)
+    if match:
+        if MGR0_RE.search(match.group(1)):
+            w = w[:-1]
+    else:
+        match = STEP1B_2_RE.search(w)
+        if match:
+            stem = match.group(1)
+            if S_V_RE.search(stem):
+                w = stem
+                if STEP1B_3_RE.search(w):
+                    w += "e"
+                elif STEP1B_4_RE.search(w):
+                    w = w[:-1]
+                elif STEP1B_5_RE.search(w):
+                    w += "e"
+
+    # Step 1c
+    match = STEP1C_RE.search(w)
+    if match:
+        w = match.group(1) + "i"
+
+    # Step 2
+    match = STEP2_RE.search(w)
+    if match and MGR0_RE.search(match.group(1)):
+        w = match.group(1) + STEP2_LIST[match.group(2)]
+
+    # Step 3
+    match = STEP3_RE.search(w)
+    if match and MGR0_RE.search(match.group(1)):
+        w = match.group(1) + STEP3_LIST[match.group(2)]
+
+    # Step 4
+    match = STEP4_RE.search(w)
+    if match:
+        if MGR1_RE.search(match.group(1)):
+            w = match.group(1)
+    else:
+        match = STEP4_2_RE.search(w)
+        if match:
+            stem = match.group(1) + match.group(2)
+            if MGR1_RE.search(stem):
+                w = stem
+
+    # Step 5
+    match = STEP5_RE.search(w)
+    if match:
+        stem = match.group(1)
+        if MGR1_RE.search(stem) or (MEQ1_RE.search(stem) and not STEP5_3_RE.search(stem)):
+            w = stem
+
+    if STEP5_2_RE.search(w) and MGR1_RE.search(w):
+        w = w[:-1]
+
+    # ...and turn the initial Y back into y
+    if firstch == "y":
+        w = firstch.lower() + w[1:]
+
+    return w
+
+
+def pipeline(tokens):
+    """Runs the tokens through the trimmer, stop word filter, and stemmer.
+    Tokens that are filtered out are dropped from the result.
+    """
+    result = []
+    for token in tokens:
+        token = stop_word_filter(trimmer(token))
+        if token is not None:
+            result.append(stemmer(token))
+
+    return result
+
+
+class Index(object):
+    """A Lunr.js index that is built in Python.  Documents are added with
+    `add()`, and the result is serialized with `to_json()` in the format
+    expected by `lunr.Index.load()`, or with `to_compact()`.
+    """
+    def __init__(self, fields=FIELDS, ref=REF):
+        self.fields = fields
+        self.ref = ref
+        self.refs = []               # the refs, in the order they were added
+        self.document_store = {}     # ref -> sorted list of tokens
+        self.field_lengths = {}      # ref -> [number of tokens in each field]
+        self.token_store = {}        # token -> {ref: tf}
+        self.token_counts = {}       # token -> {ref: [count in each field]}
+        self.token_store_length = 0
+
+    def add(self, doc):
+        """Adds a document (a dictionary with the ref and field names as keys)
+        to the index.
+        """
+        doc_ref = to_unicode(doc[self.ref])
+        doc_tokens = {}
+        all_tokens = set()
+
+        for name, _ in self.fields:
+            tokens = pipeline(tokenizer(doc.get(name)))
+            doc_tokens[name] = tokens
+            all_tokens.update(tokens)
+
+        all_tokens = sorted(all_tokens)
+        if doc_ref not in self.document_store:
+            self.refs.append(doc_ref)
+        self.document_store[doc_ref] = all_tokens
+        self.field_lengths[doc_ref] = [len(doc_tokens[name]) for name, _ in self.fields]
+
+        for token in all_tokens:
+            # The order of operations here must match lunr.js so the floats
+            # come out the same.
+            tf = 0
+            for name, boost in self.fields:
+                field_length = len(doc_tokens[name])
+                if not field_length:
+                    continue
+
+                tf = tf + float(doc_tokens[name].count(token)) / field_length * boost
+
+            self.token_store.setdefault(token, {})[doc_ref] = tf
+            self.token_counts.setdefault(token, {})[doc_ref] = [doc_tokens[name].count(token) for name, _ in self.fields]
+            self.token_store_length += 1
+
+    def idf(self, token):
+        """Returns the inverse document frequency of a token, as calculated by
+        `lunr.Index.prototype.idf()`.
+        """
+        return 1 + math.log(float(len(self.document_store)) / len(self.token_store[token]))
+
+    def magnitudes(self):
+        """Returns the magnitude of each document's vector (keyed by ref).  This
+        is what `lunr.Vector.prototype.similarity()` divides by, and lets a
+        client score a document without having every one of its tokens.
+        """
+        idf = dict((token, self.idf(token)) for token in self.token_store)
+        result = {}
+
+        for doc_ref, tokens in self.document_store.items():
+            total = 0
+            for token in tokens:
+                value = self.token_store[token][doc_ref] * idf[token]
+                total += value * value
+
+            result[doc_ref] = math.sqrt(total)
+
+        return result
+
+    def shards(self, prefix_length):
+        """Splits the token store by the first `prefix_length` characters of
+        each token.  Returns a dictionary of {prefix: {token: {ref: tf}}}.
+        """
+        result = {}
+        for token, docs in self.token_store.items():
+            result.setdefault(token[:prefix_length], {})[token] = docs
+
+        return result
+
+    def corpus_tokens(self):
+        """Returns the sorted list of every token in the index."""
+        return sorted(self.token_store)
+
+    def token_trie(self):
+        """Returns the token store as the character trie used by `lunr.TokenStore`."""
+        root = {"docs": {}}
+        for token, docs in self.token_store.items():
+            node = root
+            for char in token:
+                node = node.setdefault(char, {"docs": {}})
+
+            for doc_ref, tf in docs.items():
+                node["docs"][doc_ref] = {"ref": doc_ref, "tf": tf}
+
+        return root
+
+    def to_json(self):
+        """Returns the index in the format used by `lunr.Index.prototype.toJSON()`."""
+        return {
+            "version": LUNR_VERSION,
+            "fields": [{"name": name, "boost": boost} for name, boost in self.fields],
+            "ref": self.ref,
+            "documentStore": {
+                "store": self.document_store,
+                "length": len(self.document_store)
+            },
+            "tokenStore": {
+                "root": self.token_trie(),
+                "length": self.token_store_length
+            },
+            "corpusTokens": self.corpus_tokens(),
+            "pipeline": PIPELINE
+        }
+
+    def to_compact(self):
+        """Returns the index in a compact form:
+
+            refs:     The refs; a document's ID is its position in this list
+            lengths:  The number of tokens in each field of each document
+            terms:    The sorted list of tokens
+            postings: For each term, a flat list of (ID delta, count in each
+                      field) for every document containing it
+
+        The term frequencies aren't stored; the client calculates them from
+        the counts and lengths exactly as `lunr.Index.prototype.add()` does.
+        """
+        ids = dict((doc_ref, i) for i, doc_ref in enumerate(self.refs))
+        terms = self.corpus_tokens()
+        postings = []
+
+        for term in terms:
+            counts = self.token_counts[term]
+            flat = []
+            previous = 0
+
+            for doc_id in sorted(ids[x] for x in counts):
+                flat.append(doc_id - previous)
+                flat.extend(counts[self.refs[doc_id]])
+                previous = doc_id
+
+            postings.append(flat)
+
+        return {
+            "refs": self.refs,
+            "lengths": [self.field_lengths[x] for x in self.refs],
+            "terms": terms,
+            "postings": postings
+        }
@@ -0,0 +1,372 @@
+#!/usr/bin/env python2.7
+"""
+This module searches the index written by make-search-index.py on the server,
+so visitors don't have to download the whole index to search a large site.
+
+Any of the index formats (lunr, compact, sharded, or raw) can be loaded into an
+in-memory inverted index.  Queries go through the same pipeline, and documents
+are scored exactly the way `lunr.Index.prototype.search()` does it, using the
+title/tags/content boosts stored in the index.  Results are kept in an LRU
+cache.
+
+It can be used as a library:
+
+    index = lunrsearch.SearchIndex.load("site/static/js/lunr-index.json")
+    for result in index.search("python"):
+        print result["ref"], result["score"], result["title"]
+
+...from the command line:
+
+    python lunrsearch.py search python
+    python lunrsearch.py serve --port 8080
+
+...or over HTTP (`serve`), which answers `GET /search?q=python&limit=10` with
+JSON, and `GET /stats` with the cache statistics.
+"""
+
+# Imports ######################################################################
+import os
+import sys
+import json
+import math
+import bisect
+import urlparse
+import argparse
+import threading
+import collections
+import BaseHTTPServer
+import SocketServer
+
+import lunrindex
+
+
+# Metadata #####################################################################
+__author__ = "Timothy McFadden"
+__creationDate__ = "10/18/2026"
+__license__ = "MIT"
+
+
+# Globals ######################################################################
+THIS_DIR = os.path.abspath(os.path.dirname(__file__))
+INDEX_FILE = os.path.join(THIS_DIR, "..", "site", "static", "js", "lunr-index.json")
+
+# The number of query results kept in the LRU cache
+CACHE_SIZE = 1024
+
+# The default number of results returned over HTTP
+RESULT_LIMIT = 10
+
+
+def get_args():
+    """Parse the command-line arguments."""
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--index', help="Path to the index written by make-search-index.py", type=str, default=INDEX_FILE)
+    parser.add_argument('--cache-size', help="Number of query results to cache", type=int, default=CACHE_SIZE)
+    subparsers = parser.add_subparsers(dest="command")
+
+    search = subparsers.add_parser("search", help="Search the index")
+    search.add_argument("query", help="What to search for", nargs="+")
+    search.add_argument('--limit', help="Maximum number of results (0 for all)", type=int, default=0)
+    search.add_argument("--json", help="Print the results as JSON", action="store_true")
+
+    serve = subparsers.add_parser("serve", help="Serve searches over HTTP")
+    serve.add_argument('--host', help="Address to listen on", type=str, default="127.0.0.1")
+    serve.add_argument('--port', help="Port to listen on", type=int, default=8080)
+    serve.add_argument("--quiet", help="Don't log each request", action="store_true")
+
+    return parser.parse_args()
+
+
+class LRUCache(object):
+    """A thread-safe, size-bounded cache that throws away the least recently
+    used entries first.
+    """
+    def __init__(self, size=CACHE_SIZE):
+        self.size = size
+        self.items = collections.OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """Returns the cached value, or None."""
+        with self.lock:
+            value = self.items.pop(key, None)
+            if value is None:
+                self.misses += 1
+                return None
+
+            # Move it to the end (the most recently used)
+            self.items[key] = value
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        """Caches `value`, evicting the least recently used entry if needed."""
+        if self.size <= 0:
+            return
+
+        with self.lock:
+            self.items.pop(key, None)
+            self.items[key] = value
+            while len(self.items) > self.size:
+                self.items.popitem(last=False)
+
+    def stats(self):
+        """Returns the cache statistics."""
+        with self.lock:
+            return {"size": len(self.items), "max_size": self.size, "hits": self.hits, "misses": self.misses}
+
+
+class SearchIndex(object):
+    """An in-memory inverted index of {token: {ref: tf}}, searched the same
+    way as lunr.js.  Use `load()` to read an index file.
+    """
+    def __init__(self, token_store, titles, fields=lunrindex.FIELDS, cache_size=CACHE_SIZE):
+        self.token_store = token_store
+        self.titles = titles
+        self.fields = fields
+        self.field_boosts = sum(boost for _, boost in fields)
+        self.corpus_tokens = sorted(token_store)
+        self.positions = dict((token, i) for i, token in enumerate(self.corpus_tokens))
+        self.cache = LRUCache(cache_size)
+
+        self.document_count = len(titles)
+        self.idfs = dict(
+            (token, 1 + math.log(float(self.document_count) / len(docs)))
+            for token, docs in token_store.items()
+        )
+
+        squares = dict((x, 0) for x in titles)
+        for token in self.corpus_tokens:
+            idf = self.idfs[token]
+            for doc_ref, tf in self.token_store[token].items():
+                squares[doc_ref] += (tf * idf) * (tf * idf)
+        self.magnitudes = dict((x, math.sqrt(total)) for x, total in squares.items())
+
+    @classmethod
+    def load(cls, path, cache_size=CACHE_SIZE):
+        """Loads an index in any of the formats written by make-search-index.py."""
+        with open(path, "rb") as fh:
+            data = json.load(fh)
+
+        if isinstance(data, list):
+            return cls.from_documents(data, cache_size)
+
+        fmt = data.get("format")
+        if fmt == "compact":
+            return cls.from_compact(data, cache_size)
+        elif fmt == "sharded":
+            return cls.from_sharded(data, os.path.dirname(os.path.abspath(path)), cache_size)
+
+        return cls.from_lunr(data, cache_size)
+
+    @classmethod
+    def from_documents(cls, docs, cache_size=CACHE_SIZE):
+        """Indexes the raw documents (`--format raw`)."""
+        index = lunrindex.Index()
+        titles = {}
+        for doc in docs:
+            index.add(doc)
+            titles[lunrindex.to_unicode(doc[index.ref])] = doc["title"]
+
+        return cls(index.token_store, titles, index.fields, cache_size)
+
+    @classmethod
+    def from_lunr(cls, data, cache_size=CACHE_SIZE):
+        """Loads a serialized lunr.Index (`--format lunr`)."""
+        token_store = {}
+        stack = [(u"", data["index"]["tokenStore"]["root"])]
+        while stack:
+            token, node = stack.pop()
+            if node["docs"]:
+                token_store[token] = dict((ref, x["tf"]) for ref, x in node["docs"].items())
+            for char, child in node.items():
+                if char != "docs":
+                    stack.append((token + char, child))
+
+        return cls(token_store, data["titles"], fields_of(data["index"]), cache_size)
+
+    @classmethod
+    def from_compact(cls, data, cache_size=CACHE_SIZE):
+        """Loads a compact index (`--format compact`), calculating the term
+        frequencies the same way lunr-compact.js does.
+        """
+        fields = fields_of(data)
+        width = len(fields) + 1
+        token_store = {}
+
+        for term, postings in zip(data["terms"], data["postings"]):
+            docs = token_store[term] = {}
+            doc_id = 0
+            for j in range(0, len(postings), width):
+                doc_id += postings[j]
+                lengths = data["lengths"][doc_id]
+                tf = 0
+                for k, (_, boost) in enumerate(fields):
+                    if lengths[k]:
+                        tf = tf + float(postings[j + 1 + k]) / lengths[k] * boost
+                docs[data["docs"][doc_id][0]] = tf
+
+        titles = dict((href, title) for href, title in data["docs"])
+        return cls(token_store, titles, fields, cache_size)
+
+    @classmethod
+    def from_sharded(cls, data, basedir, cache_size=CACHE_SIZE):
+        """Loads a sharded index (`--format sharded`) and all of its shards.
+        Shard URLs are relative to the folder holding the manifest.
+        """
+        token_store = {}
+        for url in data["shards"].values():
+            with open(os.path.join(basedir, *url.split("/")), "rb") as fh:
+                token_store.update(json.load(fh))
+
+        titles = dict((x["href"], x["title"]) for x in data["docs"])
+        return cls(token_store, titles, fields_of(data), cache_size)
+
+    def expand(self, token):
+        """Returns the tokens in the index that start with `token`, in order."""
+        start = bisect.bisect_left(self.corpus_tokens, token)
+        end = start
+        while (end < len(self.corpus_tokens)) and self.corpus_tokens[end].startswith(token):
+            end += 1
+
+        return self.corpus_tokens[start:end]
+
+    def search(self, query, limit=0):
+        """Searches the index.  Returns a list of {"ref", "score", "title"}
+        dictionaries, best first (at most `limit` of them, if non-zero).
+        """
+        results = self.cache.get(query)
+        if results is None:
+            results = self.score(lunrindex.pipeline(lunrindex.tokenizer(query)))
+            self.cache.put(query, results)
+
+        return results[:limit] if limit else list(results)
+
+    def score(self, tokens):
+        """Scores the documents matching every token, exactly as
+        `lunr.Index.prototype.search()` does it.
+        """
+        if not tokens:
+            return []
+
+        tf = 1.0 / len(tokens) * len(self.fields) * self.field_boosts
+        query_vector = []
+        document_sets = []
+
+        for token in tokens:
+            matches = set()
+            for key in self.expand(token):
+                similarity_boost = 1
+                # Expanded keys score lower than exact matches
+                if key != token:
+                    similarity_boost = 1 / math.log(max(3, len(key) - len(token)))
+
+                query_vector.append((self.positions[key], key, tf * self.idfs[key] * similarity_boost))
+                matches.update(self.token_store[key])
+
+            document_sets.append(matches)
+
+        refs = set.intersection(*document_sets)
+        if not refs:
+            return []
+
+        # Keep the vector in corpus-token order, like lunr.Vector (the sort is
+        # stable, so repeated keys stay in the order they were added).
+        query_vector.sort(key=lambda x: x[0])
+        query_magnitude = math.sqrt(sum(x[2] * x[2] for x in query_vector))
+
+        results = []
+        for doc_ref in sorted(refs):
+            dot = 0
+            previous = None
+            for _, key, value in query_vector:
+                # Like lunr.Vector.prototype.dot(), each document token only
+                # matches the first of any repeated query keys.
+                if (key != previous) and (doc_ref in self.token_store[key]):
+                    dot += value * (self.token_store[key][doc_ref] * self.idfs[key])
+                previous = key
+
+            results.append({
+                "ref": doc_ref,
+                "score": dot / (query_magnitude * self.magnitudes[doc_ref]),
+                "title": self.titles.get(doc_ref)
+            })
+
+        results.sort(key=lambda x: -x["score"])
+        return results
+
+
+def fields_of(settings):
+    """Returns the [(name, boost), ...] fields stored in an index."""
+    return [(x["name"], x["boost"]) for x in settings["fields"]]
+
+
+class SearchHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """Answers `GET /search?q=...&limit=N` and `GET /stats` with JSON."""
+    server_version = "lunrsearch/1.0"
+
+    def do_GET(self):
+        url = urlparse.urlparse(self.path)
+        params = urlparse.parse_qs(url.query)
+
+        if url.path == "/search":
+            query = params.get("q", [""])[0].decode("utf-8", "replace")
+            try:
+                limit = int(params.get("limit", [RESULT_LIMIT])[0])
+            except ValueError:
+                return self.send_json(400, {"error": "limit must be an integer"})
+
+            results = self.server.index.search(query, limit)
+            self.send_json(200, {"query": query, "results": results})
+        elif url.path == "/stats":
+            self.send_json(200, {"documents": self.server.index.document_count, "cache": self.server.index.cache.stats()})
+        else:
+            self.send_json(404, {"error": "not found"})
+
+    def send_json(self, status, data):
+        """Sends `data` as the JSON response."""
+        body = json.dumps(data)
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Access-Control-Allow-Origin", "*")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        if not self.server.quiet:
+            BaseHTTPServer.BaseHTTPRequestHandler.log_message(self, format, *args)
+
+
+class SearchServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    """An HTTP server that handles each request in its own thread."""
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, index, quiet=False):
+        BaseHTTPServer.HTTPServer.__init__(self, address, SearchHandler)
+        self.index = index
+        self.quiet = quiet
+
+
+if __name__ == '__main__':
+    args = get_args()
+    index = SearchIndex.load(args.index, args.cache_size)
+
+    if args.command == "search":
+        results = index.search(" ".join(args.query).decode(sys.stdin.encoding or "utf-8"), args.limit)
+        if args.json:
+            print json.dumps(results, indent=4)
+        else:
+            for result in results:
+                print "%8.04f  %-40s %s" % (result["score"], result["ref"], result["title"])
+            print "[%i] results" % len(results)
+    else:
+        server = SearchServer((args.host, args.port), index, args.quiet)
+        print "Serving [%i] documents at http://%s:%i/search?q=" % (index.document_count, args.host, server.server_port)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
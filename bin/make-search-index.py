@@ -4,6 +4,30 @@ This script is used to generate a JSON index file of all of the Markdown content
 used by Hugo for use with Lunr.js.  This should be run prior to building the
 static files.
 
+By default (`--format compact`) the index is built here and written as a
+sorted term dictionary with delta-encoded integer postings, which the browser
+turns into a Lunr index without re-indexing.  It's about the same size as the
+plain documents once gzipped.
+
+`--format lunr` writes the Lunr.js index itself (see lunrindex.py), so the
+browser only has to load it, but it's several times larger.  Use `--format raw`
+to write the plain list of documents instead, leaving the indexing to the
+browser.
+
+`--format sharded` splits the index into fingerprinted shards by token prefix,
+with a small manifest written to --outfile.  The browser then only downloads
+the shards needed by what's been typed into the search box.
+
+`--prettyprint` only applies to `--format raw`; the prebuilt indexes are never
+indented, since they're only read by the browser.
+
+`--max-terms` and `--min-score` weight the keywords of each document with BM25
+across the whole corpus, and only keep the best of them (see
+`score_documents()`).
+
+`--precompress` writes gzip (and, if the `brotli` module is installed, brotli)
+copies of each file next to it.
+
 NOTE: Only TOML is supported, and "draft" content is not considered.
 """
 
@@ -11,9 +35,19 @@ NOTE: Only TOML is supported, and "draft" content is not considered.
 import os
 import re
 import json
+import math
+import sys
 import time
+import types
 import argparse
 import operator
+import tempfile
+import subprocess
+from hashlib import md5
+
+import lunrindex
+import buildstats
+import buildutils
 
 
 # Metadata #####################################################################
@@ -27,6 +61,27 @@ THIS_DIR = os.path.abspath(os.path.dirname(__file__))
 CONTENT_DIR = os.path.join(THIS_DIR, "..", "site", "content")
 OUTFILE = os.path.join(THIS_DIR, "..", "site", "static", "js", "lunr-index.json")
 
+# This node script compares our prebuilt index against one built by lunr.js
+CHECK_SCRIPT = os.path.join(THIS_DIR, "check-lunr-index.js")
+
+# When using `--format sharded`, tokens are put into shards by this many
+# leading characters.
+SHARD_PREFIX_LENGTH = 2
+
+# The manifest of previously parsed files.  Only files that were added or
+# changed since the last run are parsed again (see `IndexCache`).
+CACHE_FILE = os.path.join(THIS_DIR, "..", ".lunr-index-cache.json")
+
+# Bump this if the layout of the cache file changes.  Any change to this script
+# also invalidates the cache (see `cache_key()`).
+CACHE_VERSION = 3
+
+# BM25 parameters used by `score_documents()`.  K1 controls how quickly repeated
+# use of a keyword stops adding to its weight, and B how much long documents are
+# penalized.
+BM25_K1 = 1.2
+BM25_B = 0.75
+
 # This list was taken directly from the lunr.js stopWords array.  Lunr is ignoring
 # these, so we might as well remove them from our index.
 IGNORED_WORDS = ["a", "able", "about", "across", "after", "all", "almost", "also", "am", "among", "an", "and", "any", "are", "as", "at", "be", "because", "been", "but", "by", "can", "cannot", "could", "dear", "did", "do", "does", "either", "else", "ever", "every", "for", "from", "get", "got", "had", "has", "have", "he", "her", "hers", "him", "his", "how", "however", "i", "if", "in", "into", "is", "it", "its", "just", "least", "let", "like", "likely", "may", "me", "might", "most", "must", "my", "neither", "no", "nor", "not", "of", "off", "often", "on", "only", "or", "other", "our", "own", "rather", "said", "say", "says", "she", "should", "since", "so", "some", "than", "that", "the", "their", "them", "then", "there", "these", "they", "this", "tis", "to", "too", "twas", "us", "wants", "was", "we", "were", "what", "when", "where", "which", "while", "who", "whom", "why", "will", "with", "would", "yet", "you", "your"]
@@ -34,6 +89,21 @@ IGNORED_WORDS = ["a", "able", "about", "across", "after", "all", "almost", "also
 # These words will be included regardless of length or inclusion in IGNORED_WORDS
 INCLUDE_WORDS = ["tim"]
 
+# Precompiled patterns and lookup sets used by `get_keywords()`
+HTML_TAG_RE = re.compile("</?.*?>")
+MARKDOWN_LINK_RE = re.compile("\[(.+)\]\(.+?\)")
+WORD_RE = re.compile("[^\W_]+")
+CAPITALIZED_RE = re.compile("[A-Z][a-z]{3}")
+IGNORED_WORDS_SET = frozenset(IGNORED_WORDS)
+INCLUDE_WORDS_SET = frozenset(INCLUDE_WORDS)
+
+# Precompiled patterns used to read the TOML front matter
+HEADER_TITLE_RE = re.compile("^title\s+=\s+(?P<quote>['\"])(?P<title>.+?)(?P=quote)", re.MULTILINE)
+HEADER_DATE_RE = re.compile("^date\s+=\s+(?P<quote>['\"])(?P<date>.+?)(?P=quote)", re.MULTILINE)
+HEADER_TAGS_RE = re.compile("^(categories|tags) = \[(.*?)\]", re.MULTILINE)
+HEADER_SLUG_RE = re.compile("^slug = (?P<quote>['\"])(?P<slug>.+?)(?P=quote)", re.MULTILINE)
+HEADER_DRAFT_RE = re.compile("^\s*draft\s+=\s+true", re.MULTILINE)
+
 # The minimum length of a word to be considered a keyword (not used for words
 # beginning with a capital letter)
 MIN_WORD_LENGTH = 5
@@ -61,16 +131,36 @@ INCLUDE_DRAFTS = False
 # <username>.github.io).
 FORCE_TRAILING_SLASH = True
 
+# The keyword statistics.  These are gathered in the main process (never in the
+# parsing workers) so they are correct no matter how many --jobs are used.
+ENABLE_STATS = False
+STATS = {}
+
+# The size/recall statistics for the keywords kept by `score_documents()`
+SCORE_STATS = {}
+
 
 def get_args():
     """Parse the command-line arguments."""
     parser = argparse.ArgumentParser()
     parser.add_argument('--outfile', help="Path to your generated 'lunr-index.json' file", type=str, default=OUTFILE)
-    parser.add_argument("--prettyprint", help="Make you JSON output file easier to read by humans", action="store_true")
+    parser.add_argument("--prettyprint", help="Make you JSON output file easier to read by humans (--format raw only)", action="store_true")
     parser.add_argument('--contentdir', help="Path to search for your Markdown files", type=str, default=CONTENT_DIR)
     parser.add_argument('--min-permalink-year', help="Minimum post year to consider for permalink reformat", type=int, default=MIN_PERMALINK_YEAR)
     parser.add_argument("--stats", help="Print some very basic keyword statistics", action="store_true")
     parser.add_argument("--drafts", help="Include drafts in the index (Only use this if you publish your draft content!)", action="store_true")
+    parser.add_argument('--cache', help="Path to the manifest of previously parsed files", type=str, default=CACHE_FILE)
+    parser.add_argument('--format', help="Write a prebuilt Lunr index, or the raw documents for the browser to index", choices=["lunr", "sharded", "compact", "raw"], default="compact")
+    parser.add_argument('--shard-prefix-length', help="Number of leading token characters used to split the sharded index", type=int, default=SHARD_PREFIX_LENGTH)
+    parser.add_argument("--precompress", help="Also write .gz and .br copies of the index files", action="store_true")
+    parser.add_argument("--sizes", help="Compare the raw and compressed size of the index against the raw documents", action="store_true")
+    parser.add_argument("--check", help="Use node to check the prebuilt index against one built by lunr.js", action="store_true")
+    parser.add_argument('--max-terms', help="Only keep the N best (BM25-weighted) keywords of each document (0 keeps them all)", type=int, default=0)
+    parser.add_argument('--min-score', help="Only keep keywords with a BM25 weight of at least this much", type=float, default=0.0)
+    parser.add_argument('--jobs', help="Number of worker processes used to parse files (0 uses every CPU)", type=int, default=1)
+    parser.add_argument('--report', help="Write the timing of each stage to this JSON file", type=str, default=None)
+    parser.add_argument("--no-cache", help="Parse every file, ignoring (and not updating) the cache", dest="use_cache", action="store_false")
+    parser.set_defaults(use_cache=True)
     return parser.parse_args()
 
 
@@ -83,35 +173,66 @@ def get_keywords(text, min_word_length=MIN_WORD_LENGTH, ignored_words=IGNORED_WO
     :param int min_word_length: The minimum length of words you want returned
     :param list ignored_words: Words found in this list will not be returned
     """
-    # Remove any HTML tags
-    text = re.sub("(</?.*?>)", "", text)
-
-    # Remove Markdown links (but keep the link text)
-    text = re.sub("\[(.+)\]\(.+?\)", r"\1", text)
+    ignored_words = IGNORED_WORDS_SET if (ignored_words is IGNORED_WORDS) else frozenset(ignored_words)
 
-    # Replace all non-word characters and underscore with a space
-    text = re.sub("[\W_]", " ", text)
+    # Everything between non-word characters and underscores is a word.  Each
+    # word only needs to be checked once.
+    keywords = set()
+    for x in set(WORD_RE.findall(strip_markup(text))):
+        if is_keyword(x, min_word_length, ignored_words):
+            keywords.add(x.lower())
 
     # Return the sorted set, since set()'s order is non-deterministic and we
     # don't want to needlessly consider a change in order a reason to check in
     # the result again.
-    words = text.split()
-    keywords = sorted(
-        set([
-            x.lower() for x in words if
-            re.match("^[A-Z][a-z]{3}", x)  # Capitalized words w/ 3 or more characters are always considered
-            or (x in INCLUDE_WORDS)
-            or ((len(x) > min_word_length) and (x not in ignored_words))
-        ]),
-        cmp=lambda x, y: cmp(x.lower(), y.lower())
-    )
+    return sorted(keywords)
 
-    if ENABLE_STATS:
-        parse_stats(keywords)
+
+def count_keywords(text, min_word_length=MIN_WORD_LENGTH, ignored_words=IGNORED_WORDS):
+    """This function returns a dictionary of the *keywords* found in the text
+    (the same ones returned by `get_keywords()`) and the number of times each
+    one is used.
+
+    :param str text: The text you wish to parse
+    :param int min_word_length: The minimum length of words you want returned
+    :param list ignored_words: Words found in this list will not be returned
+    """
+    ignored_words = IGNORED_WORDS_SET if (ignored_words is IGNORED_WORDS) else frozenset(ignored_words)
+
+    words = WORD_RE.findall(strip_markup(text))
+    counts = dict.fromkeys(words, 0)
+    for x in words:
+        counts[x] += 1
+
+    keywords = {}
+    for x, count in counts.iteritems():
+        if is_keyword(x, min_word_length, ignored_words):
+            keyword = x.lower()
+            keywords[keyword] = keywords.get(keyword, 0) + count
 
     return keywords
 
 
+def strip_markup(text):
+    """Removes HTML tags and Markdown link targets (keeping the link text)."""
+    if "<" in text:
+        text = HTML_TAG_RE.sub("", text)
+
+    if "](" in text:
+        text = MARKDOWN_LINK_RE.sub(r"\1", text)
+
+    return text
+
+
+def is_keyword(word, min_word_length, ignored_words):
+    """Returns True if `word` should be considered a keyword."""
+    return bool(
+        CAPITALIZED_RE.match(word)  # Capitalized words w/ 3 or more characters are always considered
+        or (word in INCLUDE_WORDS_SET)
+        or ((len(word) > min_word_length) and (word not in ignored_words))
+    )
+
+
 def parse_stats(keywords):
     """This function keeps track of the number of times each keyword is used."""
     global STATS
@@ -135,6 +256,101 @@ def print_stats():
         print "    %20s: %i" % (keyword, count)
 
 
+def score_documents(docs, max_terms=0, min_score=0.0, k1=BM25_K1, b=BM25_B):
+    """Weights the keywords of each document with BM25, using the keyword
+    counts from `parse()` and the document frequencies across the whole
+    corpus.  Only the `max_terms` best keywords of each document (0 keeps them
+    all) that weigh at least `min_score` are kept.  The documents are yielded
+    with their remaining keywords as "content" (still sorted).  The weights
+    only decide which keywords are kept; the index ranks the kept ones itself.
+
+    A document with no keywords left is still yielded (with empty content), so
+    it can be found by its title and tags.
+
+    The weights can't be known until every document has been seen, so the
+    documents are spooled to a temporary file while the corpus statistics are
+    gathered instead of being held in memory.
+
+    :param iterable docs: The documents, with keyword counts
+    :param int max_terms: The maximum number of keywords to keep per document
+    :param float min_score: The minimum weight of the keywords to keep
+    """
+    document_frequency = {}
+    total_length = 0
+    number_of_docs = 0
+
+    with tempfile.TemporaryFile() as spool:
+        for doc in docs:
+            spool.write(json.dumps(doc) + "\n")
+            number_of_docs += 1
+            total_length += sum(doc["counts"].itervalues())
+            for keyword in doc["counts"]:
+                document_frequency[keyword] = document_frequency.get(keyword, 0) + 1
+
+        average_length = float(total_length) / max(1, number_of_docs)
+        kept_frequency = {}
+        stats = {"docs": number_of_docs, "before": 0, "after": 0, "title_only": 0, "bytes_before": 0, "bytes_after": 0}
+
+        spool.seek(0)
+        for line in spool:
+            doc = json.loads(line)
+            norm = k1 * (1 - b + b * sum(doc["counts"].itervalues()) / (average_length or 1))
+
+            weights = {}
+            for keyword, count in doc["counts"].iteritems():
+                df = document_frequency[keyword]
+                idf = math.log(1 + (number_of_docs - df + 0.5) / (df + 0.5))
+                weights[keyword] = idf * count * (k1 + 1) / (count + norm)
+
+            # Ties are broken alphabetically so the result is deterministic
+            keep = sorted(weights, key=lambda x: (-weights[x], x))
+            if max_terms > 0:
+                keep = keep[:max_terms]
+            keep = sorted(x for x in keep if weights[x] >= min_score)
+
+            entry = copy_entry(doc)
+            entry["content"] = " ".join(keep)
+
+            for keyword in keep:
+                kept_frequency[keyword] = kept_frequency.get(keyword, 0) + 1
+            stats["before"] += len(weights)
+            stats["after"] += len(keep)
+            stats["title_only"] += 0 if keep else 1
+            stats["bytes_before"] += len(doc["content"].encode("utf-8"))
+            stats["bytes_after"] += len(entry["content"].encode("utf-8"))
+
+            yield entry
+
+    # Recall is the fraction of the documents that still match a single
+    # keyword query, averaged over every keyword in the corpus.
+    stats["keywords"] = len(document_frequency)
+    stats["kept_keywords"] = len(kept_frequency)
+    stats["recall"] = sum(
+        float(kept_frequency.get(x, 0)) / df for x, df in document_frequency.iteritems()
+    ) / max(1, len(document_frequency))
+
+    SCORE_STATS.clear()
+    SCORE_STATS.update(stats)
+
+
+def print_score_stats():
+    """Display what `score_documents()` traded away for a smaller index."""
+    stats = SCORE_STATS
+
+    print "===== Keyword Weighting ============================="
+    print "    Documents scored:", stats["docs"]
+    print "    Documents only searchable by title/tags:", stats["title_only"]
+    print "    Keywords kept: %i of %i (%.01f%%)" % (stats["after"], stats["before"], percent(stats["after"], stats["before"]))
+    print "    Content size: %.02fkb -> %.02fkb" % (stats["bytes_before"] / 1024.0, stats["bytes_after"] / 1024.0)
+    print "    Searchable keywords: %i of %i (%.01f%%)" % (stats["kept_keywords"], stats["keywords"], percent(stats["kept_keywords"], stats["keywords"]))
+    print "    Single keyword recall: %.01f%%" % (stats["recall"] * 100)
+
+
+def percent(part, whole):
+    """Returns `part` as a percentage of `whole` (100 if `whole` is 0)."""
+    return (100.0 * part / whole) if whole else 100.0
+
+
 def get_href(date, path, slug, permalinks=PERMALINKS, min_permalink_year=MIN_PERMALINK_YEAR):
     """This function attempts to figure out the URL that the file will be
     generated at.  This is far from perfect, and only a couple permalink variables
@@ -166,47 +382,108 @@ def get_href(date, path, slug, permalinks=PERMALINKS, min_permalink_year=MIN_PER
     return href
 
 
-def parse(path, drafts=False):
-    """Parses a single Markdown file.
+def read_front_matter(fh):
+    """Reads the TOML front matter from the start of an open Markdown file,
+    stopping at the closing "+++" line.  The body is left unread, so the caller
+    can decide whether it's needed at all.
 
-    NOTE: Only TOML format is supported!
+    Returns the header text and the remainder of the closing line (the start
+    of the body), or None if the front matter is never closed.
+    """
+    line = fh.readline()
+    while line and (not line.strip()):
+        line = fh.readline()
+
+    line = line.lstrip()
+    if not line.startswith("+++"):
+        raise Exception("[%s] doesn't appear to be TOML" % fh.name)
+
+    lines = [line[3:]]
+    for line in iter(fh.readline, b""):
+        if line.startswith("+++"):
+            return "".join(lines), line[3:]
+        lines.append(line)
 
-    Returns a dictionary with keys: ["title", "tags", "content", "href"]
+    return None
+
+
+def parse_header(header):
+    """Parses the fields of the TOML front matter used by the index.
+
+    Returns a dictionary with keys: ["title", "date", "slug", "tags", "draft"].
+    The date is left as a string so the header can be cached as JSON.
+    """
+    tags_match = HEADER_TAGS_RE.search(header)
+    if tags_match:
+        tags = tags_match.group(2).replace("'", "").replace('"', "").replace(",", " ").split()
+    else:
+        tags = []
+
+    slug_match = HEADER_SLUG_RE.search(header)
+
+    return {
+        "title": HEADER_TITLE_RE.search(header).group("title"),
+        "date": HEADER_DATE_RE.search(header).group("date"),
+        "slug": slug_match.group("slug") if slug_match else None,
+        "tags": tags,
+        "draft": bool(HEADER_DRAFT_RE.search(header))
+    }
+
+
+def make_entry(path, header, body, counts=False):
+    """Returns the index entry for a document from its parsed header and its
+    body.
+    """
+    date = time.strptime(header["date"][:19], "%Y-%m-%dT%H:%M:%S")
+
+    entry = {
+        "title": header["title"],
+        "tags": header["tags"],
+        "content": None,
+        "href": get_href(date, path, header["slug"])
+    }
+
+    if counts:
+        entry["counts"] = count_keywords(body)
+        entry["content"] = " ".join(sorted(entry["counts"]))
+    else:
+        entry["content"] = " ".join(get_keywords(body))
+
+    return entry
+
+
+def parse_document(path, drafts=False, counts=False, header=None):
+    """Parses a single Markdown file, only reading its body if the front matter
+    says it will be used.  If `header` is given (the result of `parse_header()`
+    from a previous run), it's used instead of parsing the front matter again.
+
+    Returns the parsed header and the index entry (None for drafts that aren't
+    included).  Both are None if the front matter is never closed.
     """
     with open(path, "rb") as fh:
-        text = fh.read().strip()
+        front_matter = read_front_matter(fh)
+        if front_matter is None:
+            return None, None
 
-    if not re.match("^\+\+\+", text):
-        raise Exception("[%s] doesn't appear to be TOML")
+        if header is None:
+            header = parse_header(front_matter[0])
 
-    match = re.search("^\+\+\+(?P<header>.*)^\+\+\+(?P<content>.*)", text, re.DOTALL | re.MULTILINE)
-    if match:
-        header = match.group("header")
-        if re.search("^\s*draft\s+=\s+true", header, re.MULTILINE) and (not drafts):
-            return None
+        if header["draft"] and (not drafts):
+            return header, None
 
-        title = re.search("^title\s+=\s+(?P<quote>['\"])(?P<title>.+?)(?P=quote)", header, re.MULTILINE).group("title")
-        date = re.search("^date\s+=\s+(?P<quote>['\"])(?P<title>.+?)(?P=quote)", header, re.MULTILINE).group("title")
-        date = time.strptime(date[:19], "%Y-%m-%dT%H:%M:%S")
+        return header, make_entry(path, header, front_matter[1] + fh.read(), counts)
 
-        tags_match = re.search("^(categories|tags) = \[(.*?)\]", header, re.MULTILINE)
-        if tags_match:
-            tags = tags_match.group(2).replace("'", "").replace('"', "").replace(",", " ").split()
-        else:
-            tags = []
 
-        slug_match = re.search("^slug = (?P<quote>['\"])(?P<slug>.+?)(?P=quote)", header, re.MULTILINE)
-        if slug_match:
-            slug = slug_match.group("slug")
-        else:
-            slug = None
+def parse(path, drafts=False, counts=False):
+    """Parses a single Markdown file.
 
-        return {
-            "title": title,
-            "tags": tags,
-            "content": " ".join(get_keywords(match.group("content"))),
-            "href": get_href(date, path, slug)
-        }
+    NOTE: Only TOML format is supported!
+
+    Returns a dictionary with keys: ["title", "tags", "content", "href"].  If
+    `counts` is True, the number of times each keyword is used is included as
+    "counts" (needed by `score_documents()`).
+    """
+    return parse_document(path, drafts, counts)[1]
 
 
 def format_timespan(seconds, format="%i:%02i:%0.4f"):
@@ -217,41 +494,504 @@ def format_timespan(seconds, format="%i:%02i:%0.4f"):
     return format % (hours, minutes, seconds)
 
 
-def write_json_file(data, path, prettyprint=False):
-    """Outputs data to a JSON formatted text file.
+def write_json_file(data, path, prettyprint=False, compact=False):
+    """Outputs data to a JSON formatted text file.  The JSON is streamed to a
+    temporary file which then replaces `path`, so we never hold the whole text
+    in memory, and a crash never leaves a truncated file behind.
 
-    :param var data: The data you want to write
+    :param var data: The data you want to write (a generator is written as a list)
     :param str path: The path of the file you want to write the data to
     :param bool prettyprint: Whether or not you want a human-readable file
+    :param bool compact: Leave out the spaces after separators (ignored if prettyprint is set)
     """
-    with open(path, "wb") as fh:
+    buildutils.write_atomic(path, iter_json(data, prettyprint, compact))
+
+
+def get_encoder(prettyprint=False, compact=False):
+    """Returns the JSON encoder used for the options of `write_json_file()`."""
+    if prettyprint:
+        return json.JSONEncoder(sort_keys=True, indent=4, separators=(',', ': '))
+    elif compact:
+        return json.JSONEncoder(separators=(',', ':'))
+
+    return json.JSONEncoder()
+
+
+def iter_json(data, prettyprint=False, compact=False):
+    """Returns an iterator over the chunks of JSON text for the data.
+
+    A generator is encoded as a list, one item at a time, without ever holding
+    all of the items.  The text is the same as encoding the whole list.
+    """
+    encoder = get_encoder(prettyprint, compact)
+    if not isinstance(data, types.GeneratorType):
+        return encoder.iterencode(data)
+
+    return iter_json_list(data, encoder, prettyprint)
+
+
+def iter_json_list(items, encoder, prettyprint=False):
+    """Yields the JSON text of a list of items, one item at a time."""
+    first = True
+    for item in items:
+        text = encoder.encode(item)
         if prettyprint:
-            fh.write(json.dumps(data, sort_keys=True, indent=4, separators=(',', ': '), ))
+            # The items of a list are nested one level deep
+            text = text.replace("\n", "\n    ")
+
+        if first:
+            yield "[\n    " if prettyprint else "["
+            first = False
         else:
-            fh.write(json.dumps(data))
+            yield encoder.item_separator + ("\n    " if prettyprint else "")
 
+        yield text
 
-def get_index(basedir, drafts=False):
-    """Walk `basedir`, searching for any Markdown files.  These files will be
-    parsed and returned as a list of dictionaries.
+    if first:
+        yield "[]"
+    else:
+        yield "\n]" if prettyprint else "]"
 
-    :param str basedir: The root directory you want to walk
+
+def dumps_json(data, prettyprint=False, compact=False):
+    """Returns the data formatted the way `write_json_file()` writes it."""
+    return "".join(iter_json(data, prettyprint, compact))
+
+
+def write_compressed_siblings(path):
+    """Writes the .gz and .br copies of a file next to it."""
+    with open(path, "rb") as fh:
+        data = fh.read()
+
+    for ext, compressed in [(".gz", buildutils.gzip_data(data)), (".br", buildutils.brotli_data(data))]:
+        if compressed is not None:
+            buildutils.write_atomic(path + ext, [compressed])
+
+
+def build_lunr_index(docs):
+    """Returns the prebuilt Lunr index for the documents, along with the title
+    of each document (keyed by href) for displaying the results.
+
+    :param iterable docs: The documents yielded by `get_index()`
+    """
+    index = lunrindex.Index()
+    titles = {}
+    for doc in docs:
+        index.add(doc)
+        titles[doc["href"]] = doc["title"]
+
+    return {
+        "index": index.to_json(),
+        "titles": titles
+    }
+
+
+def build_compact_index(docs):
+    """Returns the compact index for the list of documents (see
+    `lunrindex.Index.to_compact()`).  The documents are stored as a list of
+    [href, title], and are referred to by their position in that list.
+
+    :param iterable docs: The documents yielded by `get_index()`
+    """
+    index = lunrindex.Index()
+    titles = {}
+    for doc in docs:
+        index.add(doc)
+        titles[lunrindex.to_unicode(doc["href"])] = doc["title"]
+
+    compact = index.to_compact()
+
+    return {
+        "format": "compact",
+        "version": lunrindex.LUNR_VERSION,
+        "fields": [{"name": name, "boost": boost} for name, boost in index.fields],
+        "ref": index.ref,
+        "pipeline": lunrindex.PIPELINE,
+        "docs": [[x, titles[x]] for x in compact["refs"]],
+        "lengths": compact["lengths"],
+        "terms": compact["terms"],
+        "postings": compact["postings"]
+    }
+
+
+def fingerprint(data, number_of_chars=10):
+    """Returns the first 10 characters hexdigest of the MD5 hash of the data."""
+    return md5(data).hexdigest()[0:number_of_chars]
+
+
+def write_sharded_index(docs, path, prefix_length=SHARD_PREFIX_LENGTH, prettyprint=False):
+    """Builds the index and writes it as a set of shards, split by token
+    prefix, into a folder next to `path`.  The manifest written to `path`
+    lists each document (with the magnitude needed to score it) and the URL of
+    each shard, relative to the manifest.
+
+    Each shard is named after its fingerprint, so new content only changes the
+    shards that hold its tokens.  Shards that are already on disk are left
+    alone, and any that are no longer used are removed.
+
+    :param iterable docs: The documents yielded by `get_index()`
+    :param str path: The path of the manifest
+    :param int prefix_length: The number of leading token characters per shard
+    :param bool prettyprint: Whether or not you want a human-readable manifest
+
+    Returns the paths of the shards.
+    """
+    index = lunrindex.Index()
+    titles = []
+    for doc in docs:
+        index.add(doc)
+        titles.append((doc["href"], doc["title"]))
+
+    base = os.path.splitext(os.path.basename(path))[0]
+    shard_dir = os.path.join(os.path.dirname(os.path.abspath(path)), base)
+    if not os.path.isdir(shard_dir):
+        os.makedirs(shard_dir)
+
+    shards = {}
+    for prefix, tokens in index.shards(prefix_length).items():
+        # The keys are sorted so the fingerprint only depends on the content
+        text = json.dumps(tokens, sort_keys=True, separators=(",", ":"))
+        fname = "%s-%s.json" % (re.sub("[^a-z0-9_]", "_", prefix), fingerprint(text))
+        shard_path = os.path.join(shard_dir, fname)
+
+        if not os.path.exists(shard_path):
+            buildutils.write_atomic(shard_path, [text])
+
+        shards[prefix] = "%s/%s" % (base, fname)
+
+    used = set(x.split("/")[-1] for x in shards.values())
+    for fname in os.listdir(shard_dir):
+        name = re.sub(r"\.(gz|br)$", "", fname)
+        if name.endswith(".json") and (name not in used):
+            os.unlink(os.path.join(shard_dir, fname))
+
+    magnitudes = index.magnitudes()
+    manifest = {
+        "format": "sharded",
+        "version": lunrindex.LUNR_VERSION,
+        "fields": [{"name": name, "boost": boost} for name, boost in index.fields],
+        "ref": index.ref,
+        "pipeline": lunrindex.PIPELINE,
+        "prefixLength": prefix_length,
+        "docs": [
+            {"href": href, "title": title, "magnitude": magnitudes[lunrindex.to_unicode(href)]}
+            for href, title in titles
+        ],
+        "shards": shards
+    }
+    write_json_file(manifest, path, prettyprint)
+
+    return [os.path.join(shard_dir, x) for x in sorted(used)]
+
+
+def print_sizes(docs, paths, label, prettyprint=False):
+    """Display the raw and compressed size of the files that were written,
+    compared with the raw documents (the old index format).
+    """
+    def sizes(texts):
+        gzipped = sum(len(buildutils.gzip_data(x)) for x in texts)
+        if buildutils.brotli is None:
+            brotlied = "n/a"
+        else:
+            brotlied = "%.02fkb" % (sum(len(buildutils.brotli_data(x)) for x in texts) / 1024.0)
+
+        return ("%.02fkb" % (sum(len(x) for x in texts) / 1024.0), "%.02fkb" % (gzipped / 1024.0), brotlied)
+
+    texts = []
+    for path in paths:
+        with open(path, "rb") as fh:
+            texts.append(fh.read())
+
+    print "===== Sizes ========================================="
+    print "    %20s  %10s %10s %10s" % ("", "raw", "gzip", "brotli")
+    print "    %20s: %10s %10s %10s" % (("raw documents",) + sizes([dumps_json(docs, prettyprint)]))
+    print "    %20s: %10s %10s %10s" % (("%s (%i files)" % (label, len(paths)),) + sizes(texts))
+
+
+def check_lunr_index(docs, path):
+    """Builds an index from the documents with lunr.js (using node), and
+    compares it, and the results of searching it, against the prebuilt (or
+    sharded) index at `path`.  Returns True if they match.
+    """
+    fd, docs_path = tempfile.mkstemp(suffix=".json")
+    os.close(fd)
+
+    try:
+        write_json_file(docs, docs_path)
+        return subprocess.call(["node", CHECK_SCRIPT, docs_path, path]) == 0
+    finally:
+        os.unlink(docs_path)
+
+
+def file_digest(path):
+    """Returns the MD5 hexdigest of the contents of a file."""
+    m = md5()
+    with open(path, "rb") as fh:
+        for chunk in iter(lambda: fh.read(65536), b""):
+            m.update(chunk)
+
+    return m.hexdigest()
+
+
+def cache_key(counts=False):
+    """Returns a string describing everything, other than the content itself,
+    that goes into the parsed entries.  A cache built with a different key is
+    thrown away.  Whether or not drafts are included isn't part of the key,
+    since each record holds the draft flag from the file's header.
+    """
+    return "%i:%s:%s" % (CACHE_VERSION, file_digest(os.path.abspath(__file__)), counts)
+
+
+class IndexCache(object):
+    """The records of the files parsed by the last run: each file's path, mtime,
+    size, MD5, header and entry (see `get_index()`).
+
+    The cache is a JSON Lines file; the key, then one record per file.  Only
+    the stat and hash of each record (and where it starts in the file) are
+    kept in memory.  The header and entry are read back when the file is
+    reused.  The records of this run are written one at a time to a temporary
+    file, which replaces the cache when `close()` is called.  A cache that's
+    missing, unreadable, or was built with a different key is ignored.
+    """
+    def __init__(self, path, key):
+        self.path = path
+        self.key = key
+        self.records = {}
+        self.reused = 0
+        self.parsed = 0
+        self.fh = None
+        self.out = None
+        self.temp_path = None
+
+        if path and os.path.isfile(path):
+            self.load()
+
+    def load(self):
+        """Reads the stat, hash and position of each record."""
+        fh = open(self.path, "rb")
+        try:
+            if json.loads(fh.readline() or "{}").get("key") != self.key:
+                fh.close()
+                return
+
+            offset = fh.tell()
+            for line in iter(fh.readline, ""):
+                record = json.loads(line)
+                header = record["header"]
+                self.records[record["path"]] = {
+                    "mtime": record["mtime"],
+                    "size": record["size"],
+                    "md5": record["md5"],
+                    "offset": offset,
+                    "header_only": bool(header) and (record["entry"] is None),
+                    "draft": bool(header) and header["draft"]
+                }
+                offset = fh.tell()
+        except (ValueError, KeyError):
+            # A damaged cache is the same as none at all
+            self.records = {}
+            fh.close()
+            return
+
+        self.fh = fh
+
+    def get(self, relpath):
+        """Returns the stat and hash of the file's record, or None."""
+        return self.records.get(relpath)
+
+    def read(self, relpath):
+        """Returns the file's whole record, including its header and entry."""
+        self.fh.seek(self.records[relpath]["offset"])
+        return json.loads(self.fh.readline())
+
+    def write(self, relpath, mtime, size, digest, header, entry):
+        """Adds a record to the new cache."""
+        if self.out is None:
+            dirname, fname = os.path.split(os.path.abspath(self.path))
+            fd, self.temp_path = tempfile.mkstemp(prefix=".%s." % fname, suffix=".tmp", dir=dirname)
+            self.out = os.fdopen(fd, "wb")
+            self.out.write(json.dumps({"key": self.key}) + "\n")
+
+        record = {"path": relpath, "mtime": mtime, "size": size, "md5": digest, "header": header, "entry": entry}
+        self.out.write(json.dumps(record, sort_keys=True) + "\n")
+
+    def close(self, commit=True):
+        """Replaces the cache with the records written by this run (unless
+        `commit` is False, e.g. when the run failed part way).
+        """
+        if self.fh:
+            self.fh.close()
+            self.fh = None
+
+        if self.out is None:
+            if commit:
+                # No files at all; write an empty cache
+                self.write_key_only()
+            return
+
+        self.out.close()
+        self.out = None
+        if not commit:
+            os.remove(self.temp_path)
+            return
+
+        buildutils.rename_temp(self.temp_path, self.path)
+
+    def write_key_only(self):
+        """Writes a cache with no records."""
+        buildutils.write_atomic(self.path, [json.dumps({"key": self.key}) + "\n"])
+
+
+def copy_entry(entry, counts=False):
+    """Returns a copy of an index entry that came from the cache or from a
+    worker process.  The dictionary is rebuilt the same way `parse()` builds it
+    so its key order, and therefore the JSON output, is identical no matter
+    where the entry came from.  The keyword counts are only copied if `counts`
+    is True.
+    """
+    if entry is None:
+        return None
+
+    copy = {
+        "title": entry["title"],
+        "tags": entry["tags"],
+        "content": entry["content"],
+        "href": entry["href"]
+    }
+
+    if counts:
+        copy["counts"] = entry["counts"]
+
+    return copy
+
+
+def find_markdown(basedir):
+    """Returns the paths of all Markdown files found under `basedir`.  The walk
+    is sorted so the index is in the same order no matter what order the
+    filesystem gives us.
     """
-    index = []
+    paths = []
+
+    for root, dirs, files in os.walk(basedir):
+        dirs.sort()
+        for fname in sorted(files):
+            if fname.endswith(".md"):
+                paths.append(os.path.join(root, fname))
+
+    return paths
 
-    for root, _, files in os.walk(basedir):
-        for fname in files:
-            if not fname.endswith(".md"):
-                continue
 
-            path = os.path.join(root, fname)
-            data = parse(path, drafts=drafts)
+def parse_item(item):
+    """Calls `parse_document()` with a (path, cached header, drafts, counts)
+    tuple.  This is what the worker processes run.
+    """
+    path, header, drafts, counts = item
+    return parse_document(path, drafts, counts, header)
+
+
+def parse_files(paths, drafts=False, jobs=1, counts=False, headers=None):
+    """Parses each file in `paths`, yielding the (header, entry) results in the
+    same order.
+
+    :param list paths: The Markdown files you want parsed
+    :param bool drafts: Whether or not to include draft content
+    :param int jobs: The number of worker processes to use (0 uses every CPU)
+    :param bool counts: Whether or not to include the keyword counts
+    :param dict headers: Previously parsed headers, by path, that are still good
+    """
+    headers = headers or {}
+    items = [(path, headers.get(path), drafts, counts) for path in paths]
+
+    for header, data in buildutils.imap_jobs(parse_item, items, jobs):
+        yield header, copy_entry(data, counts)
+
+
+def get_index(basedir, drafts=False, cache=None, jobs=1, counts=False):
+    """Walk `basedir`, searching for any Markdown files.  These files will be
+    parsed and yielded as dictionaries, one at a time, in walk order.
+
+    If `cache` is given, it should be an `IndexCache`.  Files whose mtime and
+    size (or, failing that, MD5) match their record are not read again, unless
+    the body of a draft is needed for the first time; its cached header is
+    reused in that case.  The record of each file is written to the new cache
+    as its document is yielded, and the cache is replaced once every document
+    has been yielded, so deleted files are dropped from it.  Only the stat and
+    hash of each file are kept in memory.
+
+    :param str basedir: The root directory you want to walk
+    :param bool drafts: Whether or not to include draft content
+    :param IndexCache cache: The file records from a previous run
+    :param int jobs: The number of worker processes to use (0 uses every CPU)
+    :param bool counts: Whether or not to include the keyword counts (the
+        cache must have been built with the same setting)
+    """
+    paths = find_markdown(basedir)
+    stats = {}
+    to_parse = []
+    headers = {}
+
+    for path in paths:
+        if cache is None:
+            to_parse.append(path)
+            continue
+
+        relpath = os.path.relpath(path, basedir).replace("\\", "/")
+        stat = os.stat(path)
+        record = cache.get(relpath)
+
+        if record and (record["mtime"] == stat.st_mtime) and (record["size"] == stat.st_size):
+            digest = record["md5"]
+        else:
+            digest = file_digest(path)
+
+        if (not record) or (record["md5"] != digest):
+            to_parse.append(path)
+        elif record["header_only"] and (drafts or not record["draft"]):
+            # Only the header of this draft was read last time
+            to_parse.append(path)
+            headers[path] = cache.read(relpath)["header"]
+
+        stats[path] = (relpath, stat.st_mtime, stat.st_size, digest)
+
+    parsed = parse_files(to_parse, drafts=drafts, jobs=jobs, counts=counts, headers=headers)
+    to_parse = set(to_parse)
+    finished = False
+
+    try:
+        for path in paths:
+            if path in to_parse:
+                header, data = next(parsed)
+                if cache is not None:
+                    cache.parsed += 1
+                    cache.write(*(stats[path] + (header, data)))
+            else:
+                record = cache.read(stats[path][0])
+                cache.reused += 1
+                cache.write(*(stats[path] + (record["header"], record["entry"])))
+                header, data = record["header"], copy_entry(record["entry"], counts)
+
+            # A draft's entry may be cached from a run that included drafts
+            if header and header["draft"] and (not drafts):
+                data = None
+
+            if data and ENABLE_STATS:
+                parse_stats(data["content"].split())
 
             # Only add stuff to the index that has content
             if data and data["content"]:
-                index.append(parse(path))
+                yield data
+
+        finished = True
+    finally:
+        if cache is not None:
+            cache.close(commit=finished)
 
-    return index
+
+def counted(items, counter):
+    """Yields each of the items, counting them in `counter[0]`."""
+    for item in items:
+        counter[0] += 1
+        yield item
 
 
 if __name__ == '__main__':
@@ -259,13 +999,73 @@ if __name__ == '__main__':
 
     args = get_args()
     ENABLE_STATS = args.stats
-    STATS = {}
-    index = get_index(args.contentdir, drafts=args.drafts)
-    write_json_file(index, args.outfile, args.prettyprint)
+    report = buildstats.Report("make-search-index")
+
+    scoring = (args.max_terms > 0) or (args.min_score > 0)
+
+    # Indenting the prebuilt indexes only makes them bigger
+    prettyprint = args.prettyprint and (args.format == "raw")
+
+    cache = IndexCache(args.cache, cache_key(scoring)) if args.use_cache else None
+
+    with report.stage("index") as stage:
+        count = [0]
+        index = get_index(args.contentdir, drafts=args.drafts, cache=cache, jobs=args.jobs, counts=scoring)
+        if scoring:
+            index = score_documents(index, args.max_terms, args.min_score)
+        index = counted(index, count)
+        if args.check or args.sizes:
+            # These need the documents again once the index has been written
+            index = list(index)
+
+        if args.format == "lunr":
+            write_json_file(build_lunr_index(index), args.outfile)
+        elif args.format == "compact":
+            write_json_file(build_compact_index(index), args.outfile, compact=True)
+        elif args.format == "sharded":
+            shard_paths = write_sharded_index(index, args.outfile, args.shard_prefix_length)
+        else:
+            write_json_file(index, args.outfile, prettyprint)
+
+        paths = [args.outfile]
+        if args.format == "sharded":
+            paths.extend(shard_paths)
+
+        stage.files, stage.bytes_in = buildstats.tree_size(args.contentdir, [".md"])
+        stage.bytes_out = sum(os.stat(x).st_size for x in paths)
 
-    print "Parsed [%i] files in [%s]" % (len(index), format_timespan(time.time() - tstart))
+    print "Parsed [%i] files in [%s]" % (count[0], format_timespan(time.time() - tstart))
+    if args.use_cache:
+        print "...reused [%i] cached entries, parsed [%i] new or changed files" % (cache.reused, cache.parsed)
     print "Created index file at", os.path.abspath(args.outfile)
     print "...size is %.02fkb" % (os.stat(args.outfile).st_size / 1024.0)
+    if args.format == "sharded":
+        print "...plus [%i] shards totaling %.02fkb" % (len(shard_paths), sum(os.stat(x).st_size for x in shard_paths) / 1024.0)
+
+    if args.precompress:
+        with report.stage("precompress") as stage:
+            for path in paths:
+                # Shards are named after their content, so existing copies are good
+                if (path == args.outfile) or (not os.path.exists(path + ".gz")):
+                    write_compressed_siblings(path)
+                    stage.files += 1
+                    stage.bytes_in += os.stat(path).st_size
+                    stage.bytes_out += sum(os.stat(path + x).st_size for x in [".gz", ".br"] if os.path.exists(path + x))
 
     if ENABLE_STATS:
         print_stats()
+        if scoring:
+            print_score_stats()
+
+    if args.sizes:
+        print_sizes(index, paths, args.format, prettyprint)
+
+    matches = True
+    if args.check and (args.format != "raw"):
+        with report.stage("check"):
+            matches = check_lunr_index(index, args.outfile)
+
+    report.finish(args.report)
+
+    if not matches:
+        sys.exit("The prebuilt index does not match the one built by lunr.js!")
@@ -7,16 +7,39 @@ CSS and JS files are fingerprinted, and the names are changed.  If
 --max-inline-bytes is non-zero, CSS and JS files that are under this many bytes
 will be inlined in HTML source.  Otherwise, the fingerprinted URL will be
 inserted instead.
+
+`--prune-css` removes the CSS rules with classes or ids that aren't used by
+any page or script (see PRUNE_ALLOWLIST for the ones made up at runtime).
+
+Images, fonts, and JSON files get a fingerprinted copy.  The references to them
+in CSS, JS and HTML are changed before the CSS and JS files are fingerprinted,
+so a new image gives the CSS that uses it (and so on) a new name too.
+
+Images are recompressed without losing anything (see imageopt.py) before they're
+fingerprinted, and `--image-widths` makes scaled copies of them that are added
+to the `srcset` of the <img> tags that load them.
+
+`--bundle-js` joins the local scripts a page loads one after another into a
+single fingerprinted bundle.  Pages that load the same scripts share it.
 """
 
 # Imports ######################################################################
 import os
 import re
+import json
+import sys
 import htmlmin
 import argparse
+import fnmatch
+import posixpath
 from slimit import minify
 from csscompressor import compress
 from hashlib import md5
+from StringIO import StringIO
+
+import buildstats
+import buildutils
+import imageopt
 
 
 # Metadata #####################################################################
@@ -26,12 +49,151 @@ __license__ = "MIT"
 
 
 # Globals ######################################################################
-# This data structure holds files that should be fingerprinted, and a list of
-# files where the URL exists (so we don't have to search every single file).
-OTHER_FINGERPRINTS = {
-    "/js/lunr-index.json": ["/js/lunr-search.js"]
+# Files with these extensions get a fingerprinted copy (see
+# `process_other_assets()`).  References to them in CSS, JS and HTML are changed
+# to the copy; the original is kept for anything we can't see (e.g. feeds, or
+# links from other sites).
+ASSET_EXTENSIONS = [
+    ".png", ".jpg", ".jpeg", ".gif", ".svg", ".ico", ".webp", ".woff", ".woff2", ".ttf", ".eot", ".otf", ".json"
+]
+
+# Files that already have a fingerprint (e.g. the search index shards)
+FINGERPRINTED_RE = re.compile(r"-[0-9a-f]{10}\.\w+$")
+
+# The references to other files in CSS (`url()` and `@import`) and JS (strings
+# holding a URL from the root of the site).  The URL is in the "ref" group.
+REFERENCE_RES = {
+    "css": [
+        re.compile(r"""url\(\s*(?P<quote>['"]?)(?P<ref>[^'"()\s]+)(?P=quote)\s*\)"""),
+        re.compile(r"""@import\s+(?P<quote>['"])(?P<ref>[^'"]+)(?P=quote)""")
+    ],
+    "js": [
+        re.compile(r"""(?P<quote>['"])(?P<ref>/[^'"\s<>()]+)(?P=quote)""")
+    ]
+}
+
+THIS_DIR = os.path.abspath(os.path.dirname(__file__))
+
+# The minifier used for each type of file, the package it comes from, and the
+# options it's called with.
+MINIFIERS = {
+    "css": compress,
+    "js": minify
+}
+MINIFIER_PACKAGES = {
+    "css": "csscompressor",
+    "js": "slimit"
+}
+MINIFIER_OPTIONS = {
+    "css": {},
+    "js": {}
+}
+MINIFIER_VERSIONS = {}
+
+# Minified files are kept here, named after the hash of their input, the
+# minifier version, and its options.  It's outside of the static folder so it
+# survives `fab clean`.
+CACHE_DIR = os.path.join(THIS_DIR, "..", ".minify-cache")
+
+# The least recently used files are removed from the cache once it's larger
+# than this.
+CACHE_MAX_MB = 64
+
+# Minified HTML pages are kept here (named after the hash of the page), with
+# their own size limit, so a large site can't evict the CSS/JS/images.
+PAGE_CACHE_DIR = os.path.join(THIS_DIR, "..", ".minify-page-cache")
+PAGE_CACHE_MAX_MB = 64
+
+# The number of images made smaller (and by how many bytes), and of scaled
+# copies made (see `process_other_asset()`)
+IMAGE_STATS = {"optimized": 0, "saved": 0, "scaled": 0}
+
+# Files smaller than this will be inlined (set from --max-inline-bytes)
+MAX_INLINE_BYTES = 4096
+
+# The number of CSS/JS files found in (or missing from) the minify cache, and
+# the number of entries (and pages) evicted from it
+CACHE_STATS = {"hits": 0, "misses": 0, "evicted": 0, "evicted_pages": 0}
+
+# The number of times a CSS/JS file was inlined, and how many of those had to
+# read the file (see `AssetRewriter.inline_block()`)
+INLINE_STATS = {"inlined": 0, "reads": 0}
+
+# The number of bundles written, and of <script> tags they replaced (see
+# `bundle_scripts()`)
+BUNDLE_STATS = {"bundles": 0, "pages": 0, "tags": 0}
+
+# What happened to the HTML pages (see `minify_html_file()`)
+HTML_STATS = {"minified": 0, "reused": 0, "unchanged": 0}
+
+# Remembers the hash of each page before and after it was minified, and the
+# fingerprinted files it references, so pages that haven't changed can be
+# reused from the cache.  Kept outside of the static folder.
+MANIFEST_FILE = os.path.join(THIS_DIR, "..", ".minify-manifest.json")
+
+# Bump this if the layout of the manifest changes
+MANIFEST_VERSION = 2
+
+# Classes and ids matching these (shell-style) patterns are never pruned from
+# CSS, since they're only made up at runtime (e.g. "fancybox-type-" + type).
+PRUNE_ALLOWLIST = ["fancybox-*", "lb-*", "lightbox*", "rrssb-*"]
+
+# Used to find the classes and ids used by the HTML and JS, and in the CSS
+# selectors (see `prune_css()`)
+CLASS_ATTR_RE = re.compile(r"""\s(?P<attr>class|id)\s*=\s*(?:"(?P<dq>[^"]*)"|'(?P<sq>[^']*)'|(?P<bare>[^\s>]+))""", re.I)
+SCRIPT_BLOCK_RE = re.compile(r"<script\b[^>]*>(.*?)</script>", re.I | re.S)
+JS_NAME_RE = re.compile(r"[\w-]+")
+SELECTOR_NAME_RE = re.compile(r"([.#])(-?[_a-zA-Z][\w-]*)")
+SELECTOR_ARGS_RE = re.compile(r"\([^()]*\)|\[[^\]]*\]")
+CSS_COMMENT_RE = re.compile(r"/\*(?P<keep>!?).*?\*/", re.S)
+
+# At-rules that hold other rules, which are pruned too.  Other at-rules (e.g.
+# @font-face and @keyframes) are kept as they are.
+NESTED_AT_RULES = ["@media", "@supports", "@document"]
+
+# The maps of fingerprinted files used while processing the HTML (see
+# `init_worker()`)
+CSS_MAP = {}
+JS_MAP = {}
+OTHER_MAP = {}
+REWRITER = None
+
+# The tags that reference the original CSS/JS files.  The URLs are inserted
+# as-is, so "." matches any character.
+CSS_TAG_RE = """(<link rel=.?stylesheet.? href=.+%s.*?>)"""
+JS_TAG_RE = """(<script type=.?text/javascript.*?%s.*?</script>)"""
+
+# A reference to another fingerprinted file in HTML (e.g. `src="..."`)
+OTHER_URL_RE = """(?<=[\\s"'(=,])%s(?=[\\s"'?#)>,])"""
+
+# A <script> tag that loads a file (see `bundle_scripts()`).  Scripts with any
+# of the attributes in BUNDLE_SKIP_RE are left on their own, since joining them
+# would change when they run.
+SCRIPT_SRC_RE = re.compile(
+    r"""<script\b(?P<attrs>[^>]*?)\ssrc\s*=\s*(?P<quote>["']?)(?P<src>[^"'\s>]+)(?P=quote)(?P<rest>[^>]*)>\s*</script>""",
+    re.I
+)
+BUNDLE_SKIP_RE = re.compile(r"\b(?:async|defer|nomodule|integrity)\b|\btype\s*=\s*[\"']?module", re.I)
+
+# An <img> tag, and its `src` and `srcset` (see `add_srcset()`)
+IMG_TAG_RE = re.compile(r"<img\b[^>]*>", re.I)
+IMG_SRC_RE = re.compile(r"""\ssrc\s*=\s*(?P<quote>["']?)(?P<src>[^"'\s>]+)(?P=quote)""", re.I)
+IMG_SRCSET_RE = re.compile(r"\ssrcset\s*=", re.I)
+
+# What a run of scripts is replaced with when they're bundled
+BUNDLE_TEMPLATE = """<script type="text/javascript" src="%s"></script>"""
+
+# What the CSS/JS files are replaced with when they're inlined
+INLINE_TEMPLATES = {
+    "css": """<style type="text/css" title="%s">%s</style>""",
+    "js": """<script type="text/javascript" title="%s">%s</script>"""
 }
 
+# Used by `AssetRewriter` to find where the original URLs may be on a page: the
+# characters before the first special one (usually the "." of the extension)
+URL_LITERAL_RE = re.compile(r"[^.^$*+?{}\[\]\\|()]*")
+URL_SPECIAL_RE = re.compile(r"[\^$*+?{}\[\]\\|()]")
+
 
 def get_args():
     """Parse the command-line arguments."""
@@ -41,7 +203,20 @@ def get_args():
     parser.add_argument("--no-htmlmin", help="Don't minimize the final HTML", dest="do_htmlmin", action="store_false")
     parser.add_argument("--no-inline", help="Don't inline any files", dest="do_inline", action="store_false")
     parser.add_argument("--max-inline-bytes", help="All files smaller than this will be inlined", type=int, default=4096)
-    parser.set_defaults(fingerprint_nonmin=True, do_htmlmin=True, do_inline=True)
+    parser.add_argument('--cache-dir', help="Where to keep previously minified files", type=str, default=CACHE_DIR)
+    parser.add_argument('--cache-max-mb', help="Maximum size of the minify cache", type=int, default=CACHE_MAX_MB)
+    parser.add_argument('--page-cache-dir', help="Where to keep previously minified HTML pages", type=str, default=PAGE_CACHE_DIR)
+    parser.add_argument('--page-cache-max-mb', help="Maximum size of the HTML page cache", type=int, default=PAGE_CACHE_MAX_MB)
+    parser.add_argument("--no-cache", help="Minify every file, ignoring the caches", dest="use_cache", action="store_false")
+    parser.add_argument('--manifest', help="Where to remember the pages already minified", type=str, default=MANIFEST_FILE)
+    parser.add_argument("--prune-css", help="Remove CSS rules that don't match anything in the HTML or JS", action="store_true")
+    parser.add_argument('--css-allowlist', help="Classes/ids (shell-style patterns) never pruned from CSS", type=str, nargs="+", default=[])
+    parser.add_argument("--no-optimize-images", help="Don't recompress images", dest="optimize_images", action="store_false")
+    parser.add_argument('--image-widths', help="Make copies of wider images scaled to these widths for srcset (needs Pillow)", type=int, nargs="+", default=[])
+    parser.add_argument("--bundle-js", help="Join the local scripts each page loads into one file", action="store_true")
+    parser.add_argument('--jobs', help="Number of worker processes used to minify files (0 uses every CPU)", type=int, default=1)
+    parser.add_argument('--report', help="Write the timing of each stage to this JSON file", type=str, default=None)
+    parser.set_defaults(fingerprint_nonmin=True, do_htmlmin=True, do_inline=True, use_cache=True, optimize_images=True)
     return parser.parse_args()
 
 
@@ -72,96 +247,530 @@ def fingerprint(data, number_of_chars=10):
     return m.hexdigest()[0:number_of_chars]
 
 
-def process_js(base_dir, fingerprint_nonminimized=True):
-    """Searches the base_dir for all JavaScript files.  When found, the file
-    may be minimized (if not already), and may be fingerprinted.
+def minifier_version(kind):
+    """Returns the version of the package used to minify `kind` files."""
+    if kind not in MINIFIER_VERSIONS:
+        package = MINIFIER_PACKAGES[kind]
+        try:
+            import pkg_resources
+            MINIFIER_VERSIONS[kind] = pkg_resources.get_distribution(package).version
+        except Exception:
+            MINIFIER_VERSIONS[kind] = getattr(sys.modules.get(package), "__version__", "unknown")
+
+    return MINIFIER_VERSIONS[kind]
+
+
+def cache_key(text, kind):
+    """Returns the name of the cache entry for minifying `text`.  It changes if
+    the text, the minifier version, or its options change.
+    """
+    m = md5()
+    m.update(text.encode("utf-8"))
+    m.update(json.dumps([kind, minifier_version(kind), MINIFIER_OPTIONS[kind]], sort_keys=True))
+    return m.hexdigest()
+
+
+def cache_path(cache_dir, key):
+    """Returns the path of a cache entry."""
+    return os.path.join(cache_dir, key[:2], key)
+
+
+def cache_get(cache_dir, key, binary=False):
+    """Returns the cached text (or data, if `binary`), or None.  Hits are
+    touched so they're the last to be evicted.
     """
-    js_map = {}
-    js_files = []
+    path = cache_path(cache_dir, key)
+    try:
+        with open(path, "rb") as fh:
+            text = fh.read()
+    except IOError:
+        return None
 
-    # Find all of the JavaScript files
+    os.utime(path, None)
+    return text if binary else text.decode("utf-8")
+
+
+def cache_put(cache_dir, key, text):
+    """Stores the minified text (or data) in the cache.  The entry is written to a
+    temporary file and renamed, so other workers never see part of it.
+    """
+    path = cache_path(cache_dir, key)
+    dirname = os.path.dirname(path)
+    if not os.path.isdir(dirname):
+        try:
+            os.makedirs(dirname)
+        except OSError:
+            # Another worker made it first
+            pass
+
+    # Another worker may have written the same entry
+    buildutils.write_atomic(path, [text.encode("utf-8") if isinstance(text, unicode) else text], replace=False)
+
+
+def find_files(base_dir, extension, exclude=None):
+    """Returns the paths of the files under `base_dir` ending with `extension`
+    (skipping names containing `exclude`).  The walk is sorted so the files are
+    always processed, and reported, in the same order.
+    """
+    paths = []
     for root, dirs, files in os.walk(base_dir):
-        for fname in [x for x in files if x.endswith(".js")]:
-            js_files.append(os.path.join(root, fname))
+        dirs.sort()
+        for fname in sorted(files):
+            if fname.endswith(extension) and not (exclude and (exclude in fname)):
+                paths.append(os.path.join(root, fname))
 
-    # Test each file
-    for js_file in js_files:
-        text = slurp(js_file)
-        dirname, fname = os.path.split(js_file)
-        fbase, fext = os.path.splitext(fname)
+    return paths
 
-        if is_minimized(js_file) and fingerprint_nonminimized:
-            fprint = fingerprint(text)
-        else:
-            text = minify(text)
-            fprint = fingerprint(text)
 
-        new_fname = "%s-%s%s" % (fbase, fprint, fext)  # E.g. "test-12345.js"
-        new_path = os.path.join(dirname, new_fname)
-        with open(new_path, "wb") as fh:
-            fh.write(text)
+def init_worker(max_inline_bytes, css_map=None, js_map=None, other_map=None):
+    """Sets the globals used while processing files.  This is run in each worker
+    process, since they don't share our globals on every platform.
+    """
+    global MAX_INLINE_BYTES, CSS_MAP, JS_MAP, OTHER_MAP, REWRITER
+    MAX_INLINE_BYTES = max_inline_bytes
+    CSS_MAP = css_map
+    JS_MAP = js_map
+    OTHER_MAP = other_map
+    REWRITER = AssetRewriter(css_map, js_map, other_map)
+
+
+def fingerprint_file(item):
+    """Minimizes (if not already) and fingerprints a single CSS or JS file.  The
+    new file is written next to the original.  Returns the new path, and
+    whether the minified text came from the cache (None if the cache wasn't
+    used).
+
+    :param tuple item: The path, the file type ("css" or "js"), whether or
+        not to only fingerprint files that look minimized already, and the
+        cache folder (or None)
+    """
+    path, kind, fingerprint_nonminimized, cache_dir = item
+    text = slurp(path)
+    dirname, fname = os.path.split(path)
+    fbase, fext = os.path.splitext(fname)
+    hit = None
+
+    if is_minimized(path) and fingerprint_nonminimized:
+        fprint = fingerprint(text)
+    else:
+        minified = None
+        if cache_dir:
+            key = cache_key(text, kind)
+            minified = cache_get(cache_dir, key)
+            hit = minified is not None
 
-        new_url = new_path[len(base_dir):].replace("\\", "/")
-        old_url = js_file[len(base_dir):].replace("\\", "/")
-        new_size = os.stat(new_path).st_size
-        old_size = os.stat(js_file).st_size
+        if minified is None:
+            minified = MINIFIERS[kind](text, **MINIFIER_OPTIONS[kind])
+            if cache_dir:
+                cache_put(cache_dir, key, minified)
 
-        print "%s reduced by %0.2f%%" % (old_url, 100.0 * (old_size - new_size) / old_size)
+        text = minified
+        fprint = fingerprint(text)
+
+    new_fname = "%s-%s%s" % (fbase, fprint, fext)  # E.g. "test-12345.js"
+    new_path = os.path.join(dirname, new_fname)
+    with open(new_path, "wb") as fh:
+        fh.write(text)
+
+    return new_path, hit
+
+
+def asset_url(base_dir, path):
+    """Returns the URL of a file under `base_dir`."""
+    return path[len(base_dir):].replace("\\", "/")
+
+
+def resolve_reference(ref, from_url):
+    """Returns the URL (from the root of the site, without any query or
+    fragment) referenced by `ref` in the file at `from_url`.  Returns None for
+    data: URIs and URLs with a scheme or host.
+    """
+    ref = re.split("[?#]", ref, 1)[0]
+    if (not ref) or (":" in ref) or ref.startswith("//"):
+        return None
+
+    if not ref.startswith("/"):
+        ref = posixpath.join(posixpath.dirname(from_url), ref)
+
+    return posixpath.normpath(ref)
 
-        js_map[old_url] = {
-            "url": new_url,
-            "size": os.stat(new_path).st_size,
-            "path": new_path
-        }
 
-        os.unlink(js_file)
+def find_references(text, kind, from_url):
+    """Returns the set of URLs referenced by a CSS or JS file."""
+    refs = set()
+    for regex in REFERENCE_RES[kind]:
+        for match in regex.finditer(text):
+            url = resolve_reference(match.group("ref"), from_url)
+            if url:
+                refs.add(url)
 
-    return js_map
+    return refs
 
 
-def process_css(base_dir, fingerprint_nonminimized=True):
+def rewrite_references(path, kind, from_url, asset_map):
+    """Changes the references in a CSS or JS file to the fingerprinted files in
+    `asset_map`.  The new URLs are from the root of the site, so they still
+    work if the file is inlined.  Returns True if the file was changed.
+    """
+    def replace(match):
+        new = asset_map.get(resolve_reference(match.group("ref"), from_url))
+        if (not new) or (not new["url"]):
+            return match.group(0)
+
+        ref = match.group("ref")
+        suffix = ref[len(re.split("[?#]", ref, 1)[0]):]
+        start, end = match.start("ref") - match.start(), match.end("ref") - match.start()
+        return match.group(0)[:start] + new["url"] + suffix + match.group(0)[end:]
+
+    text = new_text = slurp(path)
+    for regex in REFERENCE_RES[kind]:
+        new_text = regex.sub(replace, new_text)
+
+    if new_text == text:
+        return False
+
+    with open(path, "wb") as fh:
+        fh.write(new_text)
+
+    return True
+
+
+def dependency_levels(base_dir, paths, kind):
+    """Returns the paths in groups.  The files in each group only reference
+    files in earlier groups, so they can be fingerprinted once those have
+    been.  Where files reference each other, one of them is done first (with
+    its references to the others left alone).
+    """
+    urls = dict((asset_url(base_dir, x), x) for x in paths)
+    deps = dict((url, find_references(slurp(path), kind, url) & set(urls) - set([url])) for url, path in urls.items())
+
+    levels = []
+    while deps:
+        ready = sorted(url for url, refs in deps.items() if not (refs & set(deps)))
+        if not ready:
+            ready = [min(deps, key=lambda x: (len(deps[x] & set(deps)), x))]
+            print "circular reference in [%s]; not changing its references to [%s]" % (
+                ready[0], ", ".join(sorted(deps[ready[0]] & set(deps))))
+
+        levels.append([urls[x] for x in ready])
+        for url in ready:
+            del deps[url]
+
+    return levels
+
+
+def process_assets(base_dir, paths, kind, fingerprint_nonminimized=True, jobs=1, cache_dir=None, asset_map=None):
+    """Minimizes and fingerprints each of the files, then removes the
+    originals.  Returns the map of old URL to new URL, size, and path.
+
+    Files that are empty once minified (e.g. CSS that `--prune-css` removed
+    every rule from) don't get a fingerprinted copy; their map entry has no
+    URL or path, and the tags that load them are removed from the HTML.  The
+    original is kept for anything that still references it.
+
+    References to the fingerprinted files in `asset_map` (and to each other)
+    are changed first.  The files are done in dependency order, so a change to
+    any file they reference changes their fingerprint too.
+    """
+    known = dict(asset_map or {})
+    new_map = {}
+    for level in dependency_levels(base_dir, sorted(paths), kind):
+        for path in level:
+            rewrite_references(path, kind, asset_url(base_dir, path), known)
+
+        items = [(x, kind, fingerprint_nonminimized, cache_dir) for x in level]
+        results = buildutils.imap_jobs(
+            fingerprint_file, items, jobs, init_worker, (MAX_INLINE_BYTES, CSS_MAP, JS_MAP, OTHER_MAP)
+        )
+
+        for old_path, (new_path, hit) in zip(level, results):
+            if hit is not None:
+                CACHE_STATS["hits" if hit else "misses"] += 1
+
+            new_url = asset_url(base_dir, new_path)
+            old_url = asset_url(base_dir, old_path)
+            new_size = os.stat(new_path).st_size
+            old_size = os.stat(old_path).st_size
+
+            print "%s reduced by %0.2f%%" % (old_url, 100.0 * (old_size - new_size) / (old_size or 1))
+
+            if not CSS_COMMENT_RE.sub("", slurp(new_path)).strip():
+                print "%s is empty; not fingerprinting it" % old_url
+                if new_path != old_path:
+                    os.unlink(new_path)
+                new_map[old_url] = known[old_url] = {"url": None, "size": 0, "path": None}
+                continue
+
+            new_map[old_url] = known[old_url] = {
+                "url": new_url,
+                "size": new_size,
+                "path": new_path
+            }
+
+            os.unlink(old_path)
+
+    return new_map
+
+
+def process_js(base_dir, fingerprint_nonminimized=True, jobs=1, cache_dir=None, asset_map=None):
+    """Searches the base_dir for all JavaScript files.  When found, the file
+    may be minimized (if not already), and may be fingerprinted.  Minified
+    files are reused from `cache_dir`, if given.  References to the files in
+    `asset_map` are changed to their fingerprinted URLs.
+    """
+    paths = find_files(base_dir, ".js")
+    return process_assets(base_dir, paths, "js", fingerprint_nonminimized, jobs, cache_dir, asset_map)
+
+
+def process_css(base_dir, fingerprint_nonminimized=True, jobs=1, cache_dir=None, asset_map=None):
     """Searches the base_dir for all CSS files.  When found, the file
-    may be minimized (if not already), and may be fingerprinted.
+    may be minimized (if not already), and may be fingerprinted.  Minified
+    files are reused from `cache_dir`, if given.  References to the files in
+    `asset_map` are changed to their fingerprinted URLs.
     """
-    css_map = {}
-    css_files = []
+    paths = find_files(base_dir, ".css", exclude=".min")
+    return process_assets(base_dir, paths, "css", fingerprint_nonminimized, jobs, cache_dir, asset_map)
 
-    for root, dirs, files in os.walk(base_dir):
-        for fname in [x for x in files if x.endswith(".css") and (".min" not in x)]:
-            css_files.append(os.path.join(root, fname))
 
-    for css_file in css_files:
-        text = slurp(css_file)
-        dirname, fname = os.path.split(css_file)
-        fbase, fext = os.path.splitext(fname)
+def find_used_names(base_dir):
+    """Returns the set of classes and ids used in the HTML (including any
+    inline scripts) and every name-like word in the JS.  Anything a script
+    might use as a class or id is counted, so nothing it needs is pruned.
+    """
+    used = set()
+    for path in find_files(base_dir, ".html"):
+        text = slurp(path)
+        for match in CLASS_ATTR_RE.finditer(text):
+            used.update((match.group("dq") or match.group("sq") or match.group("bare") or "").split())
+
+        for script in SCRIPT_BLOCK_RE.findall(text):
+            used.update(JS_NAME_RE.findall(script))
+
+    for path in find_files(base_dir, ".js"):
+        used.update(JS_NAME_RE.findall(slurp(path)))
+
+    return used
+
+
+def split_css_rules(text):
+    """Splits CSS (without comments) into its top-level rules.  Returns a list
+    of (prelude, body) pairs; `body` is None for statements like `@import`.
+    """
+    rules = []
+    depth = 0
+    quote = None
+    start = 0
+    prelude = None
+    for i, char in enumerate(text):
+        if quote:
+            if char == quote:
+                quote = None
+        elif char in "\"'":
+            quote = char
+        elif char == "{":
+            if depth == 0:
+                prelude = text[start:i]
+                start = i + 1
+            depth += 1
+        elif char == "}":
+            depth -= 1
+            if depth == 0:
+                rules.append((prelude.strip(), text[start:i]))
+                start = i + 1
+        elif (char == ";") and (depth == 0):
+            rules.append((text[start:i].strip(), None))
+            start = i + 1
+
+    if text[start:].strip():
+        rules.append((text[start:].strip(), None))
+
+    return rules
+
+
+def selector_used(selector, used, allowlist):
+    """Returns True if every class and id in the selector is used (or
+    allowed).  Classes and ids inside :not() and the like, and attribute
+    selectors, are ignored.
+    """
+    if "\\" in selector:
+        return True
+
+    for _, name in SELECTOR_NAME_RE.findall(SELECTOR_ARGS_RE.sub("", selector)):
+        if (name not in used) and (not any(fnmatch.fnmatchcase(name, x) for x in allowlist)):
+            return False
+
+    return True
 
-        if is_minimized(css_file) and fingerprint_nonminimized:
-            fprint = fingerprint(text)
+
+def prune_css(text, used, allowlist=PRUNE_ALLOWLIST):
+    """Returns the CSS without the rules (and selectors) whose classes or ids
+    aren't in `used`, and the number of selectors removed.  Comments are
+    removed too, other than "/*!" ones (e.g. licenses), which are moved to the
+    top.
+    """
+    removed = 0
+    output = [x.group(0) for x in CSS_COMMENT_RE.finditer(text) if x.group("keep")]
+    for prelude, body in split_css_rules(CSS_COMMENT_RE.sub("", text)):
+        if body is None:
+            output.append(prelude + ";")
+        elif prelude.lower().startswith(tuple(NESTED_AT_RULES)):
+            body, count = prune_css(body, used, allowlist)
+            removed += count
+            if body.strip():
+                output.append("%s{%s}" % (prelude, body))
+        elif prelude.startswith("@"):
+            output.append("%s{%s}" % (prelude, body))
         else:
-            text = compress(text)
-            fprint = fingerprint(text)
+            selectors = [x.strip() for x in prelude.split(",")]
+            kept = [x for x in selectors if selector_used(x, used, allowlist)]
+            removed += len(selectors) - len(kept)
+            if kept:
+                output.append("%s{%s}" % (",".join(kept), body.strip()))
+
+    return "\n".join(output), removed
+
+
+def process_prune_css(base_dir, allowlist=PRUNE_ALLOWLIST):
+    """Removes the unused rules from the CSS files that `process_css()` will
+    minify.  Returns the total size of the files before and after.
+    """
+    used = find_used_names(base_dir)
+    before = after = 0
+    for path in find_files(base_dir, ".css", exclude=".min"):
+        text = slurp(path)
+        pruned, removed = prune_css(text, used, allowlist)
+        before += len(text)
+        after += len(pruned)
+
+        print "%s pruned [%i] selectors (%0.2f%%)" % (
+            asset_url(base_dir, path), removed, 100.0 * (len(text) - len(pruned)) / (len(text) or 1))
+        with open(path, "wb") as fh:
+            fh.write(pruned)
+
+    return before, after
+
+
+def image_cache_key(data, extension, width=None):
+    """Returns the name of the cache entry for optimizing an image (or scaling
+    it to `width`).
+    """
+    m = md5()
+    m.update(data)
+    m.update(json.dumps([extension, width, imageopt.OPTIMIZER_VERSION, imageopt.PILLOW_VERSION]))
+    return m.hexdigest()
+
+
+def cached_image(data, extension, width=None, cache_dir=None):
+    """Returns the optimized image (or a copy scaled to `width`, or None if it
+    can't be), and whether it came from the cache (None if the cache wasn't
+    used).
+    """
+    key = image_cache_key(data, extension, width) if cache_dir else None
+    if key:
+        cached = cache_get(cache_dir, key, binary=True)
+        if (cached is not None) and width:
+            # An empty copy means the image can't be scaled
+            return (cached or None), True
+        elif cached is not None:
+            # The optimized image itself may be empty (e.g. an empty file)
+            return cached, True
+
+    if width:
+        result = imageopt.scale_image(data, extension, width)
+    else:
+        result = imageopt.optimize_image(data, extension)
 
-        new_fname = "%s-%s%s" % (fbase, fprint, fext)
-        new_path = os.path.join(dirname, new_fname)
+    if key:
+        # An empty entry remembers that the image can't be scaled
+        cache_put(cache_dir, key, result or "")
+
+    return result, (False if key else None)
+
+
+def process_other_asset(item):
+    """Optimizes (if it's an image) and fingerprints a single file, and makes
+    its scaled copies.  The new files are written next to the original, which
+    is replaced by the optimized image.  Returns the new path, the size of the
+    original, the width of the image (or None), the list of (width, path) of
+    the scaled copies, and the list of cache hits (True) and misses (False).
+
+    :param tuple item: The path, whether or not to optimize images, the widths
+        to scale them to, and the cache folder (or None)
+    """
+    path, optimize, widths, cache_dir = item
+    with open(path, "rb") as fh:
+        data = fh.read()
+
+    fbase, fext = os.path.splitext(path)
+    original_size = len(data)
+    image_width = None
+    variants = []
+    hits = []
+
+    if optimize and (fext.lower() in imageopt.OPTIMIZERS):
+        optimized, hit = cached_image(data, fext, None, cache_dir)
+        hits.append(hit)
+        if len(optimized) < len(data):
+            with open(path, "wb") as fh:
+                fh.write(optimized)
+
+        for width in widths:
+            scaled, hit = cached_image(data, fext, width, cache_dir)
+            hits.append(hit)
+            if scaled:
+                variant_path = "%s-%iw-%s%s" % (fbase, width, fingerprint(scaled), fext)
+                if not os.path.exists(variant_path):
+                    with open(variant_path, "wb") as fh:
+                        fh.write(scaled)
+                variants.append((width, variant_path))
+
+        if variants:
+            image_width = imageopt.image_width(data)
+        data = optimized
+
+    new_path = "%s-%s%s" % (fbase, fingerprint(data), fext)
+    if not os.path.exists(new_path):
         with open(new_path, "wb") as fh:
-            fh.write(text)
+            fh.write(data)
+
+    return new_path, original_size, image_width, variants, [x for x in hits if x is not None]
 
-        new_url = new_path[len(base_dir):].replace("\\", "/")
-        old_url = css_file[len(base_dir):].replace("\\", "/")
-        new_size = os.stat(new_path).st_size
-        old_size = os.stat(css_file).st_size
 
-        print "%s reduced by %0.2f%%" % (old_url, 100.0 * (old_size - new_size) / old_size)
+def process_other_assets(base_dir, optimize=True, widths=None, jobs=1, cache_dir=None):
+    """Writes a fingerprinted copy of every image, font, and JSON file (see
+    ASSET_EXTENSIONS).  Images are optimized first, and copies scaled to each
+    of `widths` (if they're wider) are made.  Returns the map of old URL to new
+    URL, size, and path (and the image's width and its scaled copies).
+    """
+    asset_map = {}
+    paths = [x for x in find_files(base_dir, tuple(ASSET_EXTENSIONS)) if not FINGERPRINTED_RE.search(x)]
+    items = [(x, optimize, sorted(widths or []), cache_dir) for x in paths]
+    results = buildutils.imap_jobs(process_other_asset, items, jobs, init_worker, (MAX_INLINE_BYTES,))
+
+    for path, (new_path, original_size, image_width, variants, hits) in zip(paths, results):
+        for hit in hits:
+            CACHE_STATS["hits" if hit else "misses"] += 1
 
-        css_map[old_url] = {
-            "url": new_url,
+        old_url = asset_url(base_dir, path)
+        new_size = os.stat(new_path).st_size
+        if new_size < original_size:
+            print "%s reduced by %0.2f%%" % (old_url, 100.0 * (original_size - new_size) / original_size)
+            IMAGE_STATS["optimized"] += 1
+            IMAGE_STATS["saved"] += original_size - new_size
+
+        asset_map[old_url] = {
+            "url": asset_url(base_dir, new_path),
             "size": new_size,
             "path": new_path
         }
 
-        os.unlink(css_file)
+        if variants and image_width:
+            print "%s scaled to [%s]" % (old_url, ", ".join(str(x) for x, _ in variants))
+            IMAGE_STATS["scaled"] += len(variants)
+            asset_map[old_url]["width"] = image_width
+            asset_map[old_url]["variants"] = [[x, asset_url(base_dir, y)] for x, y in variants]
 
-    return css_map
+    return asset_map
 
 
 def do_inline(new_map, max_bytes=None):
@@ -175,104 +784,525 @@ def shortend_path(path):
     return os.path.join(os.path.split(os.path.split(path)[0])[1], os.path.split(path)[1])
 
 
-def remap_css(text, css_map, html_file, unlink_files):
-    """Remaps or inlines new CSS files."""
-    for old, new in css_map.items():
-        match = re.search("""(<link rel=.?stylesheet.? href=.+%s.*?>)""" % old, text)
-        if not match:
-            continue
-        elif do_inline(new):
-            print "inlining [%s] in [%s]" % (old, shortend_path(html_file))
-            fname = os.path.splitext(os.path.split(old)[1])[0]
-            new_css = """<style type="text/css" title="%s">%s</style>""" % (fname, slurp(new["path"]))
-            text = text.replace(match.group(1), new_css)
-            unlink_files.add(new["path"])
-        else:
-            print "subbing [%s] in [%s]" % (old, shortend_path(html_file))
-            text = text.replace(old, new["url"])
-
-    return text
-
-
-def remap_js(text, js_map, html_file, unlink_files):
-    """Remaps or inlines new JS files."""
-    for old, new in js_map.items():
-        skip_inline = False
-
-        if old.endswith(".js"):
-            match = re.search("""(<script type=.?text/javascript.*?%s.*?</script>)""" % old, text)
-        elif old.endswith(".json"):
-            match = re.search('"%s"' % old, text)
-            skip_inline = True
-
-        if not match:
-            continue
-        elif do_inline(new) and (not skip_inline):
-            print "inlining [%s] in [%s]" % (old, shortend_path(html_file))
-            fname = os.path.splitext(os.path.split(old)[1])[0]
-            new_js = """<script type="text/javascript" title="%s">%s</script>""" % (fname, slurp(new["path"]))
-            text = text.replace(match.group(1), new_js)
-            unlink_files.add(new["path"])
+def trie_pattern(words):
+    """Returns a regular expression that matches any of `words`.  The words are
+    arranged as a trie, so the time to match doesn't grow with their number.
+    """
+    trie = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[""] = {}
+
+    def pattern(node):
+        branches = [re.escape(char) + pattern(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ""
+
+        group = branches[0] if (len(branches) == 1) else "(?:%s)" % "|".join(branches)
+        if "" in node:
+            group = "(?:%s)?" % group
+        return group
+
+    return pattern(trie)
+
+
+def inline_block(kind, old, new):
+    """Returns the <style> or <script> block that inlines a CSS/JS file."""
+    fname = os.path.splitext(os.path.split(old)[1])[0]
+    return INLINE_TEMPLATES[kind] % (fname, slurp(new["path"]))
+
+
+def remap_asset(kind, old, new, match, html_file, unlink_files, skip_inline=False, get_block=inline_block):
+    """Returns the string to replace in the HTML, and what to replace it with,
+    to inline the file referenced by the tag in `match` (or to use its
+    fingerprinted URL).
+
+    :param str kind: "css" or "js"
+    :param str old: The original URL of the file
+    :param dict new: The map entry of the fingerprinted file
+    :param match: The match of the tag that references the file
+    :param str html_file: The path to the HTML file (for the messages)
+    :param set unlink_files: Inlined files are added to this set
+    :param bool skip_inline: Only replace the URL, even if the file is small
+    :param function get_block: Returns the block that inlines the file (see
+        `inline_block()`)
+    """
+    if (not new["url"]) and (not skip_inline):
+        print "dropping empty [%s] in [%s]" % (old, shortend_path(html_file))
+        return match.group(1), ""
+    elif do_inline(new) and (not skip_inline):
+        print "inlining [%s] in [%s]" % (old, shortend_path(html_file))
+        unlink_files.add(new["path"])
+        return match.group(1), get_block(kind, old, new)
+
+    print "subbing [%s] in [%s]" % (old, shortend_path(html_file))
+    return old, new["url"]
+
+
+class AssetRewriter(object):
+    """Remaps or inlines the fingerprinted CSS and JS files in HTML, and remaps
+    the other fingerprinted files (see `process_other_assets()`).
+
+    The tag patterns are compiled once per map instead of once per file and
+    page.  Each page is searched once, with a single pattern, for the start of
+    any of the original URLs, and only the files found there are checked
+    against their tag pattern.  A rewrite can add or remove references, so the
+    area around what it inserted is searched again after each one.
+
+    The results (and messages) are the same as checking every file in the maps
+    against every page, in sorted order, CSS first.  Like the tag patterns, the
+    original CSS/JS URLs are treated as regular expressions; URLs with any
+    special character other than "." are always checked.
+    """
+    def __init__(self, css_map, js_map, other_map=None):
+        self.maps = [("css", css_map or {}), ("js", js_map or {}), ("other", other_map or {})]
+        self.patterns = {}
+        for old in self.maps[0][1]:
+            self.patterns[old] = (re.compile(CSS_TAG_RE % old), False)
+        for old in self.maps[1][1]:
+            self.patterns[old] = (re.compile(JS_TAG_RE % old), False)
+        for old in self.maps[2][1]:
+            self.patterns[old] = (re.compile(OTHER_URL_RE % re.escape(old)), True)
+
+        self.always = set()
+        self.urls = []
+        prefixes = set()
+        for old in sorted(self.patterns):
+            prefix = URL_LITERAL_RE.match(old).group(0)
+            if old in self.maps[2][1]:
+                prefixes.add(prefix or old[0])
+                self.urls.append((old, re.compile(re.escape(old))))
+            elif (not prefix) or URL_SPECIAL_RE.search(old):
+                self.always.add(old)
+            else:
+                prefixes.add(prefix)
+                self.urls.append((old, re.compile(old)))
+
+        self.finder = re.compile(trie_pattern(prefixes)) if prefixes else None
+
+        # Only "." is special in these URLs, so they match that many characters
+        self.width = max([len(x) for x, _ in self.urls] or [0])
+        self.windows = {}
+
+        # Inlined files are read once, then kept with their <style>/<script>
+        # block.  They're all under --max-inline-bytes.
+        self.blocks = {}
+        self.inlined = 0
+        self.reads = 0
+
+    def find(self, text, start=0, end=None):
+        """Returns the set of original URLs that may be referenced in `text`
+        (or the part of it between `start` and `end`).
+        """
+        found = set(self.always)
+        if self.finder is None:
+            return found
+
+        end = len(text) if end is None else end
+        for match in self.finder.finditer(text, start, end):
+            # Matches don't overlap, so a URL may start anywhere in this one
+            first, last = match.span()
+            window = text[first:last - 1 + self.width]
+            key = (window, last - first)
+            urls = self.windows.get(key)
+            if urls is None:
+                # The same few references are found on every page
+                if len(self.windows) > 10000:
+                    self.windows.clear()
+                urls = self.windows[key] = frozenset(x for x, regex in self.urls if self.starts_in(regex, window, last - first))
+            found.update(urls)
+
+        return found
+
+    def find_inserted(self, text, inserted):
+        """Returns the set of original URLs that may be referenced in `text`
+        where (or next to where) `inserted` is.  Any reference that wasn't
+        there before a replacement must be in one of these places.
+        """
+        if not inserted:
+            return self.find(text)
+
+        found = set()
+        margin = max(0, self.width - 1)
+        position = text.find(inserted)
+        while position >= 0:
+            found.update(self.find(text, max(0, position - margin), position + len(inserted) + margin))
+            position = text.find(inserted, position + 1)
+
+        return found
+
+    def inline_block(self, kind, old, new):
+        """Returns the block that inlines a CSS/JS file, reading it the first
+        time it's needed.
+        """
+        self.inlined += 1
+        block = self.blocks.get(old)
+        if block is None:
+            self.reads += 1
+            block = self.blocks[old] = inline_block(kind, old, new)
+
+        return block
+
+    @staticmethod
+    def starts_in(regex, window, length):
+        """Returns True if `regex` matches `window` starting in the first
+        `length` characters.
+        """
+        match = regex.search(window)
+        return bool(match) and (match.start() < length)
+
+    def rewrite(self, text, html_file, unlink_files, used=None):
+        """Returns the HTML with the fingerprinted files remapped or inlined.
+
+        :param str text: The HTML
+        :param str html_file: The path to the HTML file (for the messages)
+        :param set unlink_files: Inlined files are added to this set
+        :param dict used: If given, the original URL of each file remapped or
+            inlined is added, with its fingerprinted URL
+        """
+        found = self.find(text)
+        for kind, asset_map in self.maps:
+            pending = sorted(x for x in found if x in asset_map)
+            while pending:
+                old = pending.pop(0)
+                regex, skip_inline = self.patterns[old]
+                match = regex.search(text)
+                if not match:
+                    continue
+
+                if used is not None:
+                    used[old] = asset_map[old]["url"]
+
+                if kind == "other":
+                    print "subbing [%s] in [%s]" % (old, shortend_path(html_file))
+                    replacement = asset_map[old]["url"]
+                    new_text = regex.sub(lambda _: replacement, text)
+                else:
+                    target, replacement = remap_asset(
+                        kind, old, asset_map[old], match, html_file, unlink_files, skip_inline, self.inline_block
+                    )
+                    new_text = text.replace(target, replacement)
+                if new_text != text:
+                    text = new_text
+                    found.update(self.find_inserted(text, replacement))
+                    pending = sorted(x for x in found if (x in asset_map) and (x > old))
+
+        return text
+
+
+def add_srcset(text, html_file, used=None):
+    """Adds a `srcset` with the scaled copies (and the fingerprinted file) to
+    each <img> tag loading an image that has them, unless it has one already.
+
+    :param dict used: If given, the original URLs of the images are added to
+        it, with their fingerprinted URLs
+    """
+    def replace(match):
+        tag = match.group(0)
+        src = IMG_SRC_RE.search(tag)
+        if (not src) or IMG_SRCSET_RE.search(tag):
+            return tag
+
+        old = resolve_reference(src.group("src"), "/")
+        entry = OTHER_MAP.get(old) if old else None
+        if (not entry) or (not entry.get("variants")):
+            return tag
+
+        print "adding srcset for [%s] in [%s]" % (old, shortend_path(html_file))
+        if used is not None:
+            used[old] = entry["url"]
+
+        srcset = ", ".join("%s %iw" % (url, width) for width, url in entry["variants"] + [[entry["width"], entry["url"]]])
+        return '%s srcset="%s"%s' % (tag[:src.end()], srcset, tag[src.end():])
+
+    return IMG_TAG_RE.sub(replace, text) if OTHER_MAP else text
+
+
+def script_runs(text):
+    """Returns the runs of <script> tags (that load a file) in the HTML with
+    nothing but whitespace between them, as lists of matches.
+    """
+    runs = []
+    for match in SCRIPT_SRC_RE.finditer(text):
+        if runs and (not text[runs[-1][-1].end():match.start()].strip()):
+            runs[-1].append(match)
         else:
-            print "subbing [%s] in [%s]" % (old, shortend_path(html_file))
-            text = text.replace(old, new["url"])
+            runs.append([match])
 
-    return text
+    return runs
 
 
-def process_html(base_dir, css_map, js_map, do_htmlmin=True):
-    """Minimizes the HTML file, optionally replacing fingerprinted files and/or
-    inlining them."""
-    html_files = []
-    unlink_files = set([])
+def bundle_old(match):
+    """Returns the original URL of the fingerprinted JS file loaded by a
+    <script> tag, or None if it can't be bundled.
+    """
+    if BUNDLE_SKIP_RE.search(match.group("attrs") + match.group("rest")):
+        return None
 
-    for root, dirs, files in os.walk(base_dir):
-        for fname in [x for x in files if x.endswith(".html")]:
-            html_files.append(os.path.join(root, fname))
+    old = resolve_reference(match.group("src"), "/")
+    return old if (old and old.endswith(".js") and (old in JS_MAP) and JS_MAP[old]["url"]) else None
+
+
+def write_bundle(olds):
+    """Writes the fingerprinted files of the original URLs, in order, into one
+    file next to the first of them (unless it's already there).  Returns the
+    bundle's URL.
+
+    Each file starts a new statement, and the bundle starts with an empty one
+    so a "use strict" at the top of the first file doesn't apply to the rest.
+    """
+    text = u";" + u"\n;".join(slurp(JS_MAP[x]["path"]) for x in olds)
+    data = text.encode("utf-8")
+    fname = "bundle-%s.js" % fingerprint(data)
+    path = os.path.join(os.path.dirname(JS_MAP[olds[0]]["path"]), fname)
+    url = posixpath.join(posixpath.dirname(JS_MAP[olds[0]]["url"]), fname)
+
+    if not os.path.isfile(path):
+        # Other workers may be writing the same bundle
+        buildutils.write_atomic(path, [data], replace=False)
+
+    return url
+
+
+def bundle_scripts(text, html_file, used=None, bundles=None):
+    """Replaces each run of two or more <script> tags loading fingerprinted JS
+    files with one that loads a bundle of them (see `write_bundle()`).  The
+    scripts still run in the same order, and pages loading the same scripts
+    get the same bundle.
+
+    :param dict used: If given, the original URLs of the bundled files are
+        added to it, with their fingerprinted URLs
+    :param dict bundles: If given, the URL of each bundle is added to it, with
+        the original URLs in it
+    """
+    pieces = []
+    last = 0
+    for run in script_runs(text):
+        # Split the run at the scripts that can't be bundled
+        groups = [[]]
+        for match in run:
+            old = bundle_old(match)
+            if old:
+                groups[-1].append((match, old))
+            elif groups[-1]:
+                groups.append([])
+
+        for group in groups:
+            if len(group) < 2:
+                continue
+
+            olds = [x for _, x in group]
+            url = write_bundle(olds)
+            print "bundling [%s] as [%s] in [%s]" % (", ".join(olds), url, shortend_path(html_file))
+
+            pieces.append(text[last:group[0][0].start()])
+            pieces.append(BUNDLE_TEMPLATE % url)
+            last = group[-1][0].end()
+
+            if used is not None:
+                used.update((x, JS_MAP[x]["url"]) for x in olds)
+            if bundles is not None:
+                bundles[url] = olds
+
+    if not pieces:
+        return text
+
+    pieces.append(text[last:])
+    return u"".join(pieces)
+
+
+def page_settings(css_map, js_map, other_map, do_htmlmin, bundle_js=False):
+    """Returns a hash of everything (other than the page itself and the files
+    it references) that the minified HTML depends on.  Pages in the manifest
+    are only reused if it hasn't changed.
+    """
+    maps = [sorted(x or {}) for x in [css_map, js_map, other_map]]
+    variants = sorted((k, v["variants"]) for k, v in (other_map or {}).items() if v.get("variants"))
+    m = md5()
+    m.update(json.dumps([maps, variants, MAX_INLINE_BYTES, do_htmlmin, bundle_js, htmlmin.__version__], sort_keys=True))
+    return m.hexdigest()
+
+
+def asset_entry(old):
+    """Returns the map entry of the fingerprinted file for an original URL, or
+    None.
+    """
+    for asset_map in [CSS_MAP, JS_MAP, OTHER_MAP]:
+        if asset_map and (old in asset_map):
+            return asset_map[old]
+
+    return None
+
+
+def assets_unchanged(previous):
+    """Returns True if the fingerprinted files referenced by a page (according
+    to its manifest entry) have the same URLs as before.
+    """
+    for old, url in previous["assets"].items():
+        entry = asset_entry(old)
+        if (not entry) or (entry["url"] != url):
+            return False
 
-    for html_file in html_files:
-        text = slurp(html_file)
-        text = remap_css(text, css_map, html_file, unlink_files)
-        text = remap_js(text, js_map, html_file, unlink_files)
+    return True
 
-        if do_htmlmin:
-            text = htmlmin.minify(text, remove_comments=True, remove_empty_space=False)
 
+def reuse_html_file(data, previous, page_cache_dir):
+    """Returns the minified HTML from the last run, if the page and the files
+    it references haven't changed, or None.
+    """
+    if (not page_cache_dir) or (previous["source"] != md5(data).hexdigest()):
+        return None
+
+    text = cache_get(page_cache_dir, previous["output"])
+    if text is None:
+        return None
+
+    return text.encode("utf-8")
+
+
+def minify_html_file(item):
+    """Remaps or inlines the fingerprinted files in a single HTML file, and
+    minimizes it.  Returns what would have been printed, the set of files that
+    were inlined (which can be removed once every page is done), the number
+    of files inlined and read from disk, the page's new manifest entry, and
+    what was done ("minified", "reused" or "unchanged").
+
+    A page is reused from `page_cache_dir` if it and the files it references are
+    the same as in its `previous` manifest entry (the script bundles it loads
+    are written again if they're missing).  The file isn't written if it
+    wouldn't change.
+
+    :param tuple item: The path to the HTML file, whether or not to minimize
+        it, its previous manifest entry (or None), the page cache folder (or
+        None), and whether or not to bundle its scripts
+    """
+    html_file, do_htmlmin, previous, page_cache_dir, bundle_js = item
+    unlink_files = set([])
+    inlined, reads = REWRITER.inlined, REWRITER.reads
+
+    with open(html_file, "rb") as fh:
+        data = fh.read()
+
+    if previous and (not assets_unchanged(previous)):
+        previous = None
+
+    if previous and (md5(data).hexdigest() == previous["output"]):
+        # Already done (e.g. the file wasn't rebuilt)
+        unlink_files.update(asset_entry(x)["path"] for x in previous["inlined"])
+        for olds in previous["bundles"].values():
+            write_bundle(olds)
+        return "", unlink_files, 0, 0, previous, "unchanged"
+
+    output = reuse_html_file(data, previous, page_cache_dir) if previous else None
+    if output is not None:
+        entry = previous
+        action = "reused"
+        unlink_files.update(asset_entry(x)["path"] for x in previous["inlined"])
+        for olds in previous["bundles"].values():
+            write_bundle(olds)
+        printed = ""
+    else:
+        used = {}
+        bundles = {}
+        stdout = sys.stdout
+        sys.stdout = StringIO()
+        try:
+            text = unicode(data)
+            if bundle_js:
+                text = bundle_scripts(text, html_file, used, bundles)
+            text = add_srcset(text, html_file, used)
+            text = REWRITER.rewrite(text, html_file, unlink_files, used)
+
+            if do_htmlmin:
+                text = htmlmin.minify(text, remove_comments=True, remove_empty_space=False)
+
+            printed = sys.stdout.getvalue()
+        finally:
+            sys.stdout = stdout
+
+        output = text.encode("utf-8")
+        action = "minified"
+        entry = {
+            "source": md5(data).hexdigest(),
+            "output": md5(output).hexdigest(),
+            "assets": used,
+            "inlined": sorted(x for x in used if asset_entry(x)["path"] in unlink_files),
+            "bundles": bundles
+        }
+        if page_cache_dir:
+            cache_put(page_cache_dir, entry["output"], text)
+
+    if output != data:
         with open(html_file, "wb") as fh:
-            fh.write(text)
+            fh.write(output)
+
+    return printed, unlink_files, REWRITER.inlined - inlined, REWRITER.reads - reads, entry, action
+
+
+def process_html(
+    base_dir, css_map, js_map, do_htmlmin=True, jobs=1, other_map=None, manifest=None, page_cache_dir=None,
+    bundle_js=False
+):
+    """Minimizes the HTML file, optionally replacing fingerprinted files and/or
+    inlining them.  Returns the new manifest.
+
+    :param dict manifest: The manifest from the last run; pages that haven't
+        changed are reused from `page_cache_dir`
+    :param bool bundle_js: Join the scripts loaded one after another into one
+        file (see `bundle_scripts()`)
+    """
+    html_files = find_files(base_dir, ".html")
+    unlink_files = set([])
+
+    settings = page_settings(css_map, js_map, other_map, do_htmlmin, bundle_js)
+    pages = manifest["pages"] if (manifest and (manifest.get("settings") == settings)) else {}
+    new_pages = {}
+
+    items = [(x, do_htmlmin, pages.get(asset_url(base_dir, x)), page_cache_dir, bundle_js) for x in html_files]
+    results = buildutils.imap_jobs(
+        minify_html_file, items, jobs, init_worker, (MAX_INLINE_BYTES, css_map, js_map, other_map)
+    )
+    for html_file, (output, inlined_files, inlined, reads, entry, action) in zip(html_files, results):
+        sys.stdout.write(output)
+        unlink_files.update(inlined_files)
+        INLINE_STATS["inlined"] += inlined
+        INLINE_STATS["reads"] += reads
+        HTML_STATS[action] += 1
+        new_pages[asset_url(base_dir, html_file)] = entry
+
+    bundles = set()
+    for entry in new_pages.values():
+        bundles.update(entry["bundles"])
+        BUNDLE_STATS["pages"] += 1 if entry["bundles"] else 0
+        BUNDLE_STATS["tags"] += sum(len(x) - 1 for x in entry["bundles"].values())
+    BUNDLE_STATS["bundles"] = len(bundles)
 
     for unlink_file in unlink_files:
         os.unlink(unlink_file)
 
+    return {"version": MANIFEST_VERSION, "settings": settings, "pages": new_pages}
 
-def process_other_fingerprints(static_dir, fingerprints):
-    """Process the fingerprints that need a bit more finesse than straight
-    automatic.
-    """
-    for old, files in fingerprints.items():
-        fpath = os.path.join(static_dir, *old.split("/"))
-        if not os.path.exists(fpath):
-            continue
 
-        data = slurp(fpath)
-        dirname, fname = os.path.split(fpath)
-        fbase, fext = os.path.splitext(fname)
+def load_manifest(path):
+    """Returns the manifest written by the last run, or None."""
+    if (not path) or (not os.path.isfile(path)):
+        return None
 
-        fprint = fingerprint(data)
-        new_fname = "%s-%s%s" % (fbase, fprint, fext)
-        new_path = os.path.join(dirname, new_fname)
-        new_url = new_path[len(static_dir):].replace("\\", "/")
+    try:
+        with open(path, "rb") as fh:
+            manifest = json.load(fh)
+    except ValueError:
+        return None
 
-        os.rename(fpath, new_path)
+    return manifest if (manifest.get("version") == MANIFEST_VERSION) else None
 
-        for file_ in files:
-            new_file_path = os.path.join(static_dir, *file_.split("/"))
-            text = slurp(new_file_path)
-            if old in text:
-                text = text.replace(old, new_url)
 
-                with open(new_file_path, "wb") as fh:
-                    fh.write(text)
+def save_manifest(path, manifest):
+    """Writes the manifest."""
+    with open(path, "wb") as fh:
+        json.dump(manifest, fh, indent=0, sort_keys=True)
 
 
 if __name__ == '__main__':
@@ -283,7 +1313,59 @@ if __name__ == '__main__':
     else:
         MAX_INLINE_BYTES = args.max_inline_bytes
 
-    process_other_fingerprints(args.static_dir, OTHER_FINGERPRINTS)
-    css_map = process_css(args.static_dir, args.fingerprint_nonmin)
-    js_map = process_js(args.static_dir, args.fingerprint_nonmin)
-    process_html(args.static_dir, css_map, js_map, args.do_htmlmin)
+    cache_dir = args.cache_dir if args.use_cache else None
+    page_cache_dir = args.page_cache_dir if args.use_cache else None
+    report = buildstats.Report("minify")
+
+    with report.stage("assets") as stage:
+        widths = args.image_widths
+        if widths and (imageopt.Image is None):
+            print "Pillow isn't installed; not making scaled copies of images"
+            widths = []
+
+        other_map = process_other_assets(args.static_dir, args.optimize_images, widths, args.jobs, cache_dir)
+        stage.files = len(other_map)
+        stage.bytes_out = sum(x["size"] for x in other_map.values())
+        stage.bytes_in = stage.bytes_out + IMAGE_STATS["saved"]
+
+    if args.prune_css:
+        with report.stage("prune_css") as stage:
+            stage.bytes_in, stage.bytes_out = process_prune_css(args.static_dir, PRUNE_ALLOWLIST + args.css_allowlist)
+
+    with report.stage("css") as stage:
+        _, stage.bytes_in = buildstats.tree_size(args.static_dir, [".css"])
+        css_map = process_css(args.static_dir, args.fingerprint_nonmin, args.jobs, cache_dir, other_map)
+        stage.files = len(css_map)
+        stage.bytes_out = sum(x["size"] for x in css_map.values())
+
+    with report.stage("js") as stage:
+        _, stage.bytes_in = buildstats.tree_size(args.static_dir, [".js"])
+        js_map = process_js(args.static_dir, args.fingerprint_nonmin, args.jobs, cache_dir, dict(other_map, **css_map))
+        stage.files = len(js_map)
+        stage.bytes_out = sum(x["size"] for x in js_map.values())
+
+    with report.stage("html") as stage:
+        stage.files, stage.bytes_in = buildstats.tree_size(args.static_dir, [".html"])
+        manifest = load_manifest(args.manifest) if page_cache_dir else None
+        manifest = process_html(
+            args.static_dir, css_map, js_map, args.do_htmlmin, args.jobs, other_map, manifest, page_cache_dir,
+            args.bundle_js
+        )
+        save_manifest(args.manifest, manifest)
+        _, stage.bytes_out = buildstats.tree_size(args.static_dir, [".html"])
+
+    print "Images: [%(optimized)i] optimized, [%(saved)i] bytes saved, [%(scaled)i] scaled copies" % IMAGE_STATS
+    print "HTML pages: [%(minified)i] minified, [%(reused)i] reused, [%(unchanged)i] unchanged" % HTML_STATS
+    print "Inlined files: [%i] times, [%i] read from disk, [%i] reads saved" % (
+        INLINE_STATS["inlined"], INLINE_STATS["reads"], INLINE_STATS["inlined"] - INLINE_STATS["reads"]
+    )
+
+    if args.bundle_js:
+        print "Script bundles: [%(bundles)i] on [%(pages)i] pages, [%(tags)i] <script> tags removed" % BUNDLE_STATS
+
+    if cache_dir:
+        CACHE_STATS["evicted"] = buildutils.prune_cache(cache_dir, args.cache_max_mb * 1024 * 1024)
+        CACHE_STATS["evicted_pages"] = buildutils.prune_cache(page_cache_dir, args.page_cache_max_mb * 1024 * 1024)
+        print "Minify cache: [%(hits)i] hits, [%(misses)i] misses, evicted [%(evicted)i] entries and [%(evicted_pages)i] pages" % CACHE_STATS
+
+    report.finish(args.report)
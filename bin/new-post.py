@@ -22,6 +22,8 @@ import sys
 import time
 import subprocess
 
+import buildstats
+
 
 # Metadata #####################################################################
 __author__ = "Timothy McFadden"
@@ -124,5 +126,15 @@ def set_front_matter(path, title, filename):
 
 if __name__ == '__main__':
     (title, filename) = get_title_and_filename(sys.argv)
-    path = create_post(filename)
-    set_front_matter(path, title, filename)
+    report = buildstats.Report("new-post")
+
+    with report.stage("create"):
+        path = create_post(filename)
+
+    with report.stage("front_matter") as stage:
+        set_front_matter(path, title, filename)
+        stage.files = 1
+        stage.bytes_out = os.stat(path).st_size
+
+    # Only written if BUILDSTATS_DIR is set
+    report.finish()
@@ -0,0 +1,284 @@
+#!/usr/bin/env python2.7
+"""
+This script writes gzip (and, if the `brotli` module is installed, brotli)
+copies of every compressible file in the static folder, next to the file
+(e.g. "index.html.gz" and "index.html.br").  Hosts that support precompressed
+files can then serve them without compressing each response.
+
+`--mode fast` uses the default compression levels; `--mode max` (the default)
+uses the highest ones, which is slower but only has to be done once per file.
+
+Files smaller than --min-bytes, or that don't compress to less than
+--max-ratio of their size, get no copies (any stale ones are removed).  The
+MD5 of each file is kept in --manifest, so files that haven't changed since
+the last run are skipped.  The copies are also kept in --cache-dir by MD5, so
+they're reused after the static folder has been cleaned and rebuilt.
+
+A report of the sizes by file type is printed at the end.
+"""
+
+# Imports ######################################################################
+import os
+import json
+import argparse
+from hashlib import md5
+
+import buildstats
+import buildutils
+
+
+# Metadata #####################################################################
+__author__ = "Timothy McFadden"
+__creationDate__ = "10/18/2026"
+__license__ = "MIT"
+
+
+# Globals ######################################################################
+THIS_DIR = os.path.abspath(os.path.dirname(__file__))
+STATIC_DIR = os.path.join(THIS_DIR, "..", "mtik00.github.io")
+
+# Remembers the MD5 of each file compressed, so unchanged files can be skipped.
+# Kept outside of the static folder so it's not published.
+MANIFEST_FILE = os.path.join(THIS_DIR, "..", ".precompress-manifest.json")
+
+# Bump this if the layout of the manifest changes
+MANIFEST_VERSION = 1
+
+# Compressed copies by the MD5 of the file (and mode), and the most it can hold
+CACHE_DIR = os.path.join(THIS_DIR, "..", ".precompress-cache")
+CACHE_MAX_MB = 64
+
+# Files with these extensions are compressed
+COMPRESSIBLE_EXTENSIONS = [".html", ".css", ".js", ".json", ".xml", ".svg", ".txt", ".map", ".ico", ".ttf", ".eot", ".otf"]
+
+# The extensions of the copies written
+SIBLING_EXTENSIONS = [".gz", ".br"]
+
+# The gzip level and brotli quality used by each --mode
+LEVELS = {
+    "fast": {"gzip": 6, "brotli": 5},
+    "max": {"gzip": 9, "brotli": 11}
+}
+
+# Files smaller than this aren't worth compressing
+MIN_BYTES = 256
+
+# Copies that aren't at most this fraction of the original size are skipped
+MAX_RATIO = 0.9
+
+
+def get_args():
+    """Parse the command-line arguments."""
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--static-dir', help="The base directory to process", type=str, default=STATIC_DIR)
+    parser.add_argument('--mode', help="Compression levels to use", choices=sorted(LEVELS), default="max")
+    parser.add_argument('--min-bytes', help="Don't compress files smaller than this", type=int, default=MIN_BYTES)
+    parser.add_argument('--max-ratio', help="Skip copies larger than this fraction of the original", type=float, default=MAX_RATIO)
+    parser.add_argument('--manifest', help="Where to remember the files already compressed", type=str, default=MANIFEST_FILE)
+    parser.add_argument('--cache-dir', help="Where to keep previously compressed files", type=str, default=CACHE_DIR)
+    parser.add_argument('--cache-max-mb', help="Maximum size of the cache", type=int, default=CACHE_MAX_MB)
+    parser.add_argument("--force", help="Compress every file, ignoring the manifest and cache", action="store_true")
+    parser.add_argument('--jobs', help="Number of worker processes (0 uses every CPU)", type=int, default=0)
+    parser.add_argument('--report', help="Write the timing of each stage to this JSON file", type=str, default=None)
+    return parser.parse_args()
+
+
+def compress_cached(data, digest, ext, levels, cache_dir=None):
+    """Returns the data compressed for the sibling extension `ext` (".gz" or
+    ".br"), from the cache if it's there.  Returns None if it can't be
+    compressed that way.
+    """
+    compress = {
+        ".gz": lambda: buildutils.gzip_data(data, levels["gzip"]),
+        ".br": lambda: buildutils.brotli_data(data, levels["brotli"])
+    }[ext]
+    if not cache_dir:
+        return compress()
+
+    name = "%s-%i-%i%s" % (digest, levels["gzip"], levels["brotli"], ext)
+    path = os.path.join(cache_dir, digest[:2], name)
+    if os.path.isfile(path):
+        os.utime(path, None)
+        with open(path, "rb") as fh:
+            return fh.read()
+
+    compressed = compress()
+    if compressed is not None:
+        if not os.path.isdir(os.path.dirname(path)):
+            try:
+                os.makedirs(os.path.dirname(path))
+            except OSError:
+                # Another worker made it first
+                pass
+        buildutils.write_atomic(path, [compressed], replace=False)
+
+    return compressed
+
+
+def find_files(base_dir, extensions):
+    """Returns the sorted paths (relative to `base_dir`, with "/") of the files
+    ending with one of `extensions`.  The .git folder is skipped.
+    """
+    paths = []
+    for root, dirs, files in os.walk(base_dir):
+        dirs[:] = [x for x in dirs if x != ".git"]
+        for fname in files:
+            if fname.lower().endswith(tuple(extensions)):
+                relpath = os.path.relpath(os.path.join(root, fname), base_dir)
+                paths.append(relpath.replace(os.sep, "/"))
+
+    return sorted(paths)
+
+
+def load_manifest(path, mode):
+    """Returns the {relative path: entry} manifest written by the last run in
+    the same `mode`, or an empty one.
+    """
+    if (not path) or (not os.path.isfile(path)):
+        return {}
+
+    try:
+        with open(path, "rb") as fh:
+            manifest = json.load(fh)
+    except ValueError:
+        return {}
+
+    if (manifest.get("version") != MANIFEST_VERSION) or (manifest.get("mode") != mode):
+        return {}
+
+    return manifest["files"]
+
+
+def save_manifest(path, mode, files):
+    """Writes the manifest."""
+    data = json.dumps({"version": MANIFEST_VERSION, "mode": mode, "files": files}, indent=0, sort_keys=True)
+    buildutils.write_atomic(path, [data])
+
+
+def compress_file(item):
+    """Writes the compressed copies of one file, or removes them if they aren't
+    worth keeping.  Returns the file's manifest entry, and whether or not it
+    was skipped because it hasn't changed.
+
+    :param tuple item: The path to the file, its entry in the manifest (or
+        None), the compression levels, the minimum size, the maximum ratio, and
+        the cache folder (or None)
+    """
+    path, previous, levels, min_bytes, max_ratio, cache_dir = item
+    with open(path, "rb") as fh:
+        data = fh.read()
+
+    digest = md5(data).hexdigest()
+    if previous and (previous["md5"] == digest) and all(
+        os.path.isfile(path + ext) == (previous.get(ext[1:]) is not None) for ext in SIBLING_EXTENSIONS
+    ):
+        return previous, True
+
+    entry = {"md5": digest, "size": len(data), "gz": None, "br": None}
+    copies = []
+    if len(data) >= min_bytes:
+        copies = [(x, compress_cached(data, digest, x, levels, cache_dir)) for x in SIBLING_EXTENSIONS]
+
+    for ext, compressed in copies:
+        if (compressed is not None) and (len(compressed) <= max_ratio * len(data)):
+            buildutils.write_atomic(path + ext, [compressed])
+            entry[ext[1:]] = len(compressed)
+
+    for ext in SIBLING_EXTENSIONS:
+        if (entry[ext[1:]] is None) and os.path.isfile(path + ext):
+            os.unlink(path + ext)
+
+    return entry, False
+
+
+def precompress(static_dir, mode="max", min_bytes=MIN_BYTES, max_ratio=MAX_RATIO, manifest=None, jobs=0, cache_dir=None):
+    """Writes the compressed copies of every compressible file in `static_dir`.
+    Returns the new manifest, and {extension: totals} for the report.
+
+    :param dict manifest: The manifest from the last run, used to skip files
+        that haven't changed
+    """
+    manifest = manifest or {}
+    relpaths = find_files(static_dir, COMPRESSIBLE_EXTENSIONS)
+
+    # Copies left behind by files that have since been removed
+    for relpath in set(manifest) - set(relpaths):
+        for ext in SIBLING_EXTENSIONS:
+            path = os.path.join(static_dir, *relpath.split("/")) + ext
+            if os.path.isfile(path):
+                os.unlink(path)
+
+    items = [
+        (os.path.join(static_dir, *x.split("/")), manifest.get(x), LEVELS[mode], min_bytes, max_ratio, cache_dir)
+        for x in relpaths
+    ]
+
+    files = {}
+    totals = {}
+    for relpath, (entry, unchanged) in zip(relpaths, buildutils.imap_jobs(compress_file, items, jobs)):
+        files[relpath] = entry
+
+        ext = os.path.splitext(relpath)[1].lower()
+        total = totals.setdefault(ext, {"files": 0, "unchanged": 0, "skipped": 0, "bytes": 0, "gz": 0, "br": 0})
+        total["files"] += 1
+        total["unchanged"] += unchanged
+        total["bytes"] += entry["size"]
+
+        if (entry["gz"] is None) and (entry["br"] is None):
+            total["skipped"] += 1
+
+        # Files without a copy are served as they are
+        for key in ["gz", "br"]:
+            total[key] += entry["size"] if (entry[key] is None) else entry[key]
+
+    return files, totals
+
+
+def print_report(totals):
+    """Display the sizes by file type."""
+    def kb(size):
+        return "%.01fkb" % (size / 1024.0)
+
+    def ratio(size, whole):
+        return "%.01f%%" % (100.0 * size / whole) if whole else "n/a"
+
+    print "===== Precompressed Files ============================="
+    print "    %-6s %6s %9s %8s %11s %11s %7s %11s %7s" % (
+        "type", "files", "unchanged", "skipped", "raw", "gzip", "", "brotli", "")
+
+    grand = {"files": 0, "unchanged": 0, "skipped": 0, "bytes": 0, "gz": 0, "br": 0}
+    for ext, total in sorted(totals.items()) + [("total", grand)]:
+        if ext != "total":
+            for key in grand:
+                grand[key] += total[key]
+
+        brotlied = (kb(total["br"]), ratio(total["br"], total["bytes"])) if buildutils.brotli else ("n/a", "")
+        print "    %-6s %6i %9i %8i %11s %11s %7s %11s %7s" % (
+            ext, total["files"], total["unchanged"], total["skipped"], kb(total["bytes"]),
+            kb(total["gz"]), ratio(total["gz"], total["bytes"]), brotlied[0], brotlied[1]
+        )
+
+
+if __name__ == '__main__':
+    args = get_args()
+    report = buildstats.Report("precompress")
+
+    with report.stage("compress") as stage:
+        manifest = {} if args.force else load_manifest(args.manifest, args.mode)
+        cache_dir = None if args.force else args.cache_dir
+        files, totals = precompress(
+            args.static_dir, args.mode, args.min_bytes, args.max_ratio, manifest, args.jobs, cache_dir
+        )
+        save_manifest(args.manifest, args.mode, files)
+        if cache_dir:
+            buildutils.prune_cache(cache_dir, args.cache_max_mb * 1024 * 1024)
+
+        stage.files = len(files)
+        stage.bytes_in = sum(x["size"] for x in files.values())
+        stage.bytes_out = sum((x["gz"] or 0) + (x["br"] or 0) for x in files.values())
+
+    if buildutils.brotli is None:
+        print "The brotli module isn't installed; only writing .gz files"
+
+    print_report(totals)
+    report.finish(args.report)
@@ -0,0 +1,181 @@
+#!/usr/bin/env python2.7
+"""
+This module waits for files under a few folders to change, for `fab watch`.
+
+If the `watchdog` package is installed, the operating system tells us about
+changes as they happen.  Otherwise (or with `polling=True`) the modification
+time and size of every file are checked every few seconds.
+
+Changes are debounced: `Watcher.wait()` only returns once nothing else has
+changed for a moment, so saving several files at once (or an editor writing a
+temporary file and renaming it) leads to one rebuild.
+
+Usage:
+    watcher = sitewatch.Watcher(["site/content", "site/static"])
+    while True:
+        paths, first_change = watcher.wait()
+        ...
+"""
+
+# Imports ######################################################################
+import os
+import time
+import fnmatch
+import threading
+
+try:
+    from watchdog.observers import Observer
+    from watchdog.events import FileSystemEventHandler
+except ImportError:
+    Observer = None
+    FileSystemEventHandler = object
+
+
+# Metadata #####################################################################
+__author__ = "Timothy McFadden"
+__creationDate__ = "10/18/2026"
+__license__ = "MIT"
+
+
+# Globals ######################################################################
+# Seconds without a change before `wait()` returns
+DEBOUNCE = 0.3
+
+# Seconds between checks when polling
+POLL_INTERVAL = 1.0
+
+# Seconds between checks for the end of a burst of changes, with watchdog
+WATCHDOG_INTERVAL = 0.1
+
+# Editor backup/swap files, which never need a rebuild
+IGNORE_PATTERNS = ["*~", "*.swp", "*.swx", "*.tmp", ".#*", "#*#", "4913"]
+
+# Folders that are never watched
+IGNORE_DIRS = [".git"]
+
+
+def ignored(path, ignore=None):
+    """Returns True if a change to `path` doesn't matter: it's an editor's
+    temporary file, in one of the IGNORE_DIRS, or starts with one of the
+    `ignore` paths.
+    """
+    parts = os.path.normpath(path).split(os.sep)
+    if any(x in IGNORE_DIRS for x in parts):
+        return True
+    elif any(fnmatch.fnmatch(parts[-1], x) for x in IGNORE_PATTERNS):
+        return True
+
+    return any(os.path.normpath(path).startswith(x) for x in (ignore or []))
+
+
+def snapshot(dirs):
+    """Returns the modification time and size of every file under `dirs`."""
+    files = {}
+    for base_dir in dirs:
+        for root, dirnames, fnames in os.walk(base_dir):
+            dirnames[:] = [x for x in dirnames if x not in IGNORE_DIRS]
+            for fname in fnames:
+                path = os.path.join(root, fname)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    # Removed since the folder was listed
+                    continue
+                files[path] = (stat.st_mtime, stat.st_size)
+
+    return files
+
+
+def changed_paths(previous, current):
+    """Returns the paths added, removed, or changed between two snapshots."""
+    paths = set(x for x in current if previous.get(x) != current[x])
+    paths.update(x for x in previous if x not in current)
+    return paths
+
+
+class EventHandler(FileSystemEventHandler):
+    """Passes the paths of the watchdog events to the `Watcher`."""
+    def __init__(self, watcher):
+        self.watcher = watcher
+
+    def on_any_event(self, event):
+        # A folder is "modified" whenever a file in it is, which we'll hear about
+        if event.is_directory and (event.event_type == "modified"):
+            return
+
+        self.watcher.add([event.src_path, getattr(event, "dest_path", None)])
+
+
+class Watcher(object):
+    """Collects the paths that change under `dirs`, with watchdog (if it's
+    installed and `polling` isn't set) or by polling every `interval` seconds.
+
+    :param list ignore: Paths (or the start of them) whose changes don't
+        matter, e.g. files written by the build itself
+    """
+    def __init__(self, dirs, debounce=DEBOUNCE, interval=POLL_INTERVAL, polling=False, ignore=None):
+        self.dirs = [os.path.normpath(x) for x in dirs if os.path.isdir(x)]
+        self.debounce = debounce
+        self.interval = interval
+        self.ignore = [os.path.normpath(x) for x in (ignore or [])]
+        self.lock = threading.Lock()
+        self.pending = set()
+        self.first_change = self.last_change = None
+        self.observer = None
+        self.files = None
+
+        if (Observer is not None) and (not polling):
+            self.observer = Observer()
+            handler = EventHandler(self)
+            for path in self.dirs:
+                self.observer.schedule(handler, path, recursive=True)
+            self.observer.start()
+        else:
+            self.files = snapshot(self.dirs)
+
+    @property
+    def mode(self):
+        """How changes are found ("watchdog" or "polling")."""
+        return "watchdog" if self.observer else "polling"
+
+    def add(self, paths):
+        """Records the paths as changed (unless they're ignored)."""
+        paths = set(x for x in paths if x and (not ignored(x, self.ignore)))
+        if not paths:
+            return
+
+        with self.lock:
+            now = time.time()
+            self.pending.update(paths)
+            self.first_change = self.first_change or now
+            self.last_change = now
+
+    def poll(self):
+        """Checks every file for changes (when not using watchdog)."""
+        files = snapshot(self.dirs)
+        self.add(changed_paths(self.files, files))
+        self.files = files
+
+    def wait(self):
+        """Blocks until files have changed, and nothing else has for `debounce`
+        seconds.  Returns the set of changed paths, and the time of the first
+        change.
+        """
+        while True:
+            if not self.observer:
+                self.poll()
+
+            with self.lock:
+                if self.pending and (time.time() - self.last_change >= self.debounce):
+                    paths, first_change = self.pending, self.first_change
+                    self.pending = set()
+                    self.first_change = self.last_change = None
+                    return paths, first_change
+
+            time.sleep(WATCHDOG_INTERVAL if self.observer else self.interval)
+
+    def stop(self):
+        """Stops watching."""
+        if self.observer:
+            self.observer.stop()
+            self.observer.join()
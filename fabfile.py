@@ -5,15 +5,22 @@ This script is used to control deployment of my static HTML site.
 # Imports ######################################################################
 import os
 import re
+import sys
 import time
-import zlib
+import shutil
+import atexit
 
-from fabric.api import local, env, task
+from fabric.api import local, env, task, quiet
 from fabric.colors import red
 from fabric.context_managers import lcd
 from fabric.utils import puts
 from fabric.tasks import execute
 
+sys.path.append(os.path.join(os.path.abspath(os.path.dirname(__file__)), "bin"))
+import buildstats
+import buildmanifest
+import sitewatch
+
 
 # Metadata #####################################################################
 __author__ = "Timothy McFadden"
@@ -24,33 +31,119 @@ __license__ = "MIT"
 MAIN_DIR = os.path.abspath(os.path.dirname(__file__))
 STATIC_DIR = os.path.abspath(os.path.join(MAIN_DIR, "mtik00.github.io"))
 BIN_DIR = os.path.abspath(os.path.join(MAIN_DIR, "bin"))
+
+# `build` writes everything here first, then copies only the files that changed
+# into STATIC_DIR (see `buildmanifest.sync()`)
+STAGING_DIR = os.path.abspath(os.path.join(MAIN_DIR, ".staging"))
 HTMLMIN = True
+
+# The search index written by make-search-index.py.  This must match the
+# `lunr_format` param in site/config.toml, which picks the script that reads it.
+# JSON_PRETTY only applies to the "raw" format.
+INDEX_FORMAT = "compact"
 JSON_PRETTY = True
 
+# Run minify.py over the build (`fab watch:minify=yes`).  Its manifest and cache
+# mean only the changed files, and the pages that use them, are minified again.
+MINIFY = False
+
+# What `fab watch` watches.  The search index is written into site/static by
+# the rebuild itself, so changes to it are ignored.
+CONTENT_DIR = os.path.join(MAIN_DIR, "site", "content")
+WATCH_DIRS = [
+    CONTENT_DIR,
+    os.path.join(MAIN_DIR, "site", "layouts"),
+    os.path.join(MAIN_DIR, "site", "static"),
+    os.path.join(MAIN_DIR, "site", "themes")
+]
+WATCH_IGNORE = [os.path.join(MAIN_DIR, "site", "static", "js", "lunr-index")]
+
+# Write .gz/.br copies of the static files with precompress.py.  Only worth it on
+# a host that serves them (GitHub Pages doesn't).  "max" compresses them as much
+# as possible; "fast" is for `dev`.
+PRECOMPRESS = False
+PRECOMPRESS_MODE = "max"
+
+# The timing of each stage of the build.  Scripts run by the tasks write their
+# own reports into REPORT_DIR, which are added to this one.
+REPORT = buildstats.Report("fab")
+REPORT_DIR = os.path.join(MAIN_DIR, ".buildstats")
+REPORT_FILE = os.path.join(MAIN_DIR, "build-report.json")
+
+# `deploy` appends each report to this file, and compares the stages against
+# the last few deploys.
+HISTORY_FILE = os.path.join(MAIN_DIR, "build-history.jsonl")
+
+
+# The content hash of every file in STATIC_DIR: as of the last build, and as of
+# the last release.  `release` only stages the files that differ.
+BUILD_MANIFEST = os.path.join(MAIN_DIR, ".build-manifest.json")
+RELEASE_MANIFEST = os.path.join(MAIN_DIR, ".release-manifest.json")
+
+# Files are staged a few at a time, to stay under the Windows command-line limit
+GIT_ADD_MAX_CHARS = 4000
+
 
 # Fabric environment setup #####################################################
 env.colorize_errors = True
 ################################################################################
 
 
-def crc(path, offset=0):
-    '''
-    Returns the CRC-32 for the file.
-    '''
-    prev = offset
-    for line in open(path, 'rb'):
-        prev = zlib.crc32(line, prev)
+def run_script(command, name):
+    """Runs one of the scripts in bin/, adding its build report (written as
+    REPORT_DIR/<name>.json) to ours.
+    """
+    path = os.path.join(REPORT_DIR, "%s.json" % name)
+    if os.path.exists(path):
+        os.remove(path)
+
+    os.environ[buildstats.REPORT_DIR_ENV] = REPORT_DIR
+    local(command)
+    REPORT.include(path)
+
+
+def update_manifest():
+    """Writes the manifest of the static files, and reports what changed since
+    the last build.  Returns the manifest.
+    """
+    with REPORT.stage("manifest") as stage:
+        previous = buildmanifest.load(BUILD_MANIFEST)
+        manifest = buildmanifest.build(STATIC_DIR, previous)
+        added, changed, removed = buildmanifest.diff(previous, manifest)
+        buildmanifest.save(BUILD_MANIFEST, manifest)
+
+        stage.files = len(manifest)
+        puts("build: %i added, %i changed, %i removed" % (len(added), len(changed), len(removed)))
+
+    return manifest
+
+
+def git_add(paths):
+    """Stages the paths (added, changed, or removed) in the current folder."""
+    batch = []
+    for path in paths + [None]:
+        if batch and ((path is None) or (sum(len(x) + 3 for x in batch + [path]) > GIT_ADD_MAX_CHARS)):
+            local("git add --all -- %s" % " ".join('"%s"' % x for x in batch))
+            batch = []
 
-    return prev & 0xFFFFFFFF
+        if path is not None:
+            batch.append(path)
+
+
+@atexit.register
+def write_report():
+    """Writes the report of whatever tasks were run."""
+    if REPORT.stages:
+        REPORT.write(REPORT_FILE)
 
 
 @task
 def dev():
-    """clean, make, minify w/ no html min"""
-    global HTMLMIN, JSON_PRETTY
+    """make, w/ no html min and fast precompression (when MINIFY/PRECOMPRESS are set)"""
+    global HTMLMIN, JSON_PRETTY, PRECOMPRESS_MODE
     HTMLMIN = False
     JSON_PRETTY = True
-    execute(clean)
+    PRECOMPRESS_MODE = "fast"
     execute(make)
 
 
@@ -67,90 +160,201 @@ def pull():
 @task
 def clean():
     """Removes all generated files in the static folder"""
-    for root, dirs, files in os.walk(STATIC_DIR, topdown=False):
-
-        # Keep the .git folder
-        if re.search("\.git(\\\\|$)", root):
-            continue
+    with REPORT.stage("clean") as stage:
+        for root, dirs, files in os.walk(STATIC_DIR, topdown=False):
 
-        for name in files:
-            os.remove(os.path.join(root, name))
+            # Keep the .git folder
+            if re.search("\.git(\\\\|$)", root):
+                continue
 
-        for name in [x for x in dirs if x != ".git"]:
-            os.rmdir(os.path.join(root, name))
+            for name in files:
+                stage.files += 1
+                stage.bytes_in += os.stat(os.path.join(root, name)).st_size
+                os.remove(os.path.join(root, name))
 
-    time.sleep(1)
+            for name in [x for x in dirs if x != ".git"]:
+                os.rmdir(os.path.join(root, name))
 
 
 @task
 def build():
-    """Builds the static files in mtik00.github.io"""
-    site = os.path.join(MAIN_DIR, "site")
-    with lcd(site):
-        local('..\\bin\\hugo.exe -d="..\\mtik00.github.io"')
-
-    # Hack for cache-busting the JSON index file.  NOTE: We aren't using
-    # the site's ``static_version`` variable since we want to change the JSON
-    # URL when *it* changes, not when we need to change the site.
-    json_file = os.path.join(MAIN_DIR, 'mtik00.github.io', 'js', 'lunr-search.js')
-    json_crc = crc(json_file)
+    """Builds the static files in .staging, then syncs them into mtik00.github.io"""
+    with REPORT.stage("build") as stage:
+        # Start from an empty staging folder, so files that are gone from the
+        # site are gone from the build
+        if os.path.isdir(STAGING_DIR):
+            shutil.rmtree(STAGING_DIR)
+
+        site = os.path.join(MAIN_DIR, "site")
+        with lcd(site):
+            local('..\\bin\\hugo.exe -d="..\\.staging"')
+
+        # Hack for cache-busting the JSON index file.  NOTE: We aren't using
+        # the site's ``static_version`` variable since we want to change the JSON
+        # URL when *it* changes, not when we need to change the site.
+        json_file = os.path.join(STAGING_DIR, 'js', 'lunr-search.js')
+        index_file = os.path.join(STAGING_DIR, 'js', 'lunr-index.json')
+        if os.path.isfile(index_file):
+            index_hash = buildmanifest.hash_file(index_file)[:8]
+
+            text = open(json_file, 'rb').read()
+            text = re.sub('var indexfile = "/js/lunr-index.json"', 'var indexfile = "/js/lunr-index.json?%s"' % index_hash, text)
+            with open(json_file, 'wb') as fh:
+                fh.write(text)
+
+        if MINIFY:
+            with lcd(MAIN_DIR):
+                params = [] if HTMLMIN else ["--no-htmlmin"]
+                run_script(
+                    'python bin\\minify.py --static-dir "%s" --jobs 0 %s' % (STAGING_DIR, ' '.join(params)), "minify"
+                )
+
+        # Write the .gz/.br copies last, once the files won't change again
+        if PRECOMPRESS:
+            with lcd(MAIN_DIR):
+                run_script(
+                    'python bin\\precompress.py --mode %s --static-dir "%s"' % (PRECOMPRESS_MODE, STAGING_DIR),
+                    "precompress"
+                )
+
+        with REPORT.stage("sync") as sync_stage:
+            added, changed, removed = buildmanifest.sync(STAGING_DIR, STATIC_DIR, dest=buildmanifest.load(BUILD_MANIFEST))
+            sync_stage.files = len(added) + len(changed) + len(removed)
+            puts("sync: %i added, %i changed, %i removed" % (len(added), len(changed), len(removed)))
+
+        manifest = update_manifest()
+        stage.files = len(manifest)
+        stage.bytes_out = sum(x["size"] for x in manifest.values())
+
+
+def make_index():
+    """Runs make-search-index.py.  Only the posts that changed since the last
+    run are parsed again (see its --cache).
+    """
+    with lcd(MAIN_DIR):
+        params = ["--format %s" % INDEX_FORMAT]
+        if JSON_PRETTY and (INDEX_FORMAT == "raw"):
+            params.append("--pretty")
 
-    text = open(json_file, 'rb').read()
-    text = re.sub('var indexfile = "/js/lunr-index.json"', 'var indexfile = "/js/lunr-index.json?%x"' % json_crc, text)
-    with open(json_file, 'wb') as fh:
-        fh.write(text)
+        run_script("python bin\\make-search-index.py %s" % ' '.join(params), "make-search-index")
 
 
 @task
 def make():
     """Makes the search index and builds the static files"""
-    with lcd(MAIN_DIR):
-        params = []
-        if JSON_PRETTY:
-            params.append("--pretty")
+    with REPORT.stage("make"):
+        make_index()
 
-        if params:
-            local("python bin\\make-search-index.py %s" % ' '.join(params))
-        else:
-            local("python bin\\make-search-index.py")
+        with lcd(MAIN_DIR):
+            # The shard folder only exists when using `--format sharded`
+            index_paths = ' '.join(
+                "site\\static\\js\\%s" % x for x in ["lunr-index.json", "lunr-index"]
+                if os.path.exists(os.path.join(MAIN_DIR, "site", "static", "js", x)))
 
-        if local("git status site\static\js\lunr-index.json --porcelain", capture=True):
-            local("git add site\static\js\lunr-index.json")
-            local('git commit -m"change in index.json"')
-            local('git push')
-        else:
-            puts(red("no changes in index.json detected"))
+            if local("git status %s --porcelain" % index_paths, capture=True):
+                local("git add --all %s" % index_paths)
+                local('git commit -m"change in index.json"')
+                local('git push')
+            else:
+                puts(red("no changes in index.json detected"))
 
-    execute(build)
+        execute(build)
 
 
 @task
 def makeall():
-    """clean, make, and minify"""
-    execute(clean)
+    """Same as make; every build starts from a clean staging folder"""
     execute(make)
 
 
 @task
 def release():
     """Commits and pushes static files, if needed"""
+    with REPORT.stage("release"):
+        # Check for local changes that need to be pushed
+        if re.search("ahead of .* by \d+ commit", local('git status', capture=True)):
+            local("git push")
 
-    # Check for local changes that need to be pushed
-    if re.search("ahead of .* by \d+ commit", local('git status', capture=True)):
-        local("git push")
+        manifest = buildmanifest.load(BUILD_MANIFEST) or buildmanifest.build(STATIC_DIR)
+        previous = buildmanifest.load(RELEASE_MANIFEST)
+        added, changed, removed = buildmanifest.diff(previous, manifest)
 
-    with lcd(STATIC_DIR):
-        if local('git status --porcelain', capture=True):
-            local("git add --all .")
-            local("git clean -df")
-            local('git commit -am"new content"')
-            local('git push')
-        else:
-            puts(red("No changes found in static files"))
+        with lcd(STATIC_DIR):
+            if previous is None:
+                # Nothing to compare with (e.g. the first release), so let git
+                # find the changes
+                puts("No release manifest found; staging every file")
+                local("git add --all .")
+            else:
+                puts("%i added, %i changed, %i removed" % (len(added), len(changed), len(removed)))
+                git_add(added + changed + removed)
+
+            with quiet():
+                staged = local("git diff --cached --quiet").failed
+
+            if staged:
+                local('git commit -m"new content"')
+                local('git push')
+            else:
+                puts(red("No changes found in static files"))
+
+        buildmanifest.save(RELEASE_MANIFEST, manifest)
 
 
 @task
-def deploy():
-    """make and release"""
+def deploy(threshold=buildstats.REGRESSION_THRESHOLD):
+    """make and release; warns about stages more than `threshold`% slower than recent deploys"""
     execute(makeall)
     execute(release)
+
+    history = buildstats.load_history(HISTORY_FILE)
+    for name, wall, baseline, percent in buildstats.find_regressions(REPORT, history, float(threshold)):
+        puts(red("%s took %.02fs; %.0f%% slower than the last %i deploys (%.02fs)" % (name, wall, percent, len(history), baseline)))
+
+    buildstats.append_history(HISTORY_FILE, REPORT)
+    REPORT.print_summary()
+
+
+@task
+def watch(minify="no", poll="no"):
+    """Rebuilds when the site changes, until Ctrl-C; use minify=yes to minify too, poll=yes to poll for changes"""
+    global MINIFY, JSON_PRETTY, PRECOMPRESS_MODE
+    MINIFY = minify.lower() in ["yes", "true", "1"]
+    JSON_PRETTY = True
+    PRECOMPRESS_MODE = "fast"
+
+    watcher = sitewatch.Watcher(WATCH_DIRS, polling=poll.lower() in ["yes", "true", "1"], ignore=WATCH_IGNORE)
+    # Start with a full build
+    changes = first_change = None
+    puts("Watching for changes (%s); press Ctrl-C to stop" % watcher.mode)
+
+    try:
+        while True:
+            # Only changes to the posts need the search index made again
+            stages = ["build"]
+            if (changes is None) or any(x.startswith(CONTENT_DIR) for x in changes):
+                stages.insert(0, "index")
+
+            start = time.time()
+            try:
+                with REPORT.stage("watch"):
+                    if "index" in stages:
+                        make_index()
+                    execute(build)
+            except SystemExit:
+                # `local()` aborts when a command fails; keep watching
+                puts(red("The rebuild failed; waiting for the next change"))
+            else:
+                if changes is None:
+                    puts("Built (%s) in %.02fs" % (", ".join(stages), time.time() - start))
+                else:
+                    puts("%i change(s) rebuilt (%s) in %.02fs; %.02fs after the first change" % (
+                        len(changes), ", ".join(stages), time.time() - start, time.time() - first_change))
+
+            changes, first_change = watcher.wait()
+            for path in sorted(changes)[:5]:
+                puts("changed: %s" % os.path.relpath(path, MAIN_DIR))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.stop()
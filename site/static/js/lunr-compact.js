@@ -0,0 +1,50 @@
+/**
+ * Loads an index written by `make-search-index.py --format compact` into a
+ * lunr.Index.
+ *
+ * The postings of each term are a flat list of (document ID delta, count in
+ * each field).  The term frequencies are calculated from the counts and field
+ * lengths exactly as lunr.Index.prototype.add() does it, so the result is the
+ * same as indexing the documents here, without running the pipeline.
+ *
+ * @param  {Object}     data The compact index
+ * @return {lunr.Index}
+ */
+function loadCompactIndex(data) {
+    var index = new lunr.Index();
+    var width = data.fields.length + 1;
+    var docTokens = data.docs.map(function() { return []; });
+
+    index._fields = data.fields;
+    index._ref = data.ref;
+    index.pipeline = lunr.Pipeline.load(data.pipeline);
+
+    data.terms.forEach(function(term, i) {
+        var postings = data.postings[i], id = 0;
+
+        for (var j = 0; j < postings.length; j += width) {
+            var lengths, tf = 0;
+
+            id += postings[j];
+            lengths = data.lengths[id];
+
+            for (var k = 0; k < data.fields.length; k++) {
+                if (lengths[k]) {
+                    tf = tf + postings[j + 1 + k] / lengths[k] * data.fields[k].boost;
+                }
+            }
+
+            index.tokenStore.add(term, {ref: data.docs[id][0], tf: tf});
+
+            // The terms are sorted, so each document's tokens will be too
+            docTokens[id].push(term);
+        }
+    });
+
+    data.docs.forEach(function(doc, id) {
+        index.documentStore.set(doc[0], lunr.SortedSet.load(docTokens[id]));
+    });
+    index.corpusTokens = lunr.SortedSet.load(data.terms.slice());
+
+    return index;
+}
@@ -7,23 +7,59 @@ function initLunr() {
     // First retrieve the index file
     $.getJSON(indexfile)
         .done(function(index) {
-            pagesIndex = index;
-            console.log("index:", pagesIndex);
+            pagesIndex = {};
+
+            if (index.format === "sharded") {
+                // Only the manifest has been loaded; the shards are loaded
+                // as they're needed by a search.
+                var baseurl = indexfile.split("?")[0];
+                baseurl = baseurl.substr(0, baseurl.lastIndexOf("/") + 1);
+
+                lunrIndex = new ShardedIndex(index, baseurl, function(url, callback) {
+                    $.getJSON(url).done(callback);
+                });
+
+                index.docs.forEach(function(doc) {
+                    pagesIndex[doc.href] = doc;
+                });
+                return;
+            }
+
+            if (index.format === "compact") {
+                lunrIndex = loadCompactIndex(index);
+
+                index.docs.forEach(function(doc) {
+                    pagesIndex[doc[0]] = {href: doc[0], title: doc[1]};
+                });
+                return;
+            }
+
+            if (!Array.isArray(index)) {
+                // make-search-index.py has already built the index for us
+                lunrIndex = lunr.Index.load(index.index);
+
+                Object.keys(index.titles).forEach(function(href) {
+                    pagesIndex[href] = {href: href, title: index.titles[href]};
+                });
+                return;
+            }
 
             // Set up lunrjs by declaring the fields we use
             // Also provide their boost level for the ranking
+            // NOTE: These must match FIELDS in bin/lunrindex.py
             lunrIndex = lunr(function() {
-                this.field("title", 10);
-                this.field("tags", 5);
-                this.field("content", 1);
+                this.field("title", {boost: 10});
+                this.field("tags", {boost: 5});
+                this.field("content", {boost: 1});
 
                 // ref is the result item identifier (I chose the page URL)
                 this.ref("href");
             });
 
             // Feed lunr with each file and let lunr actually index them
-            pagesIndex.forEach(function(page) {
+            index.forEach(function(page) {
                 lunrIndex.add(page);
+                pagesIndex[page.href] = page;
             });
         })
         .fail(function(jqxhr, textStatus, error) {
@@ -44,29 +80,43 @@ function initUI() {
             return;
         }
 
-        var results = search(query);
-
-        renderResults(results);
+        search(query, function(results) {
+            // Ignore the results if the query has changed while we were
+            // waiting for the index.
+            if ($("#search").val() === query) {
+                $results.empty();
+                renderResults(results);
+            }
+        });
     });
 }
 
 /**
  * Trigger a search in lunr and transform the result
  *
- * @param  {String} query
- * @return {Array}  results
+ * @param  {String}   query
+ * @param  {Function} callback called with the array of results
  */
-function search(query) {
+function search(query, callback) {
     // Find the item in our index corresponding to the lunr one to have more info
     // Lunr result:
     //  {ref: "/section/page1", score: 0.2725657778206127}
     // Our result:
     //  {title:"Page1", href:"/section/page1", ...}
-    return lunrIndex.search(query).map(function(result) {
-            return pagesIndex.filter(function(page) {
-                return page.href === result.ref;
-            })[0];
+    var toPages = function(results) {
+        return results.map(function(result) {
+            return pagesIndex[result.ref];
         });
+    };
+
+    // lunr-sharded.js is only loaded when the index is sharded
+    if ((typeof ShardedIndex !== "undefined") && (lunrIndex instanceof ShardedIndex)) {
+        lunrIndex.search(query, function(results) {
+            callback(toPages(results));
+        });
+    } else {
+        callback(toPages(lunrIndex.search(query)));
+    }
 }
 
 /**
@@ -0,0 +1,184 @@
+/**
+ * A search index that has been split into shards by token prefix (see
+ * `make-search-index.py --format sharded`).  Shards are only downloaded when a
+ * query needs them.
+ *
+ * Documents are scored exactly as lunr.Index.prototype.search() does it.  The
+ * magnitude of each document's vector comes from the manifest, since we'll
+ * rarely have every shard holding a document's tokens.
+ *
+ * @param {Object}   manifest  The manifest written by make-search-index.py
+ * @param {String}   baseurl   The URL the shard URLs are relative to
+ * @param {Function} getJSON   Called as getJSON(url, callback(data))
+ */
+function ShardedIndex(manifest, baseurl, getJSON) {
+    this.manifest = manifest;
+    this.baseurl = baseurl;
+    this.getJSON = getJSON;
+    this.pipeline = lunr.Pipeline.load(manifest.pipeline);
+    this.pending = {};   // shard prefix -> list of callbacks waiting for it
+    this.loaded = {};    // shard prefix -> true
+    this.tokens = {};    // token -> {ref: tf}
+    this.magnitudes = {};
+
+    manifest.docs.forEach(function(doc) {
+        this.magnitudes[doc.href] = doc.magnitude;
+    }, this);
+
+    this.fieldBoosts = manifest.fields.reduce(function(memo, field) {
+        return memo + field.boost;
+    }, 0);
+}
+
+/**
+ * Returns the prefixes of the shards that could hold tokens starting with
+ * `token`.
+ */
+ShardedIndex.prototype.shardsFor = function(token) {
+    var length = this.manifest.prefixLength;
+
+    return Object.keys(this.manifest.shards).filter(function(prefix) {
+        if (token.length >= length) {
+            return prefix === token.substr(0, length);
+        }
+        return prefix.substr(0, token.length) === token;
+    });
+};
+
+/**
+ * Downloads any of the shards that haven't been loaded yet, then calls
+ * `callback`.
+ */
+ShardedIndex.prototype.load = function(prefixes, callback) {
+    var self = this;
+    var remaining = prefixes.filter(function(prefix) {
+        return !self.loaded[prefix];
+    });
+    var count = remaining.length;
+
+    if (!count) {
+        return callback();
+    }
+
+    remaining.forEach(function(prefix) {
+        var done = function() {
+            if (--count === 0) {
+                callback();
+            }
+        };
+
+        if (self.pending[prefix]) {
+            self.pending[prefix].push(done);
+            return;
+        }
+
+        self.pending[prefix] = [done];
+        self.getJSON(self.baseurl + self.manifest.shards[prefix], function(shard) {
+            Object.keys(shard).forEach(function(token) {
+                self.tokens[token] = shard[token];
+            });
+
+            self.loaded[prefix] = true;
+            self.pending[prefix].forEach(function(fn) { fn(); });
+            delete self.pending[prefix];
+        });
+    });
+};
+
+ShardedIndex.prototype.idf = function(token) {
+    var count = Object.keys(this.tokens[token] || {}).length;
+    return count ? 1 + Math.log(this.manifest.docs.length / count) : 1;
+};
+
+/**
+ * Returns the loaded tokens that start with `token`.
+ */
+ShardedIndex.prototype.expand = function(token) {
+    return Object.keys(this.tokens).filter(function(key) {
+        return key.substr(0, token.length) === token;
+    });
+};
+
+/**
+ * Searches the index.  `callback` is given the results in the same form as
+ * lunr.Index.prototype.search(): [{ref: ..., score: ...}, ...]
+ */
+ShardedIndex.prototype.search = function(query, callback) {
+    var self = this;
+    var tokens = this.pipeline.run(lunr.tokenizer(query));
+    var prefixes = [];
+
+    tokens.forEach(function(token) {
+        prefixes = prefixes.concat(self.shardsFor(token));
+    });
+
+    this.load(prefixes, function() {
+        callback(self.score(tokens));
+    });
+};
+
+/**
+ * Scores the documents matching every token.  All of the shards holding the
+ * tokens must already be loaded.
+ */
+ShardedIndex.prototype.score = function(tokens) {
+    var self = this;
+    var tf = 1 / tokens.length * this.manifest.fields.length * this.fieldBoosts;
+    var queryVector = [];
+    var documentSets = [];
+
+    tokens.forEach(function(token) {
+        var set = {};
+
+        this.expand(token).forEach(function(key) {
+            var similarityBoost = 1;
+
+            // Expanded keys score lower than exact matches
+            if (key !== token) {
+                similarityBoost = 1 / Math.log(Math.max(3, key.length - token.length));
+            }
+
+            queryVector.push({key: key, value: tf * self.idf(key) * similarityBoost});
+            Object.keys(self.tokens[key]).forEach(function(ref) {
+                set[ref] = true;
+            });
+        });
+
+        documentSets.push(set);
+    }, this);
+
+    if (!documentSets.length) {
+        return [];
+    }
+
+    // Keep the vector in corpus-token order, like lunr.Vector (the sort is
+    // stable, so repeated keys stay in the order they were added).
+    queryVector.sort(function(a, b) {
+        return (a.key < b.key) ? -1 : (a.key > b.key) ? 1 : 0;
+    });
+
+    var queryMagnitude = Math.sqrt(queryVector.reduce(function(memo, node) {
+        return memo + node.value * node.value;
+    }, 0));
+
+    var refs = Object.keys(documentSets[0]).filter(function(ref) {
+        return documentSets.every(function(set) { return set[ref]; });
+    }).sort();
+
+    return refs.map(function(ref) {
+        var dot = 0, previous;
+
+        queryVector.forEach(function(node) {
+            // Like lunr.Vector.prototype.dot(), each document token only
+            // matches the first of any repeated query keys.
+            if ((node.key !== previous) && (ref in self.tokens[node.key])) {
+                dot += node.value * (self.tokens[node.key][ref] * self.idf(node.key));
+            }
+            previous = node.key;
+        });
+
+        return {ref: ref, score: dot / (queryMagnitude * self.magnitudes[ref])};
+    }).sort(function(a, b) {
+        return b.score - a.score;
+    });
+};
@@ -0,0 +1,54 @@
+#!/usr/bin/env python2.7
+"""
+Tests for bin/buildutils.py.
+
+Usage:
+    python -m unittest discover -s tests
+"""
+
+# Imports ######################################################################
+import os
+import sys
+import unittest
+
+
+# Metadata #####################################################################
+__author__ = "Timothy McFadden"
+__creationDate__ = "10/18/2026"
+__license__ = "MIT"
+
+
+# Globals ######################################################################
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "bin")))
+import buildutils
+
+
+def square(x):
+    """Run by the worker processes."""
+    return x * x
+
+
+class TestImapJobs(unittest.TestCase):
+    """`imap_jobs()` keeps the order of the items, and only takes a window of
+    them from the iterator at a time.
+    """
+    def test_order(self):
+        for jobs in [1, 3]:
+            self.assertEqual(list(buildutils.imap_jobs(square, xrange(50), jobs)), [x * x for x in range(50)])
+
+    def test_window(self):
+        taken = []
+
+        def items():
+            for x in xrange(100):
+                taken.append(x)
+                yield x
+
+        results = buildutils.imap_jobs(square, items(), 2)
+        self.assertEqual(next(results), 0)
+        self.assertEqual(len(taken), 2 * buildutils.JOB_WINDOW + 1)
+        self.assertEqual(list(results), [x * x for x in range(1, 100)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,95 @@
+#!/usr/bin/env python2.7
+"""
+Tests for bin/minify.py.
+
+Usage:
+    python -m unittest discover -s tests
+"""
+
+# Imports ######################################################################
+import os
+import imp
+import sys
+import zlib
+import struct
+import shutil
+import tempfile
+import unittest
+
+
+# Metadata #####################################################################
+__author__ = "Timothy McFadden"
+__creationDate__ = "10/18/2026"
+__license__ = "MIT"
+
+
+# Globals ######################################################################
+BIN_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "bin"))
+sys.path.insert(0, BIN_DIR)
+minify = imp.load_source("minify", os.path.join(BIN_DIR, "minify.py"))
+
+
+def png_chunk(kind, body):
+    """Returns a PNG chunk."""
+    return struct.pack(">I4s", len(body), kind) + body + struct.pack(">I", zlib.crc32(kind + body) & 0xFFFFFFFF)
+
+
+def tiny_png():
+    """Returns a 1x1 grey PNG that's already as small as the optimizer can
+    make it.
+    """
+    return "".join([
+        "\x89PNG\r\n\x1a\n",
+        png_chunk("IHDR", struct.pack(">IIBBBBB", 1, 1, 8, 0, 0, 0, 0)),
+        png_chunk("IDAT", zlib.compress("\x00\x80", 9)),
+        png_chunk("IEND", "")
+    ])
+
+
+class TestCachedImages(unittest.TestCase):
+    """`process_other_asset()` with the image cache, for images the optimizer
+    can't make smaller.
+    """
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.cache_dir = os.path.join(self.temp_dir, "cache")
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def process_twice(self, fname, data, widths):
+        """Runs `process_other_asset()` on a fresh copy of the image twice,
+        sharing the cache.  Returns both results.
+        """
+        results = []
+        for _ in range(2):
+            path = os.path.join(self.temp_dir, fname)
+            with open(path, "wb") as fh:
+                fh.write(data)
+
+            results.append(minify.process_other_asset((path, True, widths, self.cache_dir)))
+            os.remove(results[-1][0])
+
+        return results
+
+    def test_empty_image(self):
+        first, second = self.process_twice("empty.png", "", [])
+        self.assertEqual(first[4], [False])
+        self.assertEqual(second[4], [True])
+        self.assertEqual(first[0], second[0])
+
+    def test_unshrinkable_image(self):
+        data = tiny_png()
+        self.assertEqual(minify.imageopt.optimize_image(data, ".png"), data)
+
+        # The image is narrower than the width, so it can't be scaled either
+        first, second = self.process_twice("tiny.png", data, [480])
+        self.assertEqual(first[4], [False, False])
+        self.assertEqual(second[4], [True, True])
+        self.assertEqual(first[0], second[0])
+        self.assertEqual(second[3], [])
+        self.assertEqual(second[1], len(data))
+
+
+if __name__ == '__main__':
+    unittest.main()